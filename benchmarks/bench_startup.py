@@ -0,0 +1,115 @@
+"""
+Startup time of the modules of the application, each imported in a fresh interpreter.
+
+Usage:
+    python benchmarks/bench_startup.py [--repeat 10] [--output startup.json]
+                                       [--baseline startup.json] [--threshold 1.3]
+
+Every case is the median wall time of repeat `python -c "import <module>"` runs (the
+interpreter startup itself is measured too and reported as "python"). A case fails when
+it imports one of the modules that are only meant to be loaded once a run begins
+(openpyxl, rich, numpy, xlrd), or, with --baseline, when it is slower than threshold x
+its baseline. The exit status is 1 if any case failed.
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# (label, statement run by the fresh interpreter)
+CASES = [
+    ("python", "pass"),
+    ("xl", "import xl"),
+    ("cli", "import cli"),
+    ("gui", "import gui"),
+]
+
+# loaded by xl on first use, never at import time
+LAZY_MODULES = ("openpyxl", "rich", "numpy", "xlrd")
+
+
+def run_once(statement: str) -> tuple[float, list[str]]:
+    """
+    Wall time of a fresh interpreter running statement, and the lazy modules it imported
+    """
+    probe = (
+        f"{statement}\nimport sys\n"
+        f"print(','.join(m for m in {LAZY_MODULES!r} if m in sys.modules))"
+    )
+    start = time.perf_counter()
+    out = subprocess.run(
+        [sys.executable, "-c", probe],
+        cwd=ROOT,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    seconds = time.perf_counter() - start
+    loaded = out.strip().splitlines()[-1] if out.strip() else ""
+    return seconds, [m for m in loaded.split(",") if m]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--output", default="startup-results.json")
+    parser.add_argument("--baseline")
+    parser.add_argument("--threshold", type=float, default=1.3)
+    args = parser.parse_args()
+
+    results = []
+    failed = False
+    for label, statement in CASES:
+        runs = [run_once(statement) for _ in range(args.repeat)]
+        seconds = statistics.median(run[0] for run in runs)
+        loaded = runs[-1][1]
+        failed |= bool(loaded)
+        results.append({"id": label, "seconds": seconds, "lazy_loaded": loaded})
+        flag = f" LOADS {', '.join(loaded)}" if loaded else ""
+        print(f"{label:<8} {seconds * 1000:8.1f} ms{flag}")
+
+    report = {
+        "meta": {
+            "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nresults written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        previous = {result["id"]: result for result in baseline["results"]}
+        print(f"\ncompared to the baseline of {baseline['meta']['date']}")
+        for result in results:
+            base = previous.get(result["id"])
+            if base is None:
+                continue
+            ratio = result["seconds"] / base["seconds"]
+            flag = "REGRESSION" if ratio > args.threshold else ""
+            failed |= ratio > args.threshold
+            print(f"{result['id']:<8} {ratio:6.2f}x {flag}")
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
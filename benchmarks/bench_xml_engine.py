@@ -0,0 +1,78 @@
+"""
+Compare the scan time of the xml engine of xl.get_files_values with the openpyxl loaders.
+
+Usage:
+    python benchmarks/bench_xml_engine.py --files 20 --rows 20000 [--repeat 3] [--jobs 1]
+
+The test files are generated with xl.generate_dataset in a temporary folder.
+"""
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import xl  # noqa: E402
+
+# (label, get_files_values keyword arguments)
+CASES = [
+    ("openpyxl full load", {"read_only": False}),
+    ("openpyxl read-only", {"read_only": True}),
+    ("xml engine", {"engine": "xml"}),
+]
+if xl.np is not None:
+    CASES.append(("xml engine + numpy", {"engine": "xml", "backend": "numpy"}))
+
+
+def best_of(repeat: int, func, *args, **kwargs) -> tuple[float, object]:
+    """
+    Return the best wall time of repeat calls to func and the result of the last one
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--files", type=int, default=20)
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--jobs", type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        files = set(
+            xl.generate_dataset(tmp, args.files, args.rows, dup_ratio=0.05, seed=0)
+        )
+
+        timings = []
+        reference = None
+        for label, kwargs in CASES:
+            seconds, index = best_of(
+                args.repeat, xl.get_files_values, files, jobs=args.jobs, **kwargs
+            )
+            if reference is None:
+                reference = index
+            elif index != reference:
+                raise SystemExit(f"{label} does not find the same duplicates")
+            timings.append((label, seconds))
+
+    rows = args.files * args.rows
+    baseline = timings[0][1]
+    print(f"\n{args.files} files x {args.rows} rows, jobs={args.jobs}")
+    for label, seconds in timings:
+        print(
+            f"{label:<22} {seconds:8.3f} s {rows / seconds:12,.0f} rows/s"
+            f" {baseline / seconds:6.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
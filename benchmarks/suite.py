@@ -0,0 +1,232 @@
+"""
+Benchmark suite of the scan (xl.get_files_values) and write (xl.edit_files_values) phases
+over a grid of data shapes.
+
+Usage:
+    python benchmarks/suite.py [--files 5 20] [--rows 2000 20000] [--dup-ratio 0.01 0.3]
+                               [--jobs 1] [--repeat 3] [--compresslevel 1]
+                               [--output results.json] [--baseline baseline.json]
+                               [--threshold 1.2]
+
+Every dataset (files x rows x duplicate ratio) is generated once in a temporary folder, then
+each case runs in a fresh interpreter so that its peak memory is its own:
+
+    - scan: get_files_values with every engine (openpyxl, xml, xml + numpy backend)
+    - write: edit_files_values with every writer (openpyxl, xml patching, streaming for
+    the copies) for every show_dup_origin x make_copy combination, and with every
+    --compresslevel for the copies, on a copy of the dataset (the in-place rewrites
+    would change it)
+
+The results (wall time, rows/s and peak resident memory of the best run) are written as
+JSON. Passing a previous output as --baseline prints the ratio of every case to it and
+exits with status 1 when a case is slower than threshold x its baseline.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import xl  # noqa: E402
+
+# (label, get_files_values keyword arguments)
+ENGINES = [
+    ("openpyxl", {"read_only": True}),
+    ("xml", {"engine": "xml"}),
+]
+if xl.np is not None:
+    ENGINES.append(("xml+numpy", {"engine": "xml", "backend": "numpy"}))
+
+# (label, edit_files_values keyword arguments), streaming only writes the copies
+WRITERS = [
+    ("openpyxl", {}),
+    ("xml", {"engine": "xml"}),
+    ("streaming", {"streaming": True}),
+]
+
+
+def run_case(case: dict) -> dict:
+    """
+    Run a single case in this process and return its measures
+    """
+    files = case["paths"]
+    if case["phase"] == "scan":
+        start = time.perf_counter()
+        xl.get_files_values(files, jobs=case["jobs"], **dict(ENGINES)[case["engine"]])
+        seconds = time.perf_counter() - start
+    else:
+        # the copies (and make_copy's ./data) go in a scratch folder
+        work = Path(tempfile.mkdtemp(prefix="xl-bench-"))
+        cwd = os.getcwd()
+        try:
+            files = [shutil.copy(xp, work) for xp in files]
+            os.chdir(work)
+            index = xl.get_files_values(files, jobs=case["jobs"], engine="xml")
+            start = time.perf_counter()
+            asyncio.run(
+                xl.edit_files_values(
+                    index,
+                    files,
+                    make_copy=case["make_copy"],
+                    show_dup_origin=case["show_dup_origin"],
+                    jobs=case["jobs"],
+                    compresslevel=case.get("compresslevel"),
+                    **dict(WRITERS)[case["writer"]],
+                )
+            )
+            seconds = time.perf_counter() - start
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(work, ignore_errors=True)
+
+    rows = case["files"] * case["rows"]
+    return {
+        "seconds": seconds,
+        "rows_per_s": rows / seconds,
+        "peak_mb": xl._peak_rss_mb(),
+    }
+
+
+def case_id(case: dict) -> str:
+    keys = ["phase", "engine", "writer", "files", "rows", "dup_ratio"]
+    keys += ["show_dup_origin", "make_copy", "compresslevel", "jobs"]
+    return " ".join(f"{key}={case[key]}" for key in keys if case.get(key) is not None)
+
+
+def best_of(repeat: int, case: dict) -> dict:
+    """
+    Run case repeat times, each in a new interpreter, and keep the fastest run
+    """
+    best = None
+    for _ in range(repeat):
+        out = subprocess.run(
+            [sys.executable, __file__, "--case", json.dumps(case)],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        # the progress bars of xl are printed before the measures
+        measures = json.loads(out.splitlines()[-1])
+        if best is None or measures["seconds"] < best["seconds"]:
+            best = measures
+    return best
+
+
+def compare(results: list[dict], baseline: dict, threshold: float) -> bool:
+    """
+    Print the time ratio of every case to the baseline, return whether one regressed
+    """
+    previous = {result["id"]: result for result in baseline["results"]}
+    regressed = False
+    print(f"\ncompared to the baseline of {baseline['meta']['date']}")
+    for result in results:
+        base = previous.get(result["id"])
+        if base is None:
+            continue
+        ratio = result["seconds"] / base["seconds"]
+        flag = "REGRESSION" if ratio > threshold else ""
+        regressed |= ratio > threshold
+        print(f"{result['id']:<120} {ratio:6.2f}x {flag}")
+    return regressed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--files", type=int, nargs="+", default=[5, 20])
+    parser.add_argument("--rows", type=int, nargs="+", default=[2000, 20000])
+    parser.add_argument("--dup-ratio", type=float, nargs="+", default=[0.01, 0.3])
+    parser.add_argument("--jobs", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--compresslevel", type=int, nargs="*", default=[1])
+    parser.add_argument("--output", default="bench-results.json")
+    parser.add_argument("--baseline")
+    parser.add_argument("--threshold", type=float, default=1.2)
+    parser.add_argument("--case", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        # child process of best_of
+        print(json.dumps(run_case(json.loads(args.case))))
+        return
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for files in args.files:
+            for rows in args.rows:
+                for dup_ratio in args.dup_ratio:
+                    folder = Path(tmp) / f"{files}x{rows}x{dup_ratio}"
+                    dataset = {"files": files, "rows": rows, "dup_ratio": dup_ratio}
+                    paths = xl.generate_dataset(
+                        folder, files, rows, dup_ratio=dup_ratio, seed=0
+                    )
+                    cases = [
+                        {"phase": "scan", "engine": engine, **dataset}
+                        for engine, _ in ENGINES
+                    ]
+                    cases += [
+                        {"phase": "write", "writer": writer}
+                        | dataset
+                        | {"show_dup_origin": o, "make_copy": c}
+                        for writer, _ in WRITERS
+                        for o in (False, True)
+                        for c in (False, True)
+                        if c or writer != "streaming"
+                    ]
+                    cases += [
+                        {"phase": "write", "writer": writer}
+                        | dataset
+                        | {
+                            "show_dup_origin": False,
+                            "make_copy": True,
+                            "compresslevel": level,
+                        }
+                        for writer, _ in WRITERS
+                        for level in args.compresslevel
+                    ]
+                    for case in cases:
+                        case |= {"jobs": args.jobs, "paths": paths}
+                        measures = best_of(args.repeat, case)
+                        del case["paths"]
+                        results.append({"id": case_id(case), **case, **measures})
+                        peak = measures["peak_mb"]
+                        print(
+                            f"{results[-1]['id']:<120} {measures['seconds']:8.3f} s"
+                            f" {measures['rows_per_s']:12,.0f} rows/s"
+                            + (f" {peak:8.1f} MB" if peak is not None else "")
+                        )
+
+    report = {
+        "meta": {
+            "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nresults written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
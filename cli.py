@@ -0,0 +1,330 @@
+"""
+Find and mark the duplicated numbers of a set of files without the gui.
+
+Usage:
+    python cli.py months/ "exports/**/*.csv" [--mode report|in-place|copy]
+                  [--output-dir data] [--jobs 4] [--summary summary.json]
+    python cli.py months/ --report duplicates.xlsx
+    python cli.py months/ --watch [--interval 2] [--output-dir data]
+    python cli.py march/ --registry numbers.db [--forget-before 2025-03-01]
+
+--report writes every duplicate (value, count, file, sheet and rows) to one table sorted by
+count, the files are left untouched with the default --mode report.
+
+--registry also reports (and marks) the numbers already found in the files of the earlier
+runs recorded in it, then records the numbers of this run.
+
+--watch keeps running and updates the annotated copies in --output-dir as files are added
+to, modified in or removed from the folder (see xl.FolderWatcher), until SIGINT / SIGTERM.
+
+Exit status:
+    0 -> no duplicates (or --exit-zero)
+    1 -> duplicates found (or numbers of earlier runs, with --registry)
+    2 -> invalid arguments or failure
+    130 -> cancelled (SIGINT / SIGTERM), the files being written are completed
+"""
+
+import argparse
+import asyncio
+import contextlib
+import glob
+import json
+import os
+import signal
+import sys
+import threading
+import time
+from pathlib import Path
+
+import xl
+
+EXIT_CLEAN = 0
+EXIT_DUPLICATES = 1
+EXIT_ERROR = 2
+EXIT_CANCELLED = 130
+
+
+def collect_files(patterns: list[str], recursive: bool = False) -> list[str]:
+    """
+    Expand the directories and glob patterns of the command line into the supported files
+    they contain (in a stable order, without duplicates)
+
+    Input:
+        - patterns: list[str] -> files, directories or glob patterns (** is recursive)
+        - recursive: bool -> also look into the subdirectories of the directories
+
+    Returns:
+        - list[str] -> absolute paths of the files with a registered reader
+    """
+
+    found = {}
+    for pattern in patterns:
+        paths = (
+            glob.glob(pattern, recursive=True) if glob.has_magic(pattern) else [pattern]
+        )
+        for path in map(Path, paths):
+            if path.is_dir():
+                candidates = path.rglob("*") if recursive else path.iterdir()
+            else:
+                candidates = [path]
+            for candidate in sorted(candidates):
+                # excel lock files and the temporary files of interrupted writes
+                if candidate.name.startswith(("~$", ".~")) or not candidate.is_file():
+                    continue
+                if candidate.suffix.lower() in xl.READERS:
+                    found.setdefault(str(candidate.resolve()), None)
+    return list(found)
+
+
+def summarize(
+    index,
+    files: list[str],
+    rows: int,
+    timings: dict,
+    mode: str,
+    history: dict | None = None,
+) -> dict:
+    """
+    Counts and timings of a run, as written by --summary
+    """
+    per_file = dict.fromkeys(files, 0)
+    duplicate_values = duplicate_cells = 0
+    for _, count, locations in index.duplicates():
+        duplicate_values += 1
+        duplicate_cells += count
+        for source_id, marked in locations:
+            per_file[index.paths[index.sources[source_id][0]]] += len(marked)
+    return {
+        "mode": mode,
+        "files": len(files),
+        "rows": rows,
+        "duplicate_values": duplicate_values,
+        "duplicate_cells": duplicate_cells,
+        "files_with_duplicates": sum(1 for n in per_file.values() if n),
+        "duplicates_per_file": per_file,
+        "seen_before": len(history or ()),
+        "timings": {name: round(seconds, 3) for name, seconds in timings.items()},
+    }
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("paths", nargs="+", help="files, directories or glob patterns")
+    parser.add_argument("-r", "--recursive", action="store_true")
+    parser.add_argument(
+        "--mode",
+        choices=("report", "in-place", "copy"),
+        default="report",
+        help="report only (default), mark the files in place or mark copies of them",
+    )
+    parser.add_argument("--output-dir", default="data", help="folder of --mode copy")
+    parser.add_argument(
+        "--report",
+        help="write the duplicates to a single .xlsx, .csv or .tsv table",
+    )
+    parser.add_argument("--show-origin", action="store_true")
+    parser.add_argument(
+        "--streaming",
+        action="store_true",
+        help="--mode copy: write the .xlsx copies row by row (values only)",
+    )
+    parser.add_argument(
+        "--compresslevel",
+        type=int,
+        choices=range(10),
+        metavar="0-9",
+        help="deflate level of the written .xlsx files (0 fastest, 9 smallest)",
+    )
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=None, help="worker processes (default: cores)"
+    )
+    parser.add_argument("--engine", choices=("openpyxl", "xml"), default="xml")
+    parser.add_argument("--backend", choices=("dict", "numpy"), default="dict")
+    parser.add_argument("--cache", help="SQLite scan cache file, see xl.ScanCache")
+    parser.add_argument(
+        "--registry",
+        help="SQLite registry of the numbers of the earlier runs, see xl.NumberRegistry",
+    )
+    parser.add_argument(
+        "--forget-before",
+        help="drop the files registered before this ISO date (YYYY-MM-DD)",
+    )
+    parser.add_argument(
+        "--memory-budget",
+        type=int,
+        help="bytes of values kept in memory while scanning",
+    )
+    parser.add_argument("--sheets", help='sheet names separated by "," or "*" for all')
+    parser.add_argument("--columns", default="A", help='letters or headers, by ","')
+    parser.add_argument("--composite", action="store_true")
+    parser.add_argument("--summary", help='JSON summary file ("-" for stdout)')
+    parser.add_argument(
+        "--trace-memory", action="store_true", help="peak python allocations (slower)"
+    )
+    parser.add_argument(
+        "--profile", help="save the cProfile stats of the run to a file"
+    )
+    parser.add_argument("--watch", action="store_true", help="watch a single folder")
+    parser.add_argument(
+        "--interval", type=float, default=2.0, help="seconds between polls"
+    )
+    parser.add_argument(
+        "--exit-zero",
+        action="store_true",
+        help="exit with 0 even if duplicates are found",
+    )
+    args = parser.parse_args(argv)
+    # the index of a memory budget scan only keeps the duplicates
+    if args.registry and args.memory_budget is not None:
+        parser.error("--registry cannot be combined with --memory-budget")
+    return args
+
+
+def scan_target(args: argparse.Namespace) -> xl.ScanTarget:
+    sheets = [s.strip() for s in (args.sheets or "").split(",") if s.strip()]
+    columns = [c.strip() for c in args.columns.split(",") if c.strip()]
+    return xl.ScanTarget(
+        sheets="*" if sheets == ["*"] else tuple(sheets) or None,
+        columns=tuple(columns) or ("A",),
+        composite=args.composite,
+    )
+
+
+def watch(args: argparse.Namespace, cancel: threading.Event) -> int:
+    if len(args.paths) != 1 or not Path(args.paths[0]).is_dir():
+        print("--watch takes a single folder", file=sys.stderr)
+        return EXIT_ERROR
+
+    def report(update: xl.WatchUpdate) -> None:
+        print(
+            f"{time.strftime('%H:%M:%S')} scanned {len(update.scanned)}"
+            f" removed {len(update.removed)} new duplicates {len(update.new_duplicates)}"
+            f" written {len(update.written)}",
+            file=sys.stderr,
+        )
+        for error in update.errors:
+            print(f"error: {error} (retried on the next poll)", file=sys.stderr)
+
+    cache = xl.ScanCache(args.cache) if args.cache else None
+    try:
+        watcher = xl.FolderWatcher(
+            args.paths[0],
+            args.output_dir,
+            show_dup_origin=args.show_origin,
+            target=scan_target(args),
+            engine=args.engine,
+            jobs=args.jobs,
+            cache=cache,
+        )
+        asyncio.run(watcher.run(args.interval, cancel, on_update=report))
+    finally:
+        if cache is not None:
+            cache.close()
+    return EXIT_CLEAN
+
+
+def run(args: argparse.Namespace, cancel: threading.Event) -> int:
+    files = collect_files(args.paths, args.recursive)
+    if not files:
+        print("no supported files found", file=sys.stderr)
+        return EXIT_ERROR
+
+    metrics = xl.RunMetrics(trace_memory=args.trace_memory, profile=bool(args.profile))
+    timings = {}
+    start = time.perf_counter()
+    cache = xl.ScanCache(args.cache) if args.cache else None
+    try:
+        index = xl.get_files_values(
+            files,
+            jobs=args.jobs,
+            cache=cache,
+            cancel=cancel,
+            engine=args.engine,
+            backend=args.backend,
+            memory_budget=args.memory_budget,
+            target=scan_target(args),
+            metrics=metrics,
+        )
+    finally:
+        if cache is not None:
+            cache.close()
+    timings["scan"] = time.perf_counter() - start
+
+    history = None
+    if args.registry:
+        registry_start = time.perf_counter()
+        with xl.NumberRegistry(args.registry) as registry:
+            if args.forget_before:
+                registry.prune(args.forget_before)
+            history = registry.record(index, files)
+        timings["registry"] = time.perf_counter() - registry_start
+
+    if args.report:
+        report_start = time.perf_counter()
+        xl.write_duplicate_report(index, args.report, metrics=metrics)
+        timings["report"] = time.perf_counter() - report_start
+
+    if args.mode != "report":
+        write_start = time.perf_counter()
+        asyncio.run(
+            xl.edit_files_values(
+                valuesDict=index,
+                files=files,
+                make_copy=args.mode == "copy",
+                show_dup_origin=args.show_origin,
+                jobs=args.jobs,
+                cancel=cancel,
+                output_dir=args.output_dir,
+                metrics=metrics,
+                history=history,
+                streaming=args.streaming,
+                compresslevel=args.compresslevel,
+                engine=args.engine,
+            )
+        )
+        timings["write"] = time.perf_counter() - write_start
+    timings["total"] = time.perf_counter() - start
+
+    rows = metrics.phases["scan"]["rows"]
+    summary = summarize(index, files, rows, timings, args.mode, history)
+    summary["metrics"] = metrics.report()
+    if args.profile:
+        metrics.dump_profile(args.profile)
+    if args.summary == "-":
+        print(json.dumps(summary, indent=2), file=sys.__stdout__)
+    elif args.summary:
+        with open(args.summary, "w") as f:
+            json.dump(summary, f, indent=2)
+
+    if (summary["duplicate_values"] or history) and not args.exit_zero:
+        return EXIT_DUPLICATES
+    return EXIT_CLEAN
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = parse_args(argv)
+
+    # SIGTERM (cron, systemd) stops the run like ctrl+c, between files
+    cancel = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: cancel.set())
+
+    # the progress bars go to stderr so that stdout only carries the summary
+    with contextlib.redirect_stdout(sys.stderr):
+        try:
+            return watch(args, cancel) if args.watch else run(args, cancel)
+        except (xl.Cancelled, KeyboardInterrupt):
+            if args.watch:
+                return EXIT_CLEAN
+            print("cancelled", file=sys.stderr)
+            return EXIT_CANCELLED
+        except Exception as e:
+            # the errors of the files are xl.FileError, prefixed with the file
+            print(f"error: {e or type(e).__name__}", file=sys.stderr)
+            return EXIT_ERROR
+
+
+if __name__ == "__main__":
+    os.environ.setdefault("PYTHONUNBUFFERED", "1")
+    sys.exit(main())
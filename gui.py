@@ -1,14 +1,22 @@
 import asyncio
+import multiprocessing
 import os
+import queue
 import sys
+import threading
+from tkinter import ttk
 from typing import Callable
 
 import customtkinter as ctk
 import tk_async_execute as tae
-from PIL import Image, ImageTk
 
 import xl
 
+# memory budget of the workbooks kept loaded between the scan and the write phase
+WORKBOOK_CACHE_BYTES = 256 * 2**20
+# table of the duplicates written instead of the files when "report only" is set
+REPORT_PATH = os.path.join("data", "duplicates.xlsx")
+
 ctk.set_appearance_mode("dark")
 
 
@@ -28,12 +36,22 @@ class Utility:
     A class for containing several used variables
 
     Methods:
-        - __init__(self) -> class must be instantiated or tkinter complains about using font class without root(?)
+        - __new__(cls) -> class must be instantiated or tkinter complains about using font class without root(?),
+        the fonts are created by the first instantiation and shared by every widget
+        - image(cls, path_key: str, size: int) -> PhotoImage
     """
 
-    def __init__(self) -> None:
-        self.font = ctk.CTkFont(family="Helvetica", size=14, weight="bold")
-        self.bigger_font = ctk.CTkFont(family="Helvetica", size=18, weight="bold")
+    _instance = None
+
+    def __new__(cls) -> "Utility":
+        if cls._instance is None:
+            instance = super().__new__(cls)
+            instance.font = ctk.CTkFont(family="Helvetica", size=14, weight="bold")
+            instance.bigger_font = ctk.CTkFont(
+                family="Helvetica", size=18, weight="bold"
+            )
+            cls._instance = instance
+        return cls._instance
 
     COLOR = {
         "BLUE": "#007BFF",
@@ -50,6 +68,24 @@ class Utility:
         "WIN_ICON_PATH": resource(os.path.join("icons", "icon2.ico")),
     }
 
+    # (path key, size) -> PhotoImage, see image
+    _images: dict = {}
+
+    @classmethod
+    def image(cls, path_key: str, size: int) -> "ImageTk.PhotoImage":
+        """
+        Return the icon of PATH[path_key] resized to size x size, decoded once and shared
+        by every widget (the root window must exist). PIL is only imported with the first
+        icon, the window starts without it
+        """
+        key = (path_key, size)
+        if key not in cls._images:
+            from PIL import Image, ImageTk
+
+            icon = Image.open(cls.PATH[path_key]).resize((size, size))
+            cls._images[key] = ImageTk.PhotoImage(icon)
+        return cls._images[key]
+
 
 # ------ Sub Windows ----------------------------------------------------
 class MainbarFrame(ctk.CTkFrame):
@@ -64,9 +100,11 @@ class MainbarFrame(ctk.CTkFrame):
     Attributes:
         - open_file_callback: callable
         - delete_file_callback: callable
+        - preview_file_callback: callable
 
     Methods:
-        - __init__(self, open_file_callback: callable, delete_file_callback: callable)
+        - __init__(self, open_file_callback: callable, delete_file_callback: callable,
+                   preview_file_callback: callable)
     """
 
     def __init__(
@@ -74,6 +112,7 @@ class MainbarFrame(ctk.CTkFrame):
         *args,
         open_file_callback: Callable,
         delete_file_callback: Callable,
+        preview_file_callback: Callable,
         **kwargs,
     ) -> None:
         super().__init__(*args, **kwargs)
@@ -90,7 +129,9 @@ class MainbarFrame(ctk.CTkFrame):
             sticky="new",
         )
 
-        self.list_frame = FileListFrame(self, delete_item=delete_file_callback)
+        self.list_frame = FileListFrame(
+            self, delete_item=delete_file_callback, preview_item=preview_file_callback
+        )
         self.list_frame.grid(
             column=0,
             row=1,
@@ -161,39 +202,43 @@ class ExcelIcon(ctk.CTkCanvas):
 
     Attributes:
         - delete_event_handler: callable
+        - open_event_handler: callable
 
     Methods:
         - __init__(self) -> None
         - enter(self, event) -> None
         - leave(self, event) -> None
         - _delete(self, event) -> None
+        - _open(self, event) -> None
         - enter_with_cursor(self, event) -> None
         - leave_with_cursor(self, event) -> None
     """
 
-    def __init__(self, *args, delete_event_handler: Callable, **kwargs) -> None:
+    def __init__(
+        self,
+        *args,
+        delete_event_handler: Callable,
+        open_event_handler: Callable,
+        **kwargs,
+    ) -> None:
         super().__init__(*args, **kwargs)
 
         self.configure(bg=Utility.COLOR["FRAME_BG"])
         self.configure(bd=0)
         self.delete_event_handler = delete_event_handler
+        self.open_event_handler = open_event_handler
 
-        self._icon = Image.open(Utility.PATH["EXCEL_ICON_PATH"]).resize(
-            (100, 100),
-        )
-        self._icon = ImageTk.PhotoImage(self._icon)
+        self._icon = Utility.image("EXCEL_ICON_PATH", 100)
         self.icon = self.create_image(0, 0, image=self._icon, anchor="nw")
 
-        self._redx = Image.open(Utility.PATH["CLOSE_ICON_PATH"]).resize(
-            (30, 30),
-        )
-        self._redx = ImageTk.PhotoImage(self._redx)
+        self._redx = Utility.image("CLOSE_ICON_PATH", 30)
         self.redx = self.create_image(
             100, 0, image=self._redx, anchor="ne", state=ctk.HIDDEN
         )
 
         self.tag_bind(self.icon, "<Enter>", self.enter)
         self.tag_bind(self.icon, "<Leave>", self.leave)
+        self.tag_bind(self.icon, "<Button-1>", self._open)
 
         # WARNING: events have to be repeated on redx also, because mouse entering redx also registers as leaving the icon.
         self.tag_bind(self.redx, "<Enter>", self.enter_with_cursor)
@@ -209,6 +254,9 @@ class ExcelIcon(ctk.CTkCanvas):
     def _delete(self, event) -> None:
         self.delete_event_handler()
 
+    def _open(self, event) -> None:
+        self.open_event_handler()
+
     # BUG: change the cursor to hand only when on redx shape (causes freeze)
     def enter_with_cursor(self, event) -> None:
         self.itemconfig(self.redx, state=ctk.NORMAL)
@@ -221,7 +269,8 @@ class ExcelIcon(ctk.CTkCanvas):
 
 class ExcelIconFrame(ctk.CTkFrame):
     """
-    A frame containing a canvas for icon of the excel file and a label for their filename
+    A frame containing a canvas for icon of the excel file and a label for their filename.
+    The frames are recycled by FileListFrame: bind_item shows another file in the same widgets
 
     excel icon frame geometry is (pack):
 
@@ -229,32 +278,30 @@ class ExcelIconFrame(ctk.CTkFrame):
     ( * )
 
     Attributes:
-        - item_name: str
-        - item_path: str
+        - item_path: str | None
         - delete_upclass: callable
-        - index: int
+        - preview_upclass: callable
 
     Methods:
         - __init__(self) -> None
+        - bind_item(self, item_path: str) -> None
         - _delete(self) -> None
+        - _preview(self) -> None
     """
 
     def __init__(
         self,
         *args,
-        item_name: str,
-        item_path: str,
         delete_upclass: Callable,
-        index: int,
+        preview_upclass: Callable,
         **kwargs,
     ) -> None:
         super().__init__(*args, **kwargs)
         self.configure(fg_color="transparent")
 
-        self.item_name = item_name
-        self.item_path = item_path
+        self.item_path = None
         self.delete_upclass = delete_upclass
-        self.index = index
+        self.preview_upclass = preview_upclass
 
         self.icon_canvas = ExcelIcon(
             self,
@@ -264,33 +311,41 @@ class ExcelIconFrame(ctk.CTkFrame):
             highlightthickness=0,
             relief="ridge",
             delete_event_handler=self._delete,
+            open_event_handler=self._preview,
         )
 
         self.name_label = ctk.CTkLabel(
             self,
-            text=self.item_name,
+            text="",
             font=Utility().font,
         )
 
         self.icon_canvas.pack()
         self.name_label.pack()
 
+    def bind_item(self, item_path: str) -> None:
+        if item_path != self.item_path:
+            self.item_path = item_path
+            # shorten the name if necessary
+            self.name_label.configure(text=os.path.basename(item_path)[0:8])
+
     def _delete(self) -> None:
         """
         Function that propagate deleting fucionality to upper classes since the main logic
         is handled in the main window
         """
-        self.delete_upclass(item_path=self.item_path, index=self.index)
-        self.destroy()
+        self.delete_upclass(self.item_path)
 
+    def _preview(self) -> None:
+        self.preview_upclass(self.item_path)
 
-class FileListFrame(ctk.CTkScrollableFrame):
+
+class FileListFrame(ctk.CTkFrame):
     """
-    filelist frame of the application that contains a simple button
-    and a placeholder entry. this frame handles placing, deleting,
-    rearranging and deleting the icons of the selected files with
-    a helper function of recoloring scrollbar of the scrollable frame
-    when there are not many selected files
+    filelist frame of the application showing the icons of the selected files in a
+    scrollable grid. the grid is virtualized: only the rows in view have widgets, which are
+    recycled as the list scrolls, so thousands of files cost no more than a screenful.
+    files are added and removed in batches with a single regrid
 
     file list frame geometry is:
 
@@ -301,103 +356,270 @@ class FileListFrame(ctk.CTkScrollableFrame):
 
     Attributes:
         - delete_item: callable
+        - preview_item: callable
+        - items: list[str] -> the paths of the files in grid order
 
     Methods:
-        - __init__(self, open_files: callable) -> None
-        - place_item(self, item: str, index: int) -> None
-        - add_item(self, item_path: str, index: int) -> None
-        - rearrange_items(self, index: int) -> None
-        - delete_item(self, item_path: str, index: int) -> None
+        - __init__(self, delete_item: callable, preview_item: callable) -> None
+        - add_items(self, item_paths: list[str]) -> None
+        - add_item(self, item_path: str) -> None
+        - remove_items(self, item_paths: list[str]) -> None
+        - delete_item(self, item_path: str) -> None
+        - refresh(self) -> None
         - recolor_scrollbar(self) -> None
     """
 
-    def __init__(self, *args, delete_item: Callable, **kwargs) -> None:
+    COLUMNS = 4
+    CELL_HEIGHT = 150
+
+    def __init__(
+        self, *args, delete_item: Callable, preview_item: Callable, **kwargs
+    ) -> None:
         super().__init__(*args, **kwargs)
 
-        self.grid_columnconfigure((0, 1, 2, 3), weight=1)
+        self.grid_columnconfigure(0, weight=1)
+        self.grid_rowconfigure(0, weight=1)
 
-        self.configure(scrollbar_button_color=Utility.COLOR["FRAME_BG"])
-        self.configure(scrollbar_button_hover_color=Utility.COLOR["FRAME_BG"])
+        self.canvas = ctk.CTkCanvas(
+            self,
+            bg=self._apply_appearance_mode(self._fg_color),
+            bd=0,
+            highlightthickness=0,
+        )
+        self.canvas.grid(row=0, column=0, sticky="news", padx=(6, 0), pady=6)
+        self.scrollbar = ctk.CTkScrollbar(self, command=self.canvas.yview)
+        self.scrollbar.grid(row=0, column=1, sticky="ns", pady=6)
+        self.canvas.configure(yscrollcommand=self._on_scroll)
 
         self.delete_item_main = delete_item
-        self.items = set()
-        self.placed_widgets = dict()
+        self.preview_item = preview_item
+        self.items: list[str] = []
+        self._positions: dict[str, int] = {}
+        # recycled icon widgets and their canvas windows
+        self._pool: list[tuple[ExcelIconFrame, int]] = []
+
+        self.canvas.bind("<Configure>", lambda event: self.refresh())
+        # the wheel scrolls the grid only while the pointer is over it
+        self.canvas.bind("<Enter>", self._bind_wheel)
+        self.canvas.bind("<Leave>", self._unbind_wheel)
+        self.recolor_scrollbar()
+
+    def add_items(self, item_paths: list[str]) -> None:
+        for item_path in item_paths:
+            if item_path not in self._positions:
+                self._positions[item_path] = len(self.items)
+                self.items.append(item_path)
+        self.refresh()
+
+    def add_item(self, item_path: str) -> None:
+        self.add_items([item_path])
+
+    def remove_items(self, item_paths: list[str]) -> None:
+        removed = set(item_paths)
+        self.items = [item for item in self.items if item not in removed]
+        self._positions = {item: i for i, item in enumerate(self.items)}
+        self.refresh()
 
-    def calculate_grid(self, item: ExcelIconFrame, i: int, max_col: int = 4):
+    def delete_item(self, item_path: str) -> None:
+        self.remove_items([item_path])
+        self.delete_item_main(item_path)
+
+    def refresh(self) -> None:
         """
-        place icons in a grid with maximum [max_col] columns
+        Update the scroll region to the number of rows and lay out the visible ones
         """
-        item.grid(
-            row=i // max_col,
-            column=i % max_col,
-            padx=10,
-            pady=10,
-        )
-
-    def place_item(self, item: str, index: int) -> None:
-        last_item_index = len(self.items) - 1
-        # shorten the name if necessary
-        clean_name = item.split("/")[-1][0:8]
-        icon = ExcelIconFrame(
-            self,
-            item_name=clean_name,
-            item_path=item,
-            delete_upclass=self.delete_item,
-            index=index,
-        )
-        self.calculate_grid(icon, i=last_item_index)
-        self.placed_widgets[index] = icon
-
-    def add_item(self, item_path: str, index: int) -> None:
-        if item_path not in self.items:
-            self.items.add(item_path)
-            self.place_item(item_path, index)
+        rows = -(-len(self.items) // self.COLUMNS)
+        width = max(self.canvas.winfo_width(), 1)
+        self.canvas.configure(scrollregion=(0, 0, width, rows * self.CELL_HEIGHT))
+        self._render()
         self.recolor_scrollbar()
 
-    def rearrange_items(self, index: int) -> None:
+    def _on_scroll(self, first: str, last: str) -> None:
+        self.scrollbar.set(first, last)
+        self._render()
+
+    def _render(self) -> None:
         """
-        Rearrange icons in the grid when an icon gets removed.
+        Show the items of the rows in view in the pooled widgets, hide the spare ones
         """
-        new = dict()
-        # only effect the icons that come after the deleted icon
-        # 1 - decrement said icons indices
-        for i, w in self.placed_widgets.items():
-            if i > index:
-                w.index -= 1
-                new[i - 1] = w
-            else:
-                new[i] = w
-
-        # has to be new dict because cannot iterate on a changing dictionary
-        self.placed_widgets = new
-        # 2 - recalculate their grid
-        for i, w in self.placed_widgets.items():
-            if i >= index:
-                last_item_num = w.index - 1
-                self.calculate_grid(w, i=last_item_num)
-
-    def delete_item(self, item_path: str, index: int) -> None:
-        self.items.remove(item_path)
-        del self.placed_widgets[index]
-        self.delete_item_main(item_path)
-        self.recolor_scrollbar()
-        self.rearrange_items(index)
+        top = self.canvas.canvasy(0)
+        height = self.canvas.winfo_height()
+        first_row = max(int(top // self.CELL_HEIGHT), 0)
+        last_row = int((top + height) // self.CELL_HEIGHT)
+        first = first_row * self.COLUMNS
+        visible = self.items[first : (last_row + 1) * self.COLUMNS]
+
+        while len(self._pool) < len(visible):
+            icon = ExcelIconFrame(
+                self.canvas,
+                delete_upclass=self.delete_item,
+                preview_upclass=self.preview_item,
+            )
+            window = self.canvas.create_window(0, 0, window=icon, anchor="n")
+            self._pool.append((icon, window))
+
+        column_width = max(self.canvas.winfo_width(), 1) / self.COLUMNS
+        for i, (icon, window) in enumerate(self._pool):
+            if i >= len(visible):
+                self.canvas.itemconfigure(window, state="hidden")
+                continue
+            row, column = divmod(first + i, self.COLUMNS)
+            icon.bind_item(visible[i])
+            self.canvas.coords(
+                window, (column + 0.5) * column_width, row * self.CELL_HEIGHT + 10
+            )
+            self.canvas.itemconfigure(window, state="normal")
+
+    def _bind_wheel(self, event) -> None:
+        self.canvas.bind_all("<MouseWheel>", self._on_wheel)
+        self.canvas.bind_all("<Button-4>", self._on_wheel)
+        self.canvas.bind_all("<Button-5>", self._on_wheel)
+
+    def _unbind_wheel(self, event) -> None:
+        # moving onto an icon also leaves the frame
+        inside = self.winfo_containing(*self.winfo_pointerxy())
+        if inside is not None and str(inside).startswith(str(self.canvas)):
+            return
+        for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            self.canvas.unbind_all(sequence)
+
+    def _on_wheel(self, event) -> None:
+        if getattr(event, "num", None) == 4 or event.delta > 0:
+            step = -1
+        else:
+            step = 1
+        # nothing to scroll when every row fits
+        if self.canvas.yview() != (0.0, 1.0):
+            self.canvas.yview_scroll(step, "units")
 
     # TODO: rewrite better
     def recolor_scrollbar(self) -> None:
         """
         recolor scrollbar so the scrollbar is hidden when not needed
         """
-        if len(self.items) > 16:
-            self.configure(
-                scrollbar_button_color=Utility.COLOR["FRAME_HIGHLIGHT"],
-            )
-            self.configure(
-                scrollbar_button_hover_color=Utility.COLOR["FRAME_HIGHLIGHT_HOVER"]
+        rows = -(-len(self.items) // self.COLUMNS)
+        if rows * self.CELL_HEIGHT > self.canvas.winfo_height():
+            self.scrollbar.configure(
+                button_color=Utility.COLOR["FRAME_HIGHLIGHT"],
+                button_hover_color=Utility.COLOR["FRAME_HIGHLIGHT_HOVER"],
             )
         else:
-            self.configure(scrollbar_button_color=Utility.COLOR["FRAME_BG"])
-            self.configure(scrollbar_button_hover_color=Utility.COLOR["FRAME_BG"])
+            self.scrollbar.configure(
+                button_color=Utility.COLOR["FRAME_BG"],
+                button_hover_color=Utility.COLOR["FRAME_BG"],
+            )
+
+
+class PreviewWindow(ctk.CTkToplevel):
+    """
+    A window previewing the rows of a file, a page at a time: the first page is shown when
+    the window opens and the next one is requested when the table is scrolled near its end.
+    The pages are read by the main window off the tkinter thread (see App.load_preview_page)
+    and the rows of the duplicates of the last scan are highlighted
+
+    preview window geometry is:
+
+    ( * * )
+    ( *   )
+
+    Attributes:
+        - item_path: str
+        - request_page: callable -> called with the window and the number of the page
+        - next_page: int
+        - loading: bool
+        - exhausted: bool
+
+    Methods:
+        - __init__(self, item_path: str, request_page: callable) -> None
+        - request_next_page(self) -> None
+        - add_page(self, number: int, rows: list, duplicates: set) -> None
+        - show_error(self, text: str) -> None
+        - _on_scroll(self, first: str, last: str) -> None
+    """
+
+    # a new page is requested once the view reaches this fraction of the loaded rows
+    LOAD_AHEAD = 0.9
+
+    def __init__(self, *args, item_path: str, request_page: Callable, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.title(os.path.basename(item_path))
+        self.geometry("800x500")
+        self.grid_columnconfigure(0, weight=1)
+        self.grid_rowconfigure(0, weight=1)
+
+        self.item_path = item_path
+        self.request_page = request_page
+        self.next_page = 0
+        self.loading = False
+        self.exhausted = False
+
+        style = ttk.Style(self)
+        style.configure(
+            "Preview.Treeview",
+            background=Utility.COLOR["FRAME_FG"],
+            fieldbackground=Utility.COLOR["FRAME_FG"],
+            foreground="white",
+            borderwidth=0,
+        )
+        columns = ["#"] + [chr(ord("A") + i) for i in range(xl.PAGE_COLUMNS)]
+        self.table = ttk.Treeview(
+            self, columns=columns, show="headings", style="Preview.Treeview"
+        )
+        for column in columns:
+            self.table.heading(column, text=column)
+            self.table.column(column, width=60 if column == "#" else 110, stretch=False)
+        self.table.tag_configure("duplicate", foreground=Utility.COLOR["RED"])
+        self.table.grid(row=0, column=0, sticky="news")
+
+        self.scrollbar = ctk.CTkScrollbar(self, command=self.table.yview)
+        self.scrollbar.grid(row=0, column=1, sticky="ns")
+        self.table.configure(yscrollcommand=self._on_scroll)
+
+        self.status = ctk.CTkLabel(self, text="", font=Utility().font)
+        self.status.grid(row=1, column=0, columnspan=2, sticky="w", padx=10)
+
+        self.request_next_page()
+
+    def request_next_page(self) -> None:
+        if self.loading or self.exhausted:
+            return
+        self.loading = True
+        self.status.configure(text="Loading")
+        self.request_page(self, self.next_page)
+
+    def add_page(self, number: int, rows: list, duplicates: set) -> None:
+        """
+        Append the rows of a page to the table, the duplicates (row numbers) in red
+        """
+        self.loading = False
+        if number != self.next_page or not self.winfo_exists():
+            return
+        for row, values in rows:
+            self.table.insert(
+                "",
+                "end",
+                values=(row, *("" if value is None else value for value in values)),
+                tags=("duplicate",) if row in duplicates else (),
+            )
+        self.next_page += 1
+        self.exhausted = len(rows) < xl.PAGE_ROWS
+        loaded = len(self.table.get_children())
+        self.status.configure(
+            text=f"{loaded} rows" + ("" if self.exhausted else ", scroll for more")
+        )
+        # a page shorter than the window does not scroll, keep filling it
+        if self.table.yview()[1] >= self.LOAD_AHEAD:
+            self.request_next_page()
+
+    def show_error(self, text: str) -> None:
+        self.loading = False
+        self.exhausted = True
+        self.status.configure(text=f"ERROR: {text}", text_color=Utility.COLOR["RED"])
+
+    def _on_scroll(self, first: str, last: str) -> None:
+        self.scrollbar.set(first, last)
+        if float(last) >= self.LOAD_AHEAD:
+            self.request_next_page()
 
 
 class ReversedSwitch(ctk.CTkSwitch):
@@ -478,15 +700,29 @@ class SidebarFrame(ctk.CTkFrame):
         - delete_event_handler: callable
         - show_dup_origin: callable
         - find_duplicates_callback: callable
+        - cancel_callback: callable
         - is_saved: bool
+        - report_only: bool (write a single table of the duplicates, see xl.write_duplicate_report)
+        - jobs: str (number of processes used to scan the files, a single one keeps the
+        workbooks loaded for the write phase)
+        - sheets: str (scanned sheets: empty for the active one, * for all or names separated by ,)
+        - columns: str (scanned column letters or header names separated by ,)
+        - composite: bool (the columns make a single key)
 
     Methods:
         - __init__(
                    self,
                    show_dup_origin: bool,
                    find_duplicates_callback: callable,
+                   cancel_callback: callable,
                    is_saved: callable,
+                   report_only: ctk.BooleanVar,
+                   jobs: ctk.StringVar,
+                   sheets: ctk.StringVar,
+                   columns: ctk.StringVar,
+                   composite: ctk.BooleanVar,
                    )
+        - set_running(self, running: bool) -> None
     """
 
     def __init__(
@@ -494,7 +730,13 @@ class SidebarFrame(ctk.CTkFrame):
         *args,
         show_dup_origin: ctk.BooleanVar,
         find_duplicates_callback: Callable,
+        cancel_callback: Callable,
         is_saved: ctk.BooleanVar,
+        report_only: ctk.BooleanVar,
+        jobs: ctk.StringVar,
+        sheets: ctk.StringVar,
+        columns: ctk.StringVar,
+        composite: ctk.BooleanVar,
         **kwargs,
     ):
         super().__init__(*args, **kwargs)
@@ -512,10 +754,24 @@ class SidebarFrame(ctk.CTkFrame):
             font=Utility().font,
         )
 
+        self.cancel_button = ctk.CTkButton(
+            self,
+            text="cancel",
+            command=cancel_callback,
+            fg_color=Utility.COLOR["RED"],
+            corner_radius=0,
+            font=Utility().font,
+            state="disabled",
+        )
+
         self.save_files_switch = ReversedSwitch(
             self.bg_frame, text="save files", variable=is_saved
         )
 
+        self.report_only_switch = ReversedSwitch(
+            self.bg_frame, text="report only", variable=report_only
+        )
+
         self.show_duplicate_origin_label = ctk.CTkLabel(
             self.bg_frame, text="show duplicate origin"
         )
@@ -526,6 +782,55 @@ class SidebarFrame(ctk.CTkFrame):
             variable=show_dup_origin,
         )
 
+        self.jobs_frame = ctk.CTkFrame(self.bg_frame, fg_color="transparent")
+        self.jobs_frame.grid_columnconfigure(0, weight=1)
+        self.jobs_label = ctk.CTkLabel(
+            self.jobs_frame,
+            text="jobs",
+            font=Utility().font,
+        )
+        self.jobs_menu = ctk.CTkOptionMenu(
+            self.jobs_frame,
+            values=[str(i) for i in range(1, (os.cpu_count() or 1) + 1)],
+            variable=jobs,
+            width=70,
+            corner_radius=0,
+            fg_color=Utility.COLOR["FRAME_HIGHLIGHT"],
+            button_color=Utility.COLOR["FRAME_HIGHLIGHT"],
+            button_hover_color=Utility.COLOR["FRAME_HIGHLIGHT_HOVER"],
+            font=Utility().font,
+        )
+        # the scanned workbooks can only be handed over to the write phase in-process
+        self.jobs_hint = ctk.CTkLabel(
+            self.jobs_frame,
+            text="1 job reuses the scanned\nworkbooks for the write",
+            justify="left",
+            text_color=Utility.COLOR["FRAME_HIGHLIGHT_HOVER"],
+            font=Utility().font,
+        )
+        self.jobs_label.grid(row=0, column=0, sticky="w")
+        self.jobs_menu.grid(row=0, column=1, sticky="e")
+        self.jobs_hint.grid(row=1, column=0, columnspan=2, sticky="w")
+
+        self.target_frame = ctk.CTkFrame(self.bg_frame, fg_color="transparent")
+        self.target_frame.grid_columnconfigure(0, weight=1)
+        for row, (text, variable) in enumerate(
+            (("sheets", sheets), ("columns", columns))
+        ):
+            ctk.CTkLabel(self.target_frame, text=text, font=Utility().font).grid(
+                row=row, column=0, sticky="w", pady=(0, 5)
+            )
+            ctk.CTkEntry(
+                self.target_frame,
+                textvariable=variable,
+                width=110,
+                corner_radius=0,
+                font=Utility().font,
+            ).grid(row=row, column=1, sticky="e", pady=(0, 5))
+        self.composite_switch = ReversedSwitch(
+            self.bg_frame, text="composite key", variable=composite
+        )
+
         self.exit_button = ctk.CTkButton(
             self,
             text="Exit",
@@ -535,7 +840,8 @@ class SidebarFrame(ctk.CTkFrame):
             font=Utility().font,
         )
 
-        self.duplicate_button.pack(padx=20, pady=(20, 50), fill="x")
+        self.duplicate_button.pack(padx=20, pady=(20, 10), fill="x")
+        self.cancel_button.pack(padx=20, pady=(0, 30), fill="x")
         self.save_files_switch.pack(
             anchor="w",
             padx=(20, 20),
@@ -548,6 +854,30 @@ class SidebarFrame(ctk.CTkFrame):
             pady=10,
             fill="x",
         )
+        self.report_only_switch.pack(
+            anchor="w",
+            padx=(20, 20),
+            pady=10,
+            fill="x",
+        )
+        self.jobs_frame.pack(
+            anchor="w",
+            padx=(20, 20),
+            pady=10,
+            fill="x",
+        )
+        self.target_frame.pack(
+            anchor="w",
+            padx=(20, 20),
+            pady=(10, 0),
+            fill="x",
+        )
+        self.composite_switch.pack(
+            anchor="w",
+            padx=(20, 20),
+            pady=(0, 10),
+            fill="x",
+        )
         self.bg_frame.pack(fill="x", padx=20)
         self.exit_button.pack(
             padx=20,
@@ -556,6 +886,13 @@ class SidebarFrame(ctk.CTkFrame):
             side="bottom",
         )
 
+    def set_running(self, running: bool) -> None:
+        """
+        Only allow cancelling while a run is in progress (and starting one otherwise)
+        """
+        self.duplicate_button.configure(state="disabled" if running else "normal")
+        self.cancel_button.configure(state="normal" if running else "disabled")
+
 
 # ------ Main Window class ----------------------------------------------
 class App(ctk.CTk):
@@ -567,14 +904,27 @@ class App(ctk.CTk):
     ( * * )
     ( * * )
 
+    The duplicates are searched and marked in worker threads/processes, their widget updates
+    are queued with post and run on the tkinter thread by poll_ui_queue.
+
     Methods:
         - __init__(self)
         - open_files(self)
-        - find_duplicates(self)
+        - find_duplicates(self, files: set, make_copy: bool, show_dup_origin: bool, jobs: int,
+                          target: xl.ScanTarget, report_only: bool)
         - get_selected_files(self)
         - find_duplicates_callback
+        - cancel_callback_func(self)
         - delete_item(self, item: str)
-        - progress_handler(self)
+        - preview_file(self, item: str)
+        - request_preview_page(self, window: PreviewWindow, number: int)
+        - load_preview_page(self, window: PreviewWindow, number: int, sheets)
+        - duplicate_rows(self, item: str, sheet: str) -> set
+        - session_key_of(files: set, target: xl.ScanTarget) -> tuple
+        - post(self, func: callable, *args)
+        - poll_ui_queue(self)
+        - show_progress(self, event: xl.ProgressEvent, metrics: xl.RunMetrics | None)
+        - show_status(self, text: str, color: str)
     """
 
     def __init__(self) -> None:
@@ -583,17 +933,35 @@ class App(ctk.CTk):
         # ------ Variables -----------------
         self.selected_files: set = set()
         self.is_saved = ctk.BooleanVar(value=False)
+        self.report_only = ctk.BooleanVar(value=False)
         self.show_dup_origin = ctk.BooleanVar(value=False)
+        self.jobs = ctk.StringVar(value=str(os.cpu_count() or 1))
+        self.sheets = ctk.StringVar(value="")
+        self.columns = ctk.StringVar(value="A")
+        self.composite = ctk.BooleanVar(value=False)
+        self.cancel_event = threading.Event()
+        # timings of the last run, see xl.RunMetrics
+        self.metrics: xl.RunMetrics | None = None
+        # duplicate index of the last scan and what it was computed from, reused by the
+        # next runs of the session until the selection (or a file) changes
+        self.session_index: xl.DuplicateIndex | None = None
+        self.session_key: tuple | None = None
+        self.workbooks = xl.WorkbookCache(max_bytes=WORKBOOK_CACHE_BYTES)
+        # pages of the previewed files, and the marks of session_index they highlight
+        self.pages = xl.PageCache()
+        self.previews: dict[str, PreviewWindow] = {}
+        self.session_plan: tuple | None = None
+        self.ui_queue: queue.Queue = queue.Queue()
 
         # ------ General settings ----------
         self.title("Excel Duplicates")
-        self.geometry("1000x500")
+        self.geometry("1000x600")
         self.resizable(False, False)
 
         # ------ Grid ----------------------
         self.grid_columnconfigure(0, weight=1)
         self.grid_columnconfigure(1, weight=3)
-        self.grid_rowconfigure(0, weight=1, minsize=450)
+        self.grid_rowconfigure(0, weight=1, minsize=550)
         self.grid_rowconfigure(1, weight=1, minsize=50)
 
         # ------ Frames --------------------
@@ -601,6 +969,7 @@ class App(ctk.CTk):
             self,
             open_file_callback=self.open_files,
             delete_file_callback=self.delete_item,
+            preview_file_callback=self.preview_file,
         )
         self.mainbar_frame.grid(
             row=0,
@@ -612,8 +981,14 @@ class App(ctk.CTk):
         self.sidebar_frame = SidebarFrame(
             self,
             find_duplicates_callback=self.find_duplicates_callback_func,
+            cancel_callback=self.cancel_callback_func,
             is_saved=self.is_saved,
+            report_only=self.report_only,
             show_dup_origin=self.show_dup_origin,
+            jobs=self.jobs,
+            sheets=self.sheets,
+            columns=self.columns,
+            composite=self.composite,
         )
         self.sidebar_frame.grid(
             row=0,
@@ -632,6 +1007,8 @@ class App(ctk.CTk):
         )
         self.progressbar.set(0)
 
+        self.poll_ui_queue()
+
     # ------ Callbacks ------------------
     def open_files(self) -> None:
         """
@@ -639,87 +1016,294 @@ class App(ctk.CTk):
         then add their icon the list_frame window
         """
         self.progressbar.grid_forget()
+        # .xls files are only offered when the optional xlrd can read them
+        xls = xl._optional_module("xlrd") is not None
+        suffixes = [s for s in xl.READERS if xls or s != ".xls"]
         file_names = ctk.filedialog.askopenfilenames(
             filetypes=(
+                ("Supported files", " ".join(f"*{s}" for s in suffixes)),
                 ("Excel files", "*.xlsx"),
-                ("Excel files", "*.xls"),
+                *((("Excel files", "*.xls"),) if xls else ()),
                 ("Excel files", "*.xlsm"),
                 ("Excel files", "*.xltx"),
                 ("Excel files", "*.xltm"),
+                ("CSV files", "*.csv"),
+                ("TSV files", "*.tsv *.tab"),
             )
         )
-        for fn in file_names:
-            if fn not in self.selected_files:
-                self.selected_files.add(fn)
-
-                self.mainbar_frame.list_frame.add_item(
-                    fn,
-                    index=len(self.selected_files),
-                )
+        new_files = [
+            fn for fn in dict.fromkeys(file_names) if fn not in self.selected_files
+        ]
+        if new_files:
+            self.selected_files.update(new_files)
+            self.session_index = None
+            # a single regrid for the whole selection
+            self.mainbar_frame.list_frame.add_items(new_files)
 
     def get_selected_files(self) -> set:
         return self.selected_files
 
-    async def find_duplicates(self) -> None:
+    async def find_duplicates(
+        self,
+        files: set,
+        make_copy: bool,
+        show_dup_origin: bool,
+        jobs: int,
+        target: xl.ScanTarget = xl.DEFAULT_TARGET,
+        report_only: bool = False,
+    ) -> None:
         """
         Main functionality of the program, get duplicates and save appropriately with selected files
+
+        Runs in the event loop thread of tkinter-async, the scan is done in another thread
+        (and its worker processes) and the write phase runs its files in an executor,
+        so neither the window nor the event loop are blocked. With report_only the files
+        are left untouched and their duplicates are written to REPORT_PATH instead.
+
+        The workbooks are only kept loaded for the write phase (self.workbooks) when it
+        runs in this process (jobs == 1) and writes the files, otherwise the scan streams
+        them.
         """
-        self.progressbar.set(0)
-        _s = self.get_selected_files()
-        if _s:
-            try:
-                self.progressbar.update_text_and_show(
-                    text="Loading",
-                    color="white",
+        metrics = xl.RunMetrics()
+        workbooks = self.workbooks if jobs == 1 and not report_only else None
+        if workbooks is None:
+            self.workbooks.clear()
+        self.metrics = metrics
+        try:
+            key = await asyncio.to_thread(self.session_key_of, files, target)
+            if self.session_index is not None and key == self.session_key:
+                all_values = self.session_index
+            else:
+                all_values = await asyncio.to_thread(
+                    xl.get_files_values,
+                    files,
+                    jobs=jobs,
+                    on_progress=lambda event: self.post(
+                        self.show_progress, event, metrics
+                    ),
+                    cancel=self.cancel_event,
+                    target=target,
+                    metrics=metrics,
+                    workbooks=workbooks,
                 )
-                all_values = xl.get_files_values(_s)
+                self.session_index, self.session_key = all_values, key
+            if report_only:
+                os.makedirs(os.path.dirname(REPORT_PATH), exist_ok=True)
+                await asyncio.to_thread(
+                    xl.write_duplicate_report, all_values, REPORT_PATH, metrics
+                )
+            else:
                 await xl.edit_files_values(
                     valuesDict=all_values,
-                    files=_s,
-                    make_copy=self.is_saved.get(),
-                    show_dup_origin=self.show_dup_origin.get(),
+                    files=files,
+                    make_copy=make_copy,
+                    show_dup_origin=show_dup_origin,
                     test=False,
+                    jobs=jobs,
+                    on_progress=lambda event: self.post(
+                        self.show_progress, event, metrics
+                    ),
+                    cancel=self.cancel_event,
+                    metrics=metrics,
+                    workbooks=workbooks,
                 )
-                await self.progress_handler()
-                self.progressbar.update_text_and_show(text="Done", color="#94D095")
-                self.progressbar.configure(progress_color="#293C17")
-
-            # TODO: change these
-            except Exception as e:
-                self.progressbar.update_text_and_show(
-                    text=f"ERROR: {e}",
-                    color=Utility.COLOR["RED"],
-                )
-        else:
-            self.progressbar.update_text_and_show(
-                text="ERROR: No files selected",
-                color=Utility.COLOR["RED"],
+            seconds = sum(phase["seconds"] for phase in metrics.phases.values())
+            if "scan" in metrics.phases:
+                detail = f"{metrics.throughput('scan'):,.0f} rows/s"
+            else:
+                detail = "scan reused"
+            self.post(
+                self.show_status, f"Done in {seconds:.1f} s ({detail})", "#94D095"
             )
+            self.post(self.progressbar.configure, progress_color="#293C17")
+
+        except xl.Cancelled:
+            self.post(self.show_status, "Cancelled", "white")
+
+        # TODO: change these
+        except Exception as e:
+            self.post(self.show_status, f"ERROR: {e}", Utility.COLOR["RED"])
+
+        finally:
+            self.post(self.sidebar_frame.set_running, False)
 
     def find_duplicates_callback_func(self) -> None:
         """
-        Callback function for tkinter-async package
+        Callback function for tkinter-async package, the tkinter variables are read here
+        since they can only be used from the tkinter thread
+        """
+        self.progressbar.set(0)
+        self.progressbar.configure(progress_color=Utility.COLOR["FRAME_FG"])
+        _s = set(self.get_selected_files())
+        if not _s:
+            self.show_status("ERROR: No files selected", Utility.COLOR["RED"])
+            return
+
+        # the previews keep their files open, which would block rewriting them on windows
+        self.pages.close()
+        self.cancel_event.clear()
+        self.sidebar_frame.set_running(True)
+        self.show_status("Loading", "white")
+        tae.async_execute(
+            self.find_duplicates(
+                files=_s,
+                make_copy=self.is_saved.get(),
+                show_dup_origin=self.show_dup_origin.get(),
+                jobs=int(self.jobs.get()),
+                target=self.scan_target(),
+                report_only=self.report_only.get(),
+            ),
+            wait=False,
+            visible=False,
+        )
+
+    def scan_target(self) -> xl.ScanTarget:
+        """
+        Build the ScanTarget of the sheets, columns and composite key widgets
         """
-        tae.async_execute(self.find_duplicates(), visible=False)
+        sheets = [s.strip() for s in self.sheets.get().split(",") if s.strip()]
+        columns = [c.strip() for c in self.columns.get().split(",") if c.strip()]
+        return xl.ScanTarget(
+            sheets="*" if sheets == ["*"] else tuple(sheets) or None,
+            columns=tuple(columns) or ("A",),
+            composite=self.composite.get(),
+        )
+
+    def cancel_callback_func(self) -> None:
+        """
+        Ask the running scan or write to stop, it stops between files (or rows) and
+        never leaves a half-written file
+        """
+        self.cancel_event.set()
+        self.show_status("Cancelling", "white")
 
     def delete_item(self, item: str) -> None:
         self.selected_files.remove(item)
+        self.session_index = None
+        self.workbooks.clear()
+        self.pages.close(item)
+        preview = self.previews.pop(item, None)
+        if preview is not None and preview.winfo_exists():
+            preview.destroy()
+
+    def preview_file(self, item: str) -> None:
+        """
+        Open the preview window of a file, or raise it when it is already open
+        """
+        preview = self.previews.get(item)
+        if preview is not None and preview.winfo_exists():
+            preview.focus()
+            return
+        self.previews[item] = PreviewWindow(
+            self, item_path=item, request_page=self.request_preview_page
+        )
 
-    # ------ Utilities -----
-    async def progress_handler(self) -> None:
+    def request_preview_page(self, window: PreviewWindow, number: int) -> None:
+        """
+        Callback of the preview windows, the sheets are read here since the tkinter
+        variables can only be used from the tkinter thread
+        """
+        tae.async_execute(
+            self.load_preview_page(window, number, self.scan_target().sheets),
+            wait=False,
+            visible=False,
+        )
+
+    async def load_preview_page(
+        self, window: PreviewWindow, number: int, sheets
+    ) -> None:
         """
-        Asynchronously progress the progressbar value.
+        Read a page of a previewed file and the duplicates it contains in another thread,
+        then show them in its window
         """
-        for i, fn in enumerate(self.selected_files, start=1):
-            self.progressbar.set(i * (1 / len(self.selected_files)))
-            self.progressbar.update_text_and_show(
-                text=fn.split("/")[-1],
-                color="white",
+        try:
+            sheet, rows = await asyncio.to_thread(
+                self.pages.page, window.item_path, number, sheets
+            )
+            duplicates = await asyncio.to_thread(
+                self.duplicate_rows, window.item_path, sheet
             )
-            await asyncio.sleep(0)
+        except Exception as e:
+            self.post(window.show_error, str(e))
+            return
+        self.post(window.add_page, number, rows, duplicates)
+
+    def duplicate_rows(self, item: str, sheet: str) -> set:
+        """
+        Rows of a sheet of a file marked as duplicates by the last scan (none before the
+        first one), the annotation plan of the index is computed once per index
+        """
+        index = self.session_index
+        if index is None:
+            return set()
+        if self.session_plan is None or self.session_plan[0] is not index:
+            self.session_plan = (index, xl.build_annotation_plan(index, False))
+        marks = self.session_plan[1].get(item, [])
+        return {mark.row for mark in marks if mark.sheet == sheet}
+
+    @staticmethod
+    def session_key_of(files: set, target: xl.ScanTarget) -> tuple:
+        """
+        What a duplicate index depends on: the files (as they are on disk) and the target
+        """
+        stats = []
+        for xp in sorted(files):
+            stat = os.stat(xp)
+            stats.append((xp, stat.st_size, stat.st_mtime_ns))
+        return tuple(stats), target
+
+    # ------ Utilities -----
+    def post(self, func: Callable, *args, **kwargs) -> None:
+        """
+        Queue a widget update from any thread, it is run by poll_ui_queue
+        """
+        self.ui_queue.put((func, args, kwargs))
+
+    def poll_ui_queue(self) -> None:
+        """
+        Run the queued widget updates on the tkinter thread, a failing update (a window
+        closed in the meantime) is reported like any tkinter callback and the next ones
+        still run
+        """
+        while True:
+            try:
+                func, args, kwargs = self.ui_queue.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                func(*args, **kwargs)
+            except Exception:
+                self.report_callback_exception(*sys.exc_info())
+        self.after(50, self.poll_ui_queue)
+
+    def show_status(self, text: str, color: str) -> None:
+        self.progressbar.update_text_and_show(text=text, color=color)
+
+    def show_progress(
+        self, event: "xl.ProgressEvent", metrics: "xl.RunMetrics | None" = None
+    ) -> None:
+        """
+        Move the progressbar with the progress events of xl, the scan fills the
+        first half of the bar and the write phase the second one, with the throughput
+        and the remaining time of the phase when its metrics are given
+        """
+        offset = 0 if event.phase == "scan" else 0.5
+        self.progressbar.set(offset + 0.5 * event.done / max(event.total, 1))
+        text = f"{event.phase}: {os.path.basename(event.path)}"
+        if event.kind == "rows":
+            text = f"{text} ({event.rows} rows)"
+        if metrics is not None:
+            unit = "rows/s" if event.phase == "scan" else "files/s"
+            text = f"{text} - {metrics.throughput(event.phase):,.1f} {unit}"
+            eta = metrics.eta(event.phase)
+            if eta is not None:
+                text = f"{text}, ETA {eta:.0f} s"
+        self.show_status(text, "white")
 
 
 if __name__ == "__main__":
+    # scanning workers are spawned processes, needed for the frozen (packaged) executable
+    multiprocessing.freeze_support()
     # as to documentation of the tkinter async package
     app = App()
     tae.start()
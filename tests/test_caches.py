@@ -0,0 +1,66 @@
+import xl
+
+
+def _cache_with_two_files(tmp_path, **kwargs):
+    cache = xl.ScanCache(str(tmp_path / "scans.sqlite"), **kwargs)
+    paths = []
+    for name, content in [("a.xlsx", b"first"), ("b.xlsx", b"second")]:
+        xp = tmp_path / name
+        xp.write_bytes(content)
+        paths.append(str(xp))
+        key, parts = cache.lookup(str(xp))
+        assert parts is None
+        cache.store(key, [name], [str(xp)])
+    cache.commit()
+    return cache, paths
+
+
+def _count(cache, table):
+    return cache._db.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+
+def test_invalidate_keeps_the_scans_of_the_other_files(tmp_path):
+    cache, (a, b) = _cache_with_two_files(tmp_path)
+    cache.invalidate([a])
+    assert cache.lookup(a)[1] is None
+    assert cache.lookup(b)[1] == ["b.xlsx"]
+    cache.close()
+
+
+def test_eviction_forgets_the_files_of_the_evicted_scans(tmp_path):
+    cache, (a, b) = _cache_with_two_files(tmp_path, max_bytes=0)
+    assert _count(cache, "scans") == 0
+    assert _count(cache, "files") == 0
+    assert cache.lookup(a)[1] is None
+    cache.close()
+
+
+def test_workbooks_too_big_for_the_cache_are_not_loaded(tmp_path):
+    from openpyxl import Workbook
+
+    wb = Workbook()
+    for i in range(1000):
+        wb.active.append([f"09{i:09d}", "Tehran"])
+    xp = str(tmp_path / "customers.xlsx")
+    wb.save(xp)
+    assert xl.WorkbookCache.estimate(xp) == 2000 * xl._WORKBOOK_CELL_BYTES
+
+    small = xl.WorkbookCache(max_bytes=1000 * xl._WORKBOOK_CELL_BYTES)
+    assert small.load(xp) is None
+    # the scan streams the workbook instead
+    index = xl.get_files_values([xp], read_only=False, workbooks=small)
+    assert len(index) == 1000 and len(small) == 0
+
+    big = xl.WorkbookCache()
+    assert big.load(xp) is not None and len(big) == 1
+
+
+def test_paths_holding_a_pipe_are_cached_without_hashing(tmp_path):
+    folder = tmp_path / "2024|q1"
+    folder.mkdir()
+    cache, (a, b) = _cache_with_two_files(folder, hash_contents=False)
+    assert cache.lookup(a)[1] == ["a.xlsx"]
+    cache.invalidate([a])
+    assert cache.lookup(a)[1] is None
+    assert cache.lookup(b)[1] == ["b.xlsx"]
+    cache.close()
@@ -0,0 +1,22 @@
+import pytest
+from openpyxl import Workbook
+
+import cli
+
+
+@pytest.mark.parametrize("jobs", ["1", "2"])
+def test_unreadable_workbook_is_reported_with_its_path(tmp_path, capsys, jobs):
+    wb = Workbook()
+    wb.active.append(["0912"])
+    wb.save(tmp_path / "good.xlsx")
+    broken = tmp_path / "broken.xlsx"
+    broken.write_bytes(b"not a zip")
+
+    assert cli.main([str(tmp_path), "--jobs", jobs]) == cli.EXIT_ERROR
+    assert f"error: {broken}: " in capsys.readouterr().err
+
+
+def test_registry_is_rejected_with_a_memory_budget(tmp_path):
+    with pytest.raises(SystemExit) as error:
+        cli.parse_args([str(tmp_path), "--registry", "r.db", "--memory-budget", "1000"])
+    assert error.value.code == cli.EXIT_ERROR
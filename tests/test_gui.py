@@ -0,0 +1,28 @@
+import queue
+from types import SimpleNamespace
+
+import pytest
+
+gui = pytest.importorskip("gui")
+
+
+def test_ui_queue_keeps_running_after_a_failing_update():
+    done, errors, scheduled = [], [], []
+    app = SimpleNamespace(
+        ui_queue=queue.Queue(),
+        report_callback_exception=lambda *exc: errors.append(exc[0]),
+        after=lambda ms, func: scheduled.append((ms, func)),
+    )
+    app.poll_ui_queue = lambda: gui.App.poll_ui_queue(app)
+
+    def closed_window() -> None:
+        raise RuntimeError("window closed")
+
+    app.ui_queue.put((closed_window, (), {}))
+    app.ui_queue.put((done.append, (1,), {}))
+    gui.App.poll_ui_queue(app)
+    assert (
+        done == [1]
+        and errors == [RuntimeError]
+        and scheduled == [(50, app.poll_ui_queue)]
+    )
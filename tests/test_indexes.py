@@ -0,0 +1,103 @@
+from array import array
+
+import pytest
+
+import xl
+
+np = pytest.importorskip("numpy")
+
+
+def _index(cls, files: list[list]):
+    index = cls()
+    for i, values in enumerate(files):
+        source_id = index.intern_source(index.intern(f"{i}.xlsx"))
+        # the partial index of the file: its distinct values with their rows
+        found: dict = {}
+        for row, value in enumerate(values, start=1):
+            found.setdefault(value, []).append(row)
+        counts = array("I", map(len, found.values()))
+        rows = array("I", [row for r in found.values() for row in r])
+        index.add_file(source_id, list(found), counts, rows)
+    return index
+
+
+def test_columnar_index_matches_duplicate_index_on_long_and_mixed_values():
+    files = [
+        [
+            "Tehran branch customer list",
+            "09121234567",
+            "0" * 18,
+            "1" * 19,
+            "12345678901234567890123",
+            "",
+            "0912 123",
+            42,
+            3.5,
+            "۰۹۱۲",
+        ],
+        [
+            "Tehran branch customer list",
+            "09121234567",
+            "0" * 18,
+            "1" * 19,
+            "12345678901234567890123",
+            "09121234567",
+            42,
+            "42",
+        ],
+    ]
+    columnar = _index(xl.ColumnarIndex, files)
+    reference = _index(xl.DuplicateIndex, files)
+    assert columnar == reference
+    assert sorted(map(str, columnar)) == sorted(map(str, reference))
+    for value in reference:
+        assert columnar.count(value) == reference.count(value)
+        assert columnar.is_duplicate(value) == reference.is_duplicate(value)
+
+
+def _workbooks(tmp_path) -> list[str]:
+    from openpyxl import Workbook
+
+    paths = []
+    for i, values in enumerate(
+        [
+            ["0912", "Tehran branch customer list", 42, "0935", "0912"],
+            ["0935", 42, None, "0912", "۰۹۱۲"],
+            ["0936", "Tehran branch customer list"],
+        ]
+    ):
+        wb = Workbook()
+        for value in values:
+            wb.active.append([value])
+        paths.append(str(tmp_path / f"{i}.xlsx"))
+        wb.save(paths[-1])
+    return paths
+
+
+@pytest.mark.parametrize("engine", ["openpyxl", "xml"])
+def test_numpy_backend_matches_dict_backend(tmp_path, engine):
+    paths = _workbooks(tmp_path)
+    columnar = xl.get_files_values(paths, engine=engine, backend="numpy")
+    reference = xl.get_files_values(paths, engine=engine)
+    assert columnar == reference
+    assert sorted(map(str, columnar.duplicates())) == sorted(
+        map(str, reference.duplicates())
+    )
+    assert xl.build_annotation_plan(columnar, True) == xl.build_annotation_plan(
+        reference, True
+    )
+
+
+def test_parallel_scan_matches_single_process_scan(tmp_path):
+    paths = _workbooks(tmp_path)
+    assert xl.get_files_values(paths, jobs=3) == xl.get_files_values(paths)
+
+
+def test_spilled_duplicates_match_in_memory_duplicates(tmp_path):
+    paths = _workbooks(tmp_path)
+    spilled = xl.get_files_values(paths, memory_budget=1, spill_dir=str(tmp_path))
+    reference = xl.get_files_values(paths)
+    assert spilled.duplicates_only
+    assert sorted(map(str, spilled.duplicates())) == sorted(
+        map(str, reference.duplicates())
+    )
@@ -0,0 +1,30 @@
+import pytest
+from openpyxl import Workbook
+
+import xl
+
+
+def _save(path, values) -> str:
+    wb = Workbook()
+    for value in values:
+        wb.active.append([value])
+    wb.save(path)
+    return str(path)
+
+
+def test_numbers_of_an_earlier_run_are_seen(tmp_path):
+    day1 = [_save(tmp_path / "day1.xlsx", ["0912", "0935"])]
+    day2 = [_save(tmp_path / "day2.xlsx", ["0912", "0936"])]
+    with xl.NumberRegistry(str(tmp_path / "numbers.sqlite")) as registry:
+        assert registry.record(xl.get_files_values(day1), day1, "2025-03-01") == {}
+        history = registry.record(xl.get_files_values(day2), day2, "2025-03-02")
+        assert history == {"0912": [(day1[0], "2025-03-01")]}
+        assert len(registry) == 2
+
+
+def test_spilled_index_cannot_be_ingested(tmp_path):
+    day1 = [_save(tmp_path / "day1.xlsx", ["0912", "0935"])]
+    index = xl.get_files_values(day1, memory_budget=1000)
+    with xl.NumberRegistry(str(tmp_path / "numbers.sqlite")) as registry:
+        with pytest.raises(ValueError):
+            registry.ingest(index, day1)
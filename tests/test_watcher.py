@@ -0,0 +1,83 @@
+import asyncio
+import threading
+
+import pytest
+from openpyxl import Workbook
+
+import xl
+
+
+def _save(path, values) -> None:
+    wb = Workbook()
+    for value in values:
+        wb.active.append([value])
+    wb.save(path)
+
+
+def test_unreadable_file_is_skipped_and_retried(tmp_path):
+    folder, output = tmp_path / "in", tmp_path / "out"
+    folder.mkdir()
+    _save(folder / "a.xlsx", ["0912", "0935"])
+    (folder / "b.xlsx").write_bytes(b"half copied")
+    watcher = xl.FolderWatcher(folder, output, settle=0)
+
+    update = asyncio.run(watcher.poll())
+    assert [e.path for e in update.errors] == [str(folder / "b.xlsx")]
+    assert update.scanned == [str(folder / "a.xlsx")]
+    assert (output / "a.xlsx").exists()
+
+    _save(folder / "b.xlsx", ["0912"])
+    update = asyncio.run(watcher.poll())
+    assert update.errors == []
+    assert update.scanned == [str(folder / "b.xlsx")]
+    assert update.written == [str(folder / "a.xlsx"), str(folder / "b.xlsx")]
+    assert watcher.index.is_duplicate("0912")
+
+
+def test_copies_of_a_cancelled_poll_are_written_by_the_next(tmp_path):
+    folder, output = tmp_path / "in", tmp_path / "out"
+    folder.mkdir()
+    _save(folder / "a.xlsx", ["0912"])
+    _save(folder / "b.xlsx", ["0912"])
+    cancel = threading.Event()
+
+    def on_progress(event: xl.ProgressEvent) -> None:
+        if event.phase == "write" and event.kind == "file_started":
+            cancel.set()
+
+    watcher = xl.FolderWatcher(folder, output, settle=0, on_progress=on_progress)
+    with pytest.raises(xl.Cancelled):
+        asyncio.run(watcher.poll(cancel))
+    assert (output / "a.xlsx").exists() and not (output / "b.xlsx").exists()
+
+    watcher.on_progress = None
+    update = asyncio.run(watcher.poll())
+    assert update.scanned == []
+    assert update.written == [str(folder / "b.xlsx")]
+    assert (output / "b.xlsx").exists()
+
+
+def test_copies_are_rewritten_when_a_value_moves_to_another_sheet(tmp_path):
+    folder, output = tmp_path / "in", tmp_path / "out"
+    folder.mkdir()
+
+    def save_sheets(path, sheets) -> None:
+        wb = Workbook()
+        wb.remove(wb.active)
+        for name, values in sheets.items():
+            ws = wb.create_sheet(name)
+            for value in values:
+                ws.append([value])
+        wb.save(path)
+
+    save_sheets(folder / "a.xlsx", {"S1": ["0912"], "S2": ["0935"]})
+    _save(folder / "b.xlsx", ["0912"])
+    target = xl.ScanTarget(sheets=("S1", "S2", "Sheet"))
+    watcher = xl.FolderWatcher(
+        folder, output, show_dup_origin=True, target=target, settle=0
+    )
+    asyncio.run(watcher.poll())
+
+    save_sheets(folder / "a.xlsx", {"S1": ["0935"], "S2": ["0912"]})
+    update = asyncio.run(watcher.poll())
+    assert update.written == [str(folder / "a.xlsx"), str(folder / "b.xlsx")]
@@ -0,0 +1,117 @@
+import asyncio
+import stat
+from pathlib import Path
+
+import pytest
+from openpyxl import Workbook, load_workbook
+
+import xl
+
+
+def _values(path) -> list[tuple]:
+    wb = load_workbook(path)
+    return [row for ws in wb.worksheets for row in ws.iter_rows(values_only=True)]
+
+
+def _workbook(path) -> str:
+    wb = Workbook()
+    ws = wb.active
+    for row in [
+        ("0912", "Ali", "Tehran"),
+        ("0935", "Sara", "Shiraz"),
+        ("0912", "Reza", "Tabriz", "extra"),
+        ("0936", None, "Karaj"),
+    ]:
+        ws.append(row)
+    wb.save(path)
+    return str(path)
+
+
+def test_streamed_copy_matches_openpyxl_writer(tmp_path):
+    xp = _workbook(tmp_path / "customers.xlsx")
+    index = xl.get_files_values({xp})
+    for show_dup_origin in (False, True):
+        marks = xl.build_annotation_plan(index, show_dup_origin)[xp]
+        xl.write_xlsx_marks(xp, marks, str(tmp_path / "full.xlsx"))
+        xl.stream_xlsx_marks(xp, marks, str(tmp_path / "streamed.xlsx"))
+        streamed = _values(tmp_path / "streamed.xlsx")
+        assert streamed == _values(tmp_path / "full.xlsx")
+        # the cells right of the duplicate are kept, only the labels replace values
+        label = "customers.xlsx" if show_dup_origin else None
+        assert streamed[0][:3] == ("0912", label or "Ali", "Tehran")
+        assert streamed[2] == ("0912", label or "Reza", "Tabriz", "extra")
+
+
+def test_replaced_files_keep_their_mode(tmp_path):
+    destination = tmp_path / "out.txt"
+    xl._replace_atomically(str(destination), lambda tmp: Path(tmp).write_text("new"))
+    assert stat.S_IMODE(destination.stat().st_mode) == 0o666 & ~xl._UMASK
+
+    destination.chmod(0o640)
+    xl._replace_atomically(str(destination), lambda tmp: Path(tmp).write_text("again"))
+    assert destination.read_text() == "again"
+    assert stat.S_IMODE(destination.stat().st_mode) == 0o640
+
+
+def test_patched_workbook_uses_the_compresslevel(tmp_path):
+    wb = Workbook()
+    for i in range(2000):
+        wb.active.append([f"09{i % 1500:09d}", f"customer {i}", "Tehran"])
+    xp = str(tmp_path / "customers.xlsx")
+    wb.save(xp)
+    marks = xl.build_annotation_plan(xl.get_files_values({xp}), False)[xp]
+
+    sizes = {}
+    for level in (0, 9):
+        destination = tmp_path / f"level{level}.xlsx"
+        xl.patch_xlsx_marks(xp, marks, str(destination), compresslevel=level)
+        sizes[level] = destination.stat().st_size
+    assert sizes[0] > 2 * sizes[9]
+
+
+def test_patched_in_place(tmp_path):
+    xp = _workbook(tmp_path / "customers.xlsx")
+    marks = xl.build_annotation_plan(xl.get_files_values({xp}), False)[xp]
+    expected = tmp_path / "copy.xlsx"
+    xl.write_xlsx_marks(xp, marks, str(expected))
+    xl.patch_xlsx_marks(xp, marks, xp)
+    assert _values(xp) == _values(expected)
+
+
+def test_csv_rewritten_in_place_is_marked_once(tmp_path):
+    xp = tmp_path / "c.csv"
+    xp.write_text("0912,x\n0935,y\n0912,z\n")
+    for _ in range(2):
+        index = xl.get_files_values({str(xp)})
+        marks = xl.build_annotation_plan(index, True)[str(xp)]
+        xl.write_csv_marks(str(xp), marks, str(xp))
+    assert xp.read_text().splitlines() == [
+        "0912,x,duplicate,c.csv",
+        "0935,y",
+        "0912,z,duplicate,c.csv",
+    ]
+
+
+def test_xls_output_never_replaces_an_xlsx(tmp_path):
+    assert xl.output_path(str(tmp_path / "a.xls")) == str(tmp_path / "a.xls.xlsx")
+    assert xl.output_path(str(tmp_path / "a.csv")) == str(tmp_path / "a.csv")
+
+
+def test_copies_that_would_overwrite_each_other_are_refused(tmp_path):
+    paths = []
+    for folder in ("march", "april"):
+        (tmp_path / folder).mkdir()
+        paths.append(_workbook(tmp_path / folder / "customers.xlsx"))
+    index = xl.get_files_values(paths)
+    with pytest.raises(xl.FileError) as error:
+        asyncio.run(
+            xl.edit_files_values(
+                index,
+                paths,
+                make_copy=True,
+                show_dup_origin=False,
+                output_dir=tmp_path / "data",
+            )
+        )
+    assert error.value.path == paths[1]
+    assert not (tmp_path / "data" / "customers.xlsx").exists()
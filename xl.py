@@ -1,130 +1,3800 @@
+from __future__ import annotations
+
 import asyncio
+import cProfile
+import csv
+import functools
+import hashlib
+import importlib
+import io
+import itertools
+import os
+import pickle
+import posixpath
+import pstats
 import random
+import re
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import tracemalloc
+import xml.etree.ElementTree as ET
+import zipfile
+import zlib
+from array import array
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager, nullcontext
 from pathlib import Path
+from typing import TYPE_CHECKING, Callable, NamedTuple
+from xml.sax.saxutils import escape as xml_escape
+
+try:
+    import resource
+except ImportError:  # windows, the peak resident memory is not measured
+    resource = None
+
+# openpyxl, rich and the optional numpy and xlrd are only imported once a run needs them,
+# so that importing xl (and starting the gui) stays fast
+if TYPE_CHECKING:
+    from openpyxl import Workbook
+
+# optional dependencies, imported on first use by _optional_module
+_LAZY_MODULES = {
+    "np": "numpy",  # only needed by the numpy backend
+    "xlrd": "xlrd",  # only needed to read .xls files
+}
+
+
+@functools.cache
+def _optional_module(name: str):
+    """
+    Import an optional dependency on first use, None when it is not installed
+    """
+    try:
+        return importlib.import_module(name)
+    except ImportError:
+        return None
+
+
+def __getattr__(name: str):
+    # xl.np, xl.xlrd and xl.DUPLICATE_FONT are resolved lazily
+    if name in _LAZY_MODULES:
+        return _optional_module(_LAZY_MODULES[name])
+    if name == "DUPLICATE_FONT":
+        return _duplicate_font()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# typical Iran's cellphone number prefixes, each followed by 7 digits
+PHONE_PREFIXES = ("12", "35", "36", "02", "18")
+_PHONE_SPACE = len(PHONE_PREFIXES) * 10**7
+# multiplier of the permutation of the phone numbers, coprime with _PHONE_SPACE
+_PHONE_STRIDE = 7_919_993
+
+
+def phone_numbers(indices, offset: int = 0) -> list[str]:
+    """
+    Map indices to phone numbers with a fixed permutation of the 5 x 10**7 numbers of
+    PHONE_PREFIXES: distinct indices (below 5 x 10**7) always give distinct numbers
+
+    Input:
+       - indices: iterable of int
+       - offset: int -> shifts the permutation, a different offset gives other numbers
+
+    Returns:
+       - list[str] -> the numbers, "09" + prefix + 7 digits
+    """
+
+    prefixes, space, stride = PHONE_PREFIXES, _PHONE_SPACE, _PHONE_STRIDE
+    numbers = []
+    for index in indices:
+        n = (index * stride + offset) % space
+        numbers.append(f"09{prefixes[n // 10**7]}{n % 10**7:07d}")
+    return numbers
+
+
+def _generate_file(
+    path: str,
+    fmt: str,
+    rows: int,
+    start: int,
+    count: int,
+    distinct: int,
+    cross_file: float,
+    seed: str,
+    offset: int,
+) -> str:
+    """
+    Write a single file of generate_dataset: the numbers start to start + count - 1
+    (in the global numbering) once each, the rest of the rows repeating numbers of this
+    file or, for the cross_file share of them, of the other files
+    """
+    rng = random.Random(seed)
+    repeats = rows - count
+    others = distinct - count
+    cross = round(repeats * cross_file) if others else 0
+    if not count:
+        cross = repeats
+    indices = list(range(start, start + count))
+    indices += (
+        rng.choices(range(start, start + count), k=repeats - cross) if count else []
+    )
+    # numbers of the other files, below or above the range of this one
+    indices += [
+        i if i < start else i + count for i in rng.choices(range(others), k=cross)
+    ]
+    rng.shuffle(indices)
+    numbers = phone_numbers(indices, offset)
+
+    if fmt == "csv":
+        with open(path, "w", newline="") as f:
+            f.write("\r\n".join(numbers) + "\r\n" if numbers else "")
+        return path
+
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    for number in numbers:
+        ws.append((number,))
+    wb.save(path)
+    return path
+
+
+def generate_dataset(
+    folder: str | Path = "months",
+    files: int = 31,
+    rows: int = 400,
+    distinct: int | None = None,
+    dup_ratio: float = 0.0,
+    cross_file: float = 1.0,
+    fmt: str = "xlsx",
+    jobs: int | None = None,
+    seed: int | None = None,
+) -> list[str]:
+    """
+    Generate files of random phone numbers (in column A) with an exact number of
+    duplicates, the files are written in parallel
+
+    Every distinct number is placed once in one file, the distinct numbers being spread
+    evenly over the files, and the remaining cells repeat one of them.
+
+    Input:
+       - folder: str | Path -> created if not found, the files are named 1.xlsx, 2.xlsx...
+       - files: int
+       - rows: int -> numbers per file
+       - distinct: int | None -> exact number of distinct numbers (cardinality)
+       - dup_ratio: float -> share of the cells repeating another cell, used when distinct
+       is None (distinct = cells - round(cells * dup_ratio))
+       - cross_file: float -> share of the repeated cells whose number comes from another
+       file, the others repeat a number of their own file
+       - fmt: str -> "xlsx" (write-only workbooks) or "csv"
+       - jobs: int | None -> number of worker processes (None for one per cpu core)
+       - seed: int | None -> same seed and knobs, same files
+
+    Returns:
+       - list[str] -> the paths of the files
+    """
+
+    if fmt not in ("xlsx", "csv"):
+        raise ValueError(f"unknown format: {fmt}")
+    if not 0 <= cross_file <= 1 or not 0 <= dup_ratio < 1:
+        raise ValueError("dup_ratio and cross_file must be between 0 and 1")
+    cells = files * rows
+    if distinct is None:
+        distinct = cells - round(cells * dup_ratio)
+    if cells and not 0 < distinct <= min(cells, _PHONE_SPACE):
+        raise ValueError(f"distinct must be between 1 and {min(cells, _PHONE_SPACE)}")
+
+    if seed is None:
+        seed = random.randrange(2**32)
+    offset = random.Random(seed).randrange(_PHONE_SPACE)
+    folder = Path(folder)
+    folder.mkdir(parents=True, exist_ok=True)
+
+    tasks = []
+    start = 0
+    for i in range(files):
+        count = distinct // files + (i < distinct % files)
+        path = str(folder / f"{i + 1}.{fmt}")
+        seed_i = f"{seed}:{i}"
+        tasks.append(
+            (path, fmt, rows, start, count, distinct, cross_file, seed_i, offset)
+        )
+        start += count
+
+    from rich.progress import track
+
+    jobs = min(jobs or os.cpu_count() or 1, len(tasks))
+    description = "generating test cases         "
+    if jobs <= 1:
+        return [_generate_file(*task) for task in track(tasks, description=description)]
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(_generate_file, *task) for task in tasks]
+        for future in track(
+            as_completed(futures), total=len(futures), description=description
+        ):
+            future.result()
+    return [task[0] for task in tasks]
+
+
+def generate_days(days: int, numbers: int, dup_ratio: float = 0.05, **kwargs) -> None:
+    """
+    Generate days[int] files with numbers[int] amount of random numbers.
+
+    Input:
+       - days: int
+       - numbers: int
+       - dup_ratio: float, **kwargs -> see generate_dataset
+
+    Returns:
+       - None -> saves the output in .xlsx files in "months" folder (create if not found) in the current directory
+
+    """
+
+    generate_dataset(
+        Path(".") / "months", files=days, rows=numbers, dup_ratio=dup_ratio, **kwargs
+    )
+
+
+# reader and writer of every supported file type, keyed by lowercase suffix
+READERS: dict[str, Callable] = {}
+WRITERS: dict[str, tuple[Callable, str | None]] = {}
+
+
+def register_reader(*suffixes: str) -> Callable:
+    """
+    Decorator registering a reader for files with the given suffixes
+
+    A reader is called as reader(xp, read_only, sheets, max_col) and lazily yields a
+    (sheet name, rows) pair for each selected sheet, rows iterating over the tuples of the
+    values of every row (None for the empty cells), see read_xlsx_sheets
+    """
+
+    def decorator(reader: Callable) -> Callable:
+        for suffix in suffixes:
+            READERS[suffix.lower()] = reader
+        return reader
+
+    return decorator
+
+
+def register_writer(*suffixes: str, output_suffix: str | None = None) -> Callable:
+    """
+    Decorator registering a writer for files with the given suffixes
+
+    A writer is called as writer(xp, marks, destination), see apply_annotation_plan.
+    output_suffix is appended to the destination of the formats that cannot be written
+    back (a.xls is saved as a.xls.xlsx, so that it never replaces an a.xlsx)
+    """
+
+    def decorator(writer: Callable) -> Callable:
+        for suffix in suffixes:
+            WRITERS[suffix.lower()] = (writer, output_suffix)
+        return writer
+
+    return decorator
+
+
+def _suffix(xp: str) -> str:
+    return Path(xp).suffix.lower()
+
+
+def _reader(xp: str) -> Callable:
+    reader = READERS.get(_suffix(xp))
+    if reader is None:
+        raise ValueError(f"unsupported file type: {xp}")
+    return reader
+
+
+def _selected_sheets(active, named: list[tuple[str, object]], sheets) -> list:
+    """
+    Return the (name, sheet) pairs picked by the sheets of a ScanTarget, the active sheet
+    has an empty name when sheets is None
+    """
+    if sheets is None:
+        return [("", active)]
+    if sheets == "*":
+        return named
+    wanted = {sheets} if isinstance(sheets, str) else set(sheets)
+    return [(name, sheet) for name, sheet in named if name in wanted]
+
+
+@register_reader(".xlsx", ".xlsm", ".xltx", ".xltm")
+def read_xlsx_sheets(
+    xp: str,
+    read_only: bool = True,
+    sheets: str | tuple[str, ...] | None = None,
+    max_col: int | None = 1,
+    workbooks: "WorkbookCache | None" = None,
+):
+    """
+    Lazily yield the selected sheets of a workbook with an iterator over their rows
+
+    Input:
+       - xp: str -> path of the .xlsx file
+       - read_only: bool -> stream the sheets with openpyxl's read-only reader so memory stays
+       constant regardless of the number of rows, instead of building the full cell model
+       - sheets: str | tuple | None -> see ScanTarget
+       - max_col: int | None -> last column read (None for all of them)
+       - workbooks: WorkbookCache | None -> fully load the workbook through this cache
+       (read_only is ignored) so that the write phase can reuse it, the workbooks too big
+       for the cache are streamed
+
+    Returns:
+       - generator of (sheet name, iterator of row value tuples starting at column A)
+    """
+
+    from openpyxl import load_workbook
+
+    with _step("load"):
+        wb = workbooks.load(xp) if workbooks is not None else None
+        if wb is not None:
+            read_only = False
+        else:
+            read_only = read_only or workbooks is not None
+            wb = load_workbook(filename=xp, read_only=read_only, data_only=True)
+    try:
+        named = [(ws.title, ws) for ws in wb.worksheets]
+        for name, ws in _selected_sheets(wb.active, named, sheets):
+            # with max_col set every row (even the missing ones) is a max_col-tuple
+            yield name, ws.iter_rows(min_col=1, max_col=max_col, values_only=True)
+    finally:
+        # read-only workbooks keep the zip archive open until closed
+        if read_only:
+            wb.close()
+
+
+def _csv_format(xp: str) -> tuple[str, str]:
+    """
+    Return the (encoding, delimiter) of a delimited text file, a BOM is kept on rewrite
+    """
+    with open(xp, "rb") as f:
+        bom = f.read(3) == b"\xef\xbb\xbf"
+    delimiter = "," if _suffix(xp) == ".csv" else "\t"
+    return ("utf-8-sig" if bom else "utf-8"), delimiter
+
+
+@register_reader(".csv", ".tsv", ".tab")
+def read_csv_sheets(
+    xp: str,
+    read_only: bool = True,
+    sheets: str | tuple[str, ...] | None = None,
+    max_col: int | None = 1,
+):
+    """
+    Lazily yield the records of a comma (.csv) or tab (.tsv, .tab) separated file as its
+    single unnamed sheet, the values are kept as text like the cells of the generated
+    workbooks
+
+    Input:
+       - xp: str -> path of the file
+       - read_only: bool -> unused, text files are always streamed
+       - sheets: str | tuple | None -> unused, see ScanTarget
+       - max_col: int | None -> last field read (None for all of them)
+
+    Returns:
+       - generator of a single ("", iterator of record tuples), empty fields are None
+    """
+
+    encoding, delimiter = _csv_format(xp)
+    with open(xp, newline="", encoding=encoding) as f:
+        records = csv.reader(f, delimiter=delimiter)
+        yield "", (tuple(v or None for v in record[:max_col]) for record in records)
+
+
+def _xls_book(xp: str):
+    """
+    Open a .xls workbook, returns it with its active sheet
+    """
+    xlrd = _optional_module("xlrd")
+    if xlrd is None:
+        raise ImportError("reading .xls files requires xlrd (pip install xlrd)")
+    book = xlrd.open_workbook(xp)
+    # the displayed sheet of the workbook window, like openpyxl's active sheet
+    for sheet in book.sheets():
+        if sheet.sheet_visible:
+            return book, sheet
+    return book, book.sheet_by_index(0)
+
+
+def _xls_value(book, cell):
+    """
+    Convert a xlrd cell to the value openpyxl would give for the same cell in a .xlsx
+    """
+    xlrd = _optional_module("xlrd")
+    if cell.ctype in (xlrd.XL_CELL_EMPTY, xlrd.XL_CELL_BLANK):
+        return None
+    if cell.ctype == xlrd.XL_CELL_NUMBER:
+        # numbers are all floats in .xls files
+        return int(cell.value) if cell.value.is_integer() else cell.value
+    if cell.ctype == xlrd.XL_CELL_DATE:
+        return xlrd.xldate_as_datetime(cell.value, book.datemode)
+    if cell.ctype == xlrd.XL_CELL_BOOLEAN:
+        return bool(cell.value)
+    if cell.ctype == xlrd.XL_CELL_ERROR:
+        return xlrd.error_text_from_code.get(cell.value)
+    return cell.value or None
+
+
+@register_reader(".xls")
+def read_xls_sheets(
+    xp: str,
+    read_only: bool = True,
+    sheets: str | tuple[str, ...] | None = None,
+    max_col: int | None = 1,
+):
+    """
+    Lazily yield the selected sheets of a legacy .xls workbook with an iterator over their
+    rows (needs xlrd, the whole workbook is decoded by xlrd at once)
+
+    Input:
+       - xp: str -> path of the .xls file
+       - read_only: bool -> unused
+       - sheets: str | tuple | None -> see ScanTarget
+       - max_col: int | None -> last column read (None for all of them)
+
+    Returns:
+       - generator of (sheet name, iterator of row value tuples starting at column A)
+    """
+
+    with _step("load"):
+        book, active = _xls_book(xp)
+    try:
+        named = [(sheet.name, sheet) for sheet in book.sheets()]
+        for name, sheet in _selected_sheets(active, named, sheets):
+            yield name, (
+                tuple(_xls_value(book, cell) for cell in sheet.row_slice(r, 0, max_col))
+                for r in range(sheet.nrows)
+            )
+    finally:
+        book.release_resources()
+
+
+class Cancelled(Exception):
+    """
+    Raised by get_files_values and edit_files_values when their cancel event is set
+    """
+
+
+class FileError(Exception):
+    """
+    Raised by get_files_values and edit_files_values when a file cannot be read or
+    written, the original exception is its __cause__
+
+    Attributes:
+        - path: str -> the file that failed
+    """
+
+    def __init__(self, path: str, error: Exception) -> None:
+        super().__init__(f"{path}: {error or type(error).__name__}")
+        self.path = path
+
+
+@contextmanager
+def _failing_file(xp: str):
+    """
+    Turn the errors raised in the block into a FileError about xp
+    """
+    try:
+        yield
+    except (Cancelled, FileError):
+        raise
+    except Exception as e:
+        raise FileError(xp, e) from e
+
+
+class ProgressEvent(NamedTuple):
+    """
+    Progress notification sent to the on_progress callbacks of the scan and write phases
+
+    Attributes:
+        - kind: str -> "file_started", "file_finished" or "rows" (rows read so far in path)
+        - phase: str -> "scan" or "write"
+        - path: str
+        - done: int -> files finished in the phase
+        - total: int -> files in the phase
+        - rows: int
+    """
+
+    kind: str
+    phase: str
+    path: str
+    done: int
+    total: int
+    rows: int = 0
+
+
+# rows read between two progress notifications / cancellation checks
+PROGRESS_ROWS = 16384
+
+# step timings of the file being scanned or written by the current thread, see _measured
+_steps = threading.local()
+
+
+@contextmanager
+def _step(name: str):
+    """
+    Add the time spent in the block to the step name of the file being measured
+    (does nothing outside of _measured)
+    """
+    timings = getattr(_steps, "timings", None)
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+
+
+def _measured(rest: str, func: Callable, *args, **kwargs) -> tuple[object, dict]:
+    """
+    Call func (in a worker process or thread) and return its result with the time spent
+    in the steps marked with _step, the time outside of them is counted as the rest step
+    """
+    _steps.timings = timings = {}
+    start = time.perf_counter()
+    try:
+        result = func(*args, **kwargs)
+    finally:
+        _steps.timings = None
+    timings[rest] = time.perf_counter() - start - sum(timings.values())
+    return result, timings
+
+
+def _peak_rss_mb() -> float | None:
+    """
+    Peak resident memory of this process and of its finished worker processes
+    """
+    if resource is None:
+        return None
+    peak = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    # kilobytes on linux, bytes on macos
+    return peak / (2**20 if os.uname().sysname == "Darwin" else 2**10)
+
+
+class RunMetrics:
+    """
+    Timings, throughput and memory of the scan and write phases of a run, filled by
+    get_files_values and edit_files_values when given as their metrics argument.
+
+    Every phase records its wall time and the time its files spent in each step: "load"
+    (opening the file), "read" (going through its cells) and "index" (merging its values)
+    for the scan, "load", "style" and "save" for the write. The steps are measured where
+    the files are processed (worker processes included) and sent back with the results.
+    The progress events of the phases give the live throughput and ETA.
+
+    Attributes:
+        - phases: dict[str, dict] -> wall time, files, rows, step totals and peak memory
+        of every phase
+        - files: dict[str, dict] -> the step timings (and scanned rows) of every file, by phase
+        - trace_memory: bool -> also measure the peak of the python allocations with
+        tracemalloc (slower, the worker processes are not traced)
+        - profile: bool -> run the phases under cProfile (the calling thread only: the worker
+        processes are not profiled, the single process writes are run on the event loop)
+
+    Methods:
+        - __init__(self, trace_memory: bool, profile: bool) -> None
+        - phase(self, name: str) -> context manager measuring a phase
+        - add_timings(self, phase: str, timings: dict, xp: str | None) -> None
+        - observe(self, event: ProgressEvent) -> None
+        - throughput(self, phase: str) -> float (rows/s for the scan, files/s otherwise)
+        - eta(self, phase: str) -> float | None (seconds)
+        - report(self, top: int) -> dict
+        - dump_profile(self, path: str) -> None
+    """
+
+    def __init__(self, trace_memory: bool = False, profile: bool = False) -> None:
+        self.phases: dict[str, dict] = {}
+        self.files: dict[str, dict] = {}
+        self.trace_memory = trace_memory
+        self.profile = profile
+        self._profiler = cProfile.Profile() if profile else None
+        # start of the phases being run
+        self._running: dict[str, float] = {}
+        self._progress: dict[str, tuple[int, int]] = {}
+
+    def _phase_stats(self, name: str) -> dict:
+        return self.phases.setdefault(
+            name, {"seconds": 0.0, "files": 0, "rows": 0, "steps": {}}
+        )
+
+    @contextmanager
+    def phase(self, name: str):
+        """
+        Measure the wall time (and memory, profile) of the block as the phase name
+        """
+        stats = self._phase_stats(name)
+        tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        if self._profiler is not None:
+            self._profiler.enable()
+        self._running[name] = time.perf_counter()
+        try:
+            yield self
+        finally:
+            stats["seconds"] += time.perf_counter() - self._running.pop(name)
+            if self._profiler is not None:
+                self._profiler.disable()
+            if tracing:
+                stats["peak_traced_mb"] = tracemalloc.get_traced_memory()[1] / 2**20
+                tracemalloc.stop()
+            stats["peak_rss_mb"] = _peak_rss_mb()
+
+    def add_timings(self, phase: str, timings: dict, xp: str | None = None) -> None:
+        """
+        Add step timings (see _measured) to a phase and to the file xp when given
+        """
+        steps = self._phase_stats(phase)["steps"]
+        for step, seconds in timings.items():
+            steps[step] = steps.get(step, 0.0) + seconds
+        if xp is not None:
+            file_steps = self.files.setdefault(xp, {}).setdefault(phase, {})
+            for step, seconds in timings.items():
+                file_steps[step] = file_steps.get(step, 0.0) + seconds
+
+    def observe(self, event: ProgressEvent) -> None:
+        """
+        Follow the progress events of a phase (called by the phases themselves)
+        """
+        self._progress[event.phase] = (event.done, event.total)
+        if event.kind == "file_finished":
+            stats = self._phase_stats(event.phase)
+            stats["files"] = event.done
+            stats["rows"] += event.rows
+            if event.rows:
+                self.files.setdefault(event.path, {}).setdefault(event.phase, {})[
+                    "rows"
+                ] = event.rows
+
+    def _elapsed(self, phase: str) -> float:
+        stats = self.phases.get(phase)
+        if stats is None:
+            return 0.0
+        if phase in self._running:
+            return stats["seconds"] + time.perf_counter() - self._running[phase]
+        return stats["seconds"]
+
+    def throughput(self, phase: str) -> float:
+        elapsed = self._elapsed(phase)
+        if not elapsed:
+            return 0.0
+        stats = self.phases[phase]
+        return (stats["rows"] or stats["files"]) / elapsed
+
+    def eta(self, phase: str) -> float | None:
+        """
+        Seconds left in the phase at the pace of its finished files (None before the first)
+        """
+        done, total = self._progress.get(phase, (0, 0))
+        if not done:
+            return None
+        return self._elapsed(phase) * (total - done) / done
+
+    def report(self, top: int = 25) -> dict:
+        """
+        Return every measure as a JSON serializable dict, with the top functions by
+        cumulative time when profiling
+        """
+        phases = {}
+        for name, stats in self.phases.items():
+            seconds = stats["seconds"]
+            phases[name] = stats | {
+                "rows_per_s": stats["rows"] / seconds if seconds else None,
+                "files_per_s": stats["files"] / seconds if seconds else None,
+            }
+        report = {"phases": phases, "files": self.files, "peak_rss_mb": _peak_rss_mb()}
+        if self._profiler is not None:
+            entries = pstats.Stats(self._profiler).stats.items()
+            ranked = sorted(entries, key=lambda entry: entry[1][3], reverse=True)[:top]
+            report["profile"] = [
+                {
+                    "function": f"{path}:{line}({func})",
+                    "calls": calls,
+                    "tottime": tottime,
+                    "cumtime": cumtime,
+                }
+                for (path, line, func), (_, calls, tottime, cumtime, _) in ranked
+            ]
+        return report
+
+    def dump_profile(self, path: str) -> None:
+        """
+        Save the cProfile stats (for pstats or snakeviz)
+        """
+        if self._profiler is None:
+            raise ValueError("the run was not profiled")
+        self._profiler.dump_stats(path)
+
+
+class ScanTarget(NamedTuple):
+    """
+    Cells scanned in every file by get_files_values
+
+    Attributes:
+        - sheets: str | tuple[str, ...] | None -> None for the active sheet, "*" for every
+        worksheet or the names of the sheets to scan (the ones missing from a file are
+        skipped, files without sheets like csv have a single unnamed one)
+        - columns: tuple[str, ...] -> column letters ("A", "AB", 1 to 3 capital letters)
+        or header names, matched against the first row of each sheet which is then not
+        scanned (a sheet without the header is skipped)
+        - composite: bool -> the values of the columns of a row make a single key (a tuple)
+        instead of being scanned separately, the rows where they are all empty are skipped
+    """
+
+    sheets: str | tuple[str, ...] | None = None
+    columns: tuple[str, ...] = ("A",)
+    composite: bool = False
+
+
+DEFAULT_TARGET = ScanTarget()
+# (sheet, columns) of the values of a source: the active (or only) sheet has no name
+DEFAULT_SLOT = ("", (1,))
+
+
+class _Entry:
+    """
+    Index entry of a single value: its number of occurrences and where it was found.
+
+    The locations are kept in a single compact unsigned int array made of one block per
+    source (a file and the sheet and columns read in it, see DuplicateIndex.intern_source):
+    [source id, n, row_1, ..., row_n, source id, n, ...]
+    """
+
+    __slots__ = ("count", "postings")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.postings = array("I")
+
+    def blocks(self):
+        """
+        Iterate over the (source id, rows) blocks of the entry
+        """
+        postings = self.postings
+        i = 0
+        while i < len(postings):
+            n = postings[i + 1]
+            yield postings[i], postings[i + 2 : i + 2 + n]
+            i += 2 + n
+
+    def sources(self) -> list[int]:
+        return [source_id for source_id, _ in self.blocks()]
+
+
+class DuplicateIndex:
+    """
+    Index of the values found in a set of files, with their frequency and their locations.
+
+    File paths are interned once to small integer ids, and so are the sources: a file and
+    the (sheet, columns) slot its values were read from. Every value keeps a counter and an
+    array based posting list of the (source, rows) it was found in, so adding the occurrences
+    of a value in a source is a single amortized O(1) array extension.
+
+    Files can be added in any order once interned, two indexes holding the same occurrences
+    compare equal.
+
+    Attributes:
+        - paths: list[str] -> interned file paths, indexed by their id
+        - sources: list[tuple] -> (file id, sheet, columns) of every source, indexed by its id
+        - duplicates_only: bool -> only the duplicated values were kept (see SpillingIndex)
+
+    Methods:
+        - __init__(self) -> None
+        - intern(self, path: str) -> int
+        - intern_source(self, file_id: int, slot: tuple = DEFAULT_SLOT) -> int
+        - add(self, value, source_id: int, rows: array) -> None
+        - add_file(self, source_id: int, values: list, counts: array | None, rows: array) -> None
+        - merge(self, other: DuplicateIndex) -> None
+        - remove_file(self, file_id: int, values) -> None
+        - count(self, value) -> int
+        - is_duplicate(self, value) -> bool
+        - origins(self, value) -> list[str] (in file id order)
+        - locations(self, value) -> list of (source id, rows) tuples (in source order)
+        - duplicates(self) -> iterator of (value, count, locations)
+    """
+
+    def __init__(self) -> None:
+        self.paths: list[str] = []
+        self.sources: list[tuple[int, str, tuple[int, ...]]] = []
+        self._ids: dict[str, int] = {}
+        self._source_ids: dict[tuple, int] = {}
+        self._entries: dict = {}
+        self.duplicates_only = False
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, value) -> bool:
+        return value in self._entries
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, (DuplicateIndex, ColumnarIndex)):
+            return NotImplemented
+        if self.paths != other.paths or len(self) != len(other):
+            return False
+        # source ids depend on the order the files were scanned in
+        return all(
+            self.count(value) == other.count(value)
+            and self._located(value) == other._located(value)
+            for value in self
+        )
+
+    def _located(self, value) -> list[tuple[tuple, list[int]]]:
+        return [(self.sources[i], rows.tolist()) for i, rows in self.locations(value)]
+
+    def _by_source(self, blocks) -> list[tuple[int, array]]:
+        return sorted(blocks, key=lambda block: self.sources[block[0]])
+
+    def intern(self, path: str) -> int:
+        """
+        Return the id of path, registering it if it was not seen before
+        """
+        file_id = self._ids.get(path)
+        if file_id is None:
+            file_id = self._ids[path] = len(self.paths)
+            self.paths.append(path)
+        return file_id
+
+    def intern_source(self, file_id: int, slot: tuple = DEFAULT_SLOT) -> int:
+        """
+        Return the id of the (sheet, columns) slot of the file with the given id,
+        registering it if it was not seen before
+        """
+        source = (file_id, *slot)
+        source_id = self._source_ids.get(source)
+        if source_id is None:
+            source_id = self._source_ids[source] = len(self.sources)
+            self.sources.append(source)
+        return source_id
+
+    def add(self, value, source_id: int, rows: array) -> None:
+        """
+        Record the occurrences of value in the given rows of the source with the given id
+        (all the rows of a value in a source are expected in one call)
+        """
+        entry = self._entries.get(value)
+        if entry is None:
+            entry = self._entries[value] = _Entry()
+        entry.count += len(rows)
+        entry.postings.append(source_id)
+        entry.postings.append(len(rows))
+        entry.postings.extend(rows)
+
+    def add_file(
+        self, source_id: int, values: list, counts: array | None, rows: array
+    ) -> None:
+        """
+        Merge a part of the partial index of a single file (see _scan_file) into this index
+        """
+        if counts is None:
+            values, counts, rows = _grouped(values, rows)
+        add = self.add
+        offset = 0
+        for value, n in zip(values, counts):
+            add(value, source_id, rows[offset : offset + n])
+            offset += n
+
+    def merge(self, other: "DuplicateIndex") -> None:
+        """
+        Add the occurrences of another index, of files that are not in this one (or were
+        removed from it with remove_file), its files and sources are interned by path
+        """
+        source_ids = [
+            self.intern_source(self.intern(other.paths[file_id]), tuple(slot))
+            for file_id, *slot in other.sources
+        ]
+        for value, entry in other._entries.items():
+            for source_id, rows in entry.blocks():
+                self.add(value, source_ids[source_id], rows)
+
+    def remove_file(self, file_id: int, values) -> None:
+        """
+        Drop the occurrences of the file with the given id from the entries of values (the
+        values it was indexed with), the values left without occurrences are forgotten.
+        The file keeps its id and its sources, so it can be merged again once rescanned
+        """
+        removed = {i for i, source in enumerate(self.sources) if source[0] == file_id}
+        for value in values:
+            entry = self._entries.get(value)
+            if entry is None:
+                continue
+            postings = array("I")
+            count = 0
+            for source_id, rows in entry.blocks():
+                if source_id not in removed:
+                    postings.append(source_id)
+                    postings.append(len(rows))
+                    postings.extend(rows)
+                    count += len(rows)
+            if count:
+                entry.count = count
+                entry.postings = postings
+            else:
+                del self._entries[value]
+
+    def count(self, value) -> int:
+        entry = self._entries.get(value)
+        return entry.count if entry is not None else 0
+
+    def is_duplicate(self, value) -> bool:
+        entry = self._entries.get(value)
+        return entry is not None and entry.count > 1
+
+    def origins(self, value) -> list[str]:
+        """
+        Return the paths of the files containing value (empty if value was never seen)
+        """
+        entry = self._entries.get(value)
+        if entry is None:
+            return []
+        # files merged from parallel workers arrive in completion order
+        file_ids = {self.sources[i][0] for i in entry.sources()}
+        return [self.paths[i] for i in sorted(file_ids)]
+
+    def locations(self, value) -> list[tuple[int, array]]:
+        """
+        Return the (source id, rows) where value was found (empty if value was never seen)
+        """
+        entry = self._entries.get(value)
+        if entry is None:
+            return []
+        return self._by_source(entry.blocks())
+
+    def duplicates(self):
+        """
+        Iterate over the values found more than once as (value, count, locations) tuples
+        """
+        for value, entry in self._entries.items():
+            if entry.count > 1:
+                yield value, entry.count, self._by_source(entry.blocks())
+
+
+# 10**n for the digit strings encoding of ColumnarIndex (10**18 still fits in an int64)
+_MAX_DIGITS = 18
+
+
+class ColumnarIndex:
+    """
+    Vectorized (NumPy) alternative to DuplicateIndex with the same query methods.
+
+    The partial index of every file is turned into int64 key arrays as it is added: the
+    digit strings (phone numbers) of up to 18 digits are encoded as the integer "1" + digits
+    (so leading zeros are kept) in a few array operations, any other value gets a negative
+    key from a hash table. The files are scanned without grouping their values (see the
+    raw parts of _scan_file). Once all the files are added, the occurrences are sorted by
+    (key, source, row) in a single pass, the counts of the values and the bounds of their
+    (value, source) groups are computed once and the locations are read from them.
+
+    Requires numpy (optional dependency).
+
+    Attributes:
+        - paths: list[str] -> interned file paths, indexed by their id
+        - sources: list[tuple] -> (file id, sheet, columns) of every source, indexed by its id
+        - duplicates_only: bool -> always False, see DuplicateIndex
+
+    Methods:
+        - __init__(self) -> None
+        - intern(self, path: str) -> int
+        - intern_source(self, file_id: int, slot: tuple = DEFAULT_SLOT) -> int
+        - add_file(self, source_id: int, values: list, counts: array | None, rows: array) -> None
+        - freeze(self) -> None
+        - count(self, value) -> int
+        - is_duplicate(self, value) -> bool
+        - origins(self, value) -> list[str] (in file id order)
+        - locations(self, value) -> list of (source id, rows) tuples (in source order)
+        - duplicates(self) -> iterator of (value, count, locations)
+    """
+
+    def __init__(self) -> None:
+        if _optional_module("numpy") is None:
+            raise ImportError("the numpy backend requires numpy (pip install numpy)")
+        self.paths: list[str] = []
+        self.sources: list[tuple[int, str, tuple[int, ...]]] = []
+        self._ids: dict[str, int] = {}
+        self._source_ids: dict[tuple, int] = {}
+        # values that are not short digit strings, their key is -(position + 1)
+        self._others: dict = {}
+        self._other_values: list = []
+        self._chunks: list[tuple] = []
+        self._keys = None
+        self.duplicates_only = False
+
+    def __len__(self) -> int:
+        self.freeze()
+        return len(self._keys)
+
+    def __contains__(self, value) -> bool:
+        return self._find(value) is not None
+
+    def __iter__(self):
+        self.freeze()
+        return (self._decode(key) for key in self._keys.tolist())
+
+    __eq__ = DuplicateIndex.__eq__
+    _located = DuplicateIndex._located
+    intern = DuplicateIndex.intern
+    intern_source = DuplicateIndex.intern_source
+
+    def _encode(self, values: list):
+        """
+        Return the int64 keys of values
+        """
+        np = _optional_module("numpy")
+        keys = np.zeros(len(values), dtype=np.int64)
+        digits = np.zeros(len(values), dtype=bool)
+        if set(map(type, values)) == {str}:
+            positions = slice(None)
+            strings = np.array(values)
+        else:
+            # numpy would turn the other types into strings, only the str are encoded
+            positions = np.flatnonzero(
+                np.fromiter((type(v) is str for v in values), bool, len(values))
+            )
+            strings = np.array([values[i] for i in positions.tolist()], dtype=str)
+
+        if len(strings):
+            # unicode code points of the strings, padded with zeros
+            width = strings.dtype.itemsize // 4
+            points = strings.view(np.uint32).reshape(len(strings), width)
+            points = points[:, :_MAX_DIGITS]
+            lengths = np.char.str_len(strings)
+            columns = np.arange(points.shape[1])
+            padding = columns >= lengths[:, None]
+            is_digit = (points >= 48) & (points <= 57)
+            digits[positions] = (
+                np.all(is_digit | padding, axis=1)
+                & (lengths > 0)
+                & (lengths <= _MAX_DIGITS)
+            )
+            powers = 10 ** np.arange(_MAX_DIGITS + 1, dtype=np.int64)
+            # the longer strings are not digit keys, their exponents are clipped so that
+            # powers can be indexed and their discarded keys are left to 0
+            exponents = np.clip(lengths[:, None] - 1 - columns, 0, _MAX_DIGITS)
+            ignored = padding | (lengths[:, None] > _MAX_DIGITS)
+            numbers = np.where(ignored, 0, points.astype(np.int64) - 48)
+            keys[positions] = (numbers * powers[exponents]).sum(axis=1) + powers[
+                np.minimum(lengths, _MAX_DIGITS)
+            ]
+
+        for i in np.flatnonzero(~digits).tolist():
+            value = values[i]
+            key = self._others.get(value)
+            if key is None:
+                self._other_values.append(value)
+                key = self._others[value] = -len(self._other_values)
+            keys[i] = key
+        return keys
+
+    def _decode(self, key: int):
+        return str(key)[1:] if key > 0 else self._other_values[-key - 1]
+
+    def add_file(
+        self, source_id: int, values: list, counts: array | None, rows: array
+    ) -> None:
+        """
+        Add a part of the partial index of a single file (see _scan_file), raw or grouped
+        """
+        if self._keys is not None:
+            raise RuntimeError("files cannot be added once the index is frozen")
+        np = _optional_module("numpy")
+        keys = self._encode(values)
+        if counts is not None:
+            keys = np.repeat(keys, np.frombuffer(counts, dtype=np.uint32))
+        rows = np.frombuffer(rows, dtype=np.uint32)
+        self._chunks.append(
+            (keys, np.full(len(keys), source_id, dtype=np.uint32), rows)
+        )
+
+    def freeze(self) -> None:
+        """
+        Sort the occurrences and compute the counts (done once, on the first query)
+        """
+        if self._keys is not None:
+            return
+        np = _optional_module("numpy")
+        if self._chunks:
+            keys, source_ids, rows = (np.concatenate(c) for c in zip(*self._chunks))
+        else:
+            keys = np.empty(0, dtype=np.int64)
+            source_ids = rows = np.empty(0, dtype=np.uint32)
+        self._chunks = []
+
+        # the sources are sorted like DuplicateIndex.locations, by (file id, sheet,
+        # columns), their ids follow the order the files were scanned in
+        ranks = np.empty(len(self.sources), dtype=np.uint32)
+        ranks[sorted(range(len(self.sources)), key=self.sources.__getitem__)] = (
+            np.arange(len(self.sources))
+        )
+        order = np.lexsort((rows, ranks[source_ids], keys))
+        keys = keys[order]
+        source_ids = source_ids[order]
+        self._rows = rows[order].astype(np.uint32)
+        new_key = np.r_[True, keys[1:] != keys[:-1]]
+        starts = np.flatnonzero(new_key)
+        self._keys = keys[starts]
+        self._counts = np.diff(np.r_[starts, len(keys)])
+        # the occurrences of a value in a source are contiguous: the groups of (value,
+        # source) are found once, and the groups of every value are a range of them
+        groups = np.flatnonzero(
+            new_key | np.r_[True, source_ids[1:] != source_ids[:-1]]
+        )
+        self._group_bounds = np.r_[groups, len(keys)]
+        self._group_sources = source_ids[groups]
+        self._first_groups = np.r_[np.searchsorted(groups, starts), len(groups)]
+
+    def _find(self, value) -> int | None:
+        """
+        Position of value in the sorted distinct keys (None if value was never seen)
+        """
+        self.freeze()
+        if (
+            type(value) is str
+            and 0 < len(value) <= _MAX_DIGITS
+            and value.isascii()
+            and value.isdigit()
+        ):
+            key = int("1" + value)
+        else:
+            key = self._others.get(value)
+            if key is None:
+                return None
+        i = int(_optional_module("numpy").searchsorted(self._keys, key))
+        return i if i < len(self._keys) and self._keys[i] == key else None
+
+    def _locations_at(self, i: int) -> list[tuple[int, array]]:
+        first, last = self._first_groups[i : i + 2].tolist()
+        bounds = self._group_bounds[first : last + 1].tolist()
+        rows = array("I", self._rows[bounds[0] : bounds[-1]].tobytes())
+        return self._groups(
+            self._group_sources[first:last].tolist(), bounds, rows, bounds[0]
+        )
+
+    def _groups(
+        self, source_ids: list[int], bounds: list[int], rows: array, offset: int
+    ) -> list[tuple[int, array]]:
+        """
+        Locations of a value from the sources and the bounds of its groups in the sorted
+        occurrences, rows holding the rows of the occurrences from offset
+        """
+        return [
+            (source_id, rows[a - offset : b - offset])
+            for source_id, a, b in zip(source_ids, bounds, bounds[1:])
+        ]
+
+    def count(self, value) -> int:
+        i = self._find(value)
+        return 0 if i is None else int(self._counts[i])
+
+    def is_duplicate(self, value) -> bool:
+        return self.count(value) > 1
+
+    def origins(self, value) -> list[str]:
+        file_ids = {self.sources[i][0] for i, _ in self.locations(value)}
+        return [self.paths[i] for i in sorted(file_ids)]
+
+    def locations(self, value) -> list[tuple[int, array]]:
+        i = self._find(value)
+        return [] if i is None else self._locations_at(i)
+
+    def duplicates(self):
+        """
+        Iterate over the values found more than once as (value, count, locations) tuples
+        """
+        self.freeze()
+        np = _optional_module("numpy")
+        # converted to lists once, the groups of every value are then plain slices
+        rows = array("I", self._rows.tobytes())
+        bounds = self._group_bounds.tolist()
+        source_ids = self._group_sources.tolist()
+        first_groups = self._first_groups.tolist()
+        duplicated = np.flatnonzero(self._counts > 1)
+        keys = self._keys[duplicated].tolist()
+        counts = self._counts[duplicated].tolist()
+        for i, key, count in zip(duplicated.tolist(), keys, counts):
+            first, last = first_groups[i], first_groups[i + 1]
+            yield self._decode(key), count, self._groups(
+                source_ids[first:last], bounds[first : last + 1], rows, 0
+            )
+
+
+# estimated in-memory footprint of a value, used by SpillingIndex to stay in its budget
+_BUFFERED_VALUE_BYTES = 100  # in a file scan waiting to be spilled (object + counter)
+_INDEXED_VALUE_BYTES = (
+    300  # in a DuplicateIndex (dict slot, _Entry and its posting list)
+)
+# a partition that cannot be split any further (a single huge value) is loaded anyway
+_MAX_SPILL_DEPTH = 4
+SPILL_PARTITIONS = 64
+
+
+class SpillingIndex:
+    """
+    Bounded memory builder of a DuplicateIndex, for files whose distinct values do not fit
+    in memory at once.
+
+    The file scans are buffered until their estimated size exceeds memory_budget, they are
+    then hash-partitioned on their values into temporary runs on disk. Equal values always
+    land in the same partition, so every partition is deduplicated on its own and only its
+    duplicated values are merged into the result. A partition still too big for the budget
+    is partitioned again with another hash.
+
+    The built index only holds the duplicated values (the values seen once have a count of 0
+    and no origins), which is everything needed to annotate the files. Those duplicates have
+    to fit in memory.
+
+    Attributes:
+        - paths: list[str] -> interned file paths, indexed by their id
+        - sources: list[tuple] -> interned sources, see DuplicateIndex
+        - memory_budget: int -> bytes of values kept in memory before spilling to disk
+        - spills: int -> number of times the buffered scans were written to disk
+
+    Methods:
+        - __init__(self, memory_budget: int, directory: str | None = None,
+        partitions: int = SPILL_PARTITIONS) -> None
+        - intern(self, path: str) -> int
+        - intern_source(self, file_id: int, slot: tuple = DEFAULT_SLOT) -> int
+        - add_file(self, source_id: int, values: list, counts: array | None, rows: array) -> None
+        - build(self) -> DuplicateIndex
+        - close(self) -> None (removes the runs, done by build)
+    """
+
+    def __init__(
+        self,
+        memory_budget: int,
+        directory: str | None = None,
+        partitions: int = SPILL_PARTITIONS,
+    ) -> None:
+        if memory_budget <= 0:
+            raise ValueError("memory_budget must be positive")
+        self.memory_budget = memory_budget
+        self.spills = 0
+        self._index = DuplicateIndex()
+        self._index.duplicates_only = True
+        self.paths = self._index.paths
+        self.sources = self._index.sources
+        self._partitions = partitions
+        self._directory = directory
+        self._tmp: tempfile.TemporaryDirectory | None = None
+        self._buffer: list[tuple] = []
+        self._buffered = 0
+        self._runs: list[str] = []
+        self._sizes = [0] * partitions
+
+    def intern(self, path: str) -> int:
+        return self._index.intern(path)
+
+    def intern_source(self, file_id: int, slot: tuple = DEFAULT_SLOT) -> int:
+        return self._index.intern_source(file_id, slot)
+
+    def add_file(
+        self, source_id: int, values: list, counts: array | None, rows: array
+    ) -> None:
+        """
+        Buffer a part of the partial index of a single file (see _scan_file), spilling the
+        buffer to disk when it exceeds the memory budget
+        """
+        if counts is None:
+            values, counts, rows = _grouped(values, rows)
+        self._buffer.append(
+            (array("I", [source_id]) * len(values), values, counts, rows)
+        )
+        self._buffered += len(values) * _BUFFERED_VALUE_BYTES + rows.itemsize * len(
+            rows
+        )
+        if self._buffered > self.memory_budget:
+            self._spill()
+
+    def _spill(self) -> None:
+        if self._tmp is None:
+            self._tmp = tempfile.TemporaryDirectory(
+                prefix="xl-spill-", dir=self._directory
+            )
+            self._runs = [
+                os.path.join(self._tmp.name, str(p)) for p in range(self._partitions)
+            ]
+        sizes = self._write_runs(self._buffer, 0, self._runs)
+        self._sizes = [a + b for a, b in zip(self._sizes, sizes)]
+        self._buffer.clear()
+        self._buffered = 0
+        self.spills += 1
+
+    @staticmethod
+    def _write_runs(chunks, salt: int, runs: list[str]) -> list[int]:
+        """
+        Hash-partition chunks of (source ids, values, counts, rows) and append them to runs,
+        one chunk at a time. Returns the estimated in-memory size of every partition
+        """
+        sizes = [0] * len(runs)
+        for source_ids, values, counts, rows in chunks:
+            parts = [(array("I"), [], array("I"), array("I")) for _ in runs]
+            offset = 0
+            for source_id, value, n in zip(source_ids, values, counts):
+                part = parts[hash((salt, value)) % len(runs)]
+                part[0].append(source_id)
+                part[1].append(value)
+                part[2].append(n)
+                part[3].extend(rows[offset : offset + n])
+                offset += n
+            for i, (run, part) in enumerate(zip(runs, parts)):
+                if not part[1]:
+                    continue
+                with open(run, "ab") as f:
+                    pickle.dump(part, f, pickle.HIGHEST_PROTOCOL)
+                sizes[i] += len(part[1]) * _INDEXED_VALUE_BYTES
+                sizes[i] += part[3].itemsize * len(part[3])
+        return sizes
+
+    @staticmethod
+    def _read_run(run: str):
+        with open(run, "rb") as f:
+            while True:
+                try:
+                    yield pickle.load(f)
+                except EOFError:
+                    return
+
+    def _merge_run(self, run: str, size: int, depth: int) -> None:
+        """
+        Deduplicate a run and move its duplicated values into the result
+        """
+        if size > self.memory_budget and depth < _MAX_SPILL_DEPTH:
+            runs = [f"{run}.{p}" for p in range(self._partitions)]
+            sizes = self._write_runs(self._read_run(run), depth + 1, runs)
+            os.remove(run)
+            for sub_run, sub_size in zip(runs, sizes):
+                if sub_size:
+                    self._merge_run(sub_run, sub_size, depth + 1)
+            return
+
+        self._keep_duplicates(self._read_run(run))
+        os.remove(run)
+
+    def _keep_duplicates(self, chunks) -> None:
+        partition = DuplicateIndex()
+        for source_ids, values, counts, rows in chunks:
+            offset = 0
+            for source_id, value, n in zip(source_ids, values, counts):
+                partition.add(value, source_id, rows[offset : offset + n])
+                offset += n
+        self._index._entries.update(
+            (value, entry)
+            for value, entry in partition._entries.items()
+            if entry.count > 1
+        )
+
+    def build(self) -> DuplicateIndex:
+        """
+        Return the index of the duplicated values of every added file
+        """
+        try:
+            if self._tmp is None:
+                # everything fitted in the budget, nothing to merge from the disk
+                self._keep_duplicates(self._buffer)
+                return self._index
+            if self._buffer:
+                self._spill()
+            for run, size in zip(self._runs, self._sizes):
+                if size:
+                    self._merge_run(run, size, 0)
+            return self._index
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        self._buffer.clear()
+        if self._tmp is not None:
+            self._tmp.cleanup()
+            self._tmp = None
+
+
+# measured size of a loaded openpyxl cell (object, coordinate key and value)
+_WORKBOOK_CELL_BYTES = 400
+# average size of a cell in the xml of a worksheet, for the sheets without a <dimension>
+_SHEET_XML_CELL_BYTES = 30
+# the <dimension> of a worksheet is its first element
+_DIMENSION_HEAD = 4096
+
+
+class WorkbookCache:
+    """
+    In-memory LRU cache of fully loaded openpyxl workbooks, so that a workbook parsed by
+    the scan is not parsed again by the write phase.
+
+    Workbooks are matched by path, size and mtime and evicted least recently used first
+    once their estimated size goes over max_bytes. The size of a workbook is estimated
+    from the dimensions of its sheets before loading it, the ones that would not fit are
+    not loaded (load returns None and they are streamed). The write phase takes the
+    workbook out of the cache since marking it modifies it. Only the files scanned and
+    written in this process use it (jobs=1), the worker processes load their own
+    workbooks.
+
+    Attributes:
+        - max_bytes: int -> memory budget of the cached workbooks
+        - nbytes: int -> estimated size of the cached workbooks
+
+    Methods:
+        - __init__(self, max_bytes: int) -> None
+        - estimate(xp: str) -> int (static, estimated bytes of the loaded workbook)
+        - load(self, xp: str) -> Workbook | None (cached or loaded and cached)
+        - take(self, xp: str) -> Workbook | None (removed from the cache)
+        - clear(self) -> None
+    """
+
+    def __init__(self, max_bytes: int = 512 * 2**20) -> None:
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        # key -> (workbook, estimated bytes), least recently used first
+        self._workbooks: dict[tuple, tuple[Workbook, int]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._workbooks)
+
+    @staticmethod
+    def _key(xp: str) -> tuple:
+        stat = os.stat(xp)
+        return str(xp), stat.st_size, stat.st_mtime_ns
+
+    @staticmethod
+    def estimate(xp: str) -> int:
+        """
+        Estimate the size of the loaded workbook of xp without loading it, from the
+        <dimension> of its worksheets (from the size of their xml when it is missing)
+        """
+        from openpyxl.utils.cell import range_boundaries
+
+        cells = 0
+        with zipfile.ZipFile(xp) as archive:
+            try:
+                parts = [part for _, part, _ in _xlsx_sheet_parts(archive) if part]
+            except (_UnsupportedWorkbook, KeyError, ValueError, ET.ParseError):
+                parts = [name for name in archive.NameToInfo if "worksheets/" in name]
+            for part in parts:
+                with archive.open(part) as f:
+                    head = f.read(_DIMENSION_HEAD).decode("utf-8", "replace")
+                match = _DIMENSION_RE.search(head)
+                try:
+                    min_col, min_row, max_col, max_row = range_boundaries(
+                        match.group(2)
+                    )
+                    cells += (max_col - min_col + 1) * (max_row - min_row + 1)
+                except (AttributeError, TypeError, ValueError):
+                    size = archive.getinfo(part).file_size
+                    cells += size // _SHEET_XML_CELL_BYTES
+        return _WORKBOOK_CELL_BYTES * cells
+
+    def load(self, xp: str) -> Workbook | None:
+        """
+        Return the workbook of xp, loading (and caching it when it fits) on a miss, None
+        when it is estimated too big for the cache
+        """
+        key = self._key(xp)
+        with self._lock:
+            cached = self._workbooks.pop(key, None)
+            if cached is not None:
+                self._workbooks[key] = cached
+                return cached[0]
+        if self.estimate(xp) > self.max_bytes:
+            return None
+
+        from openpyxl import load_workbook
+
+        wb = load_workbook(filename=xp, data_only=True)
+        # the dimensions can be wrong, the loaded cells are counted again
+        nbytes = _WORKBOOK_CELL_BYTES * sum(len(ws._cells) for ws in wb.worksheets)
+        if nbytes > self.max_bytes:
+            return wb
+        with self._lock:
+            # other versions of the file are stale
+            for stale in [k for k in self._workbooks if k[0] == key[0]]:
+                self.nbytes -= self._workbooks.pop(stale)[1]
+            self._workbooks[key] = (wb, nbytes)
+            self.nbytes += nbytes
+            while self.nbytes > self.max_bytes:
+                oldest = next(iter(self._workbooks))
+                self.nbytes -= self._workbooks.pop(oldest)[1]
+        return wb
+
+    def take(self, xp: str) -> Workbook | None:
+        """
+        Remove the workbook of xp from the cache and return it (None on a miss)
+        """
+        key = self._key(xp)
+        with self._lock:
+            cached = self._workbooks.pop(key, None)
+            if cached is None:
+                return None
+            self.nbytes -= cached[1]
+            return cached[0]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._workbooks.clear()
+            self.nbytes = 0
+
+
+PAGE_ROWS = 200
+PAGE_COLUMNS = 12
+
+
+class PageCache:
+    """
+    LRU cache of pages of rows of the files, for previewing them without loading them.
+
+    The rows are streamed with the read-only reader registered for the file type. A page
+    following the last one read from a file continues its open reader, so scrolling
+    through a file reads every row once, any other page streams the file again from its
+    first row. Pages are matched by path, size and mtime and evicted least recently used
+    first once more than max_pages are kept, at most max_readers files are left open.
+
+    Attributes:
+        - max_pages: int
+        - max_readers: int
+        - page_rows: int -> rows of a page
+        - max_col: int -> last column read
+
+    Methods:
+        - __init__(self, max_pages: int, max_readers: int, page_rows: int, max_col: int) -> None
+        - page(self, xp: str, number: int, sheets: str | tuple | None) -> tuple[str, list]
+        - close(self, xp: str | None) -> None
+    """
+
+    def __init__(
+        self,
+        max_pages: int = 64,
+        max_readers: int = 4,
+        page_rows: int = PAGE_ROWS,
+        max_col: int = PAGE_COLUMNS,
+    ) -> None:
+        self.max_pages = max_pages
+        self.max_readers = max_readers
+        self.page_rows = page_rows
+        self.max_col = max_col
+        # (key, page number) -> (sheet name, [(row, values)]), least recently used first
+        self._pages: dict[tuple, tuple[str, list[tuple[int, tuple]]]] = {}
+        # key -> (reader generator, sheet name, numbered rows, number of the next page)
+        self._readers: dict[tuple, tuple] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(xp: str, sheets) -> tuple:
+        stat = os.stat(xp)
+        return str(xp), stat.st_size, stat.st_mtime_ns, sheets
+
+    def page(
+        self, xp: str, number: int, sheets: str | tuple[str, ...] | None = None
+    ) -> tuple[str, list[tuple[int, tuple]]]:
+        """
+        Return the rows of a page (numbered from 0) of the first selected sheet of a file
+
+        Input:
+            - xp: str -> path of the file
+            - number: int -> the page holds the rows number * page_rows + 1 onward
+            - sheets: str | tuple | None -> see ScanTarget, the first selected sheet is read
+
+        Returns:
+            - str -> name of the sheet ("" for the active or only sheet, like Mark.sheet)
+            - list[tuple[int, tuple]] -> (row number, values of the columns 1 to max_col),
+            shorter than page_rows for the last page and empty past the end of the sheet
+        """
+        key = self._key(xp, sheets)
+        with self._lock:
+            page = self._pages.pop((key, number), None)
+            if page is None:
+                page = self._read(key, number)
+            self._pages[key, number] = page
+            while len(self._pages) > self.max_pages:
+                del self._pages[next(iter(self._pages))]
+            return page
+
+    def _read(self, key: tuple, number: int) -> tuple[str, list[tuple[int, tuple]]]:
+        xp, _, _, sheets = key
+        reader = self._readers.pop(key, None)
+        if reader is None or reader[3] != number:
+            if reader is not None:
+                reader[0].close()
+            # other versions of the file are stale
+            for stale in [k for k in self._readers if k[0] == xp]:
+                self._readers.pop(stale)[0].close()
+            generator = _reader(xp)(xp, True, sheets, self.max_col)
+            name, rows = next(generator, ("", iter(())))
+            numbered = enumerate(rows, start=1)
+            # skip the rows of the previous pages without keeping them
+            skipped = number * self.page_rows
+            next(itertools.islice(numbered, skipped, skipped), None)
+            reader = (generator, name, numbered, number)
+        generator, name, numbered, _ = reader
+        rows = list(itertools.islice(numbered, self.page_rows))
+        self._readers[key] = (generator, name, numbered, number + 1)
+        while len(self._readers) > self.max_readers:
+            self._readers.pop(next(iter(self._readers)))[0].close()
+        return name, rows
+
+    def close(self, xp: str | None = None) -> None:
+        """
+        Close the open readers of a file (of every file when xp is None) and drop its pages
+        """
+        with self._lock:
+            for key in [k for k in self._readers if xp is None or k[0] == str(xp)]:
+                self._readers.pop(key)[0].close()
+            for key in [k for k in self._pages if xp is None or k[0][0] == str(xp)]:
+                del self._pages[key]
+
+
+def _column_index(column: str) -> int | None:
+    """
+    Return the 1-based index of a column letter of a ScanTarget (None for a header name)
+    """
+    if 1 <= len(column) <= 3 and column.isalpha() and column.isascii():
+        if column.isupper():
+            from openpyxl.utils import column_index_from_string
+
+            return column_index_from_string(column)
+    return None
+
+
+def _pack(positions: dict) -> tuple[list, array, array]:
+    """
+    Turn the {value: rows} of a source into the (values, counts, rows) arrays of its part
+    """
+    counts = array("I", map(len, positions.values()))
+    all_rows = array("I")
+    for rows in positions.values():
+        all_rows.extend(rows)
+    return list(positions), counts, all_rows
+
+
+def _record(positions: dict, value, row: int) -> None:
+    rows = positions.get(value)
+    if rows is None:
+        positions[value] = array("I", (row,))
+    else:
+        rows.append(row)
+
+
+def _append(cells: tuple[list, array], value, row: int) -> None:
+    cells[0].append(value)
+    cells[1].append(row)
+
+
+def _grouped(values: list, rows: array) -> tuple[list, array, array]:
+    """
+    Turn the cells of a raw part (see _scan_file) into the (values, counts, rows) arrays
+    of a grouped one
+    """
+    positions = {}
+    for value, row in zip(values, rows):
+        _record(positions, value, row)
+    return _pack(positions)
+
+
+def _scan_file(
+    xp: str,
+    read_only: bool = True,
+    on_rows: Callable[[int], None] | None = None,
+    cancel: threading.Event | None = None,
+    engine: str = "openpyxl",
+    target: ScanTarget = DEFAULT_TARGET,
+    workbooks: WorkbookCache | None = None,
+    raw: bool = False,
+) -> tuple[str, list[tuple]]:
+    """
+    Build the partial index of a single file, run in the worker processes of get_files_values
+
+    Every selected sheet is read once, in a single streaming pass over the workbook, and
+    all the target columns are collected from the same rows.
+
+    Input:
+       - xp: str -> path of the file, read with the reader registered for its type
+       - read_only: bool -> see read_xlsx_sheets
+       - on_rows: callable | None -> called with the number of rows read every PROGRESS_ROWS rows
+       - cancel: threading.Event | None -> stop with Cancelled as soon as it is set
+       - engine: str -> "openpyxl" or "xml" (see _scan_file_xml, falls back to openpyxl,
+       the other file types and targets always use the registered reader)
+       - target: ScanTarget -> sheets and columns to read
+       - workbooks: WorkbookCache | None -> load the xlsx workbooks fully through this
+       cache (instead of the engine) for the write phase to reuse them
+       - raw: bool -> leave the values of the parts ungrouped (for ColumnarIndex, which
+       groups them with a sort)
+
+    Returns:
+       - tuple -> the path and its parts: one (slot, values, counts, rows) per (sheet, columns)
+       slot found in the file, with the distinct values of the slot in order of appearance,
+       their number of occurrences and their rows (grouped by value) in two parallel
+       arrays (cheap to pickle back to the parent). With raw, values has the value of
+       every cell, counts is None and rows their rows
+    """
+
+    reader = _reader(xp)
+    options = {}
+    if workbooks is not None and reader is read_xlsx_sheets:
+        options["workbooks"] = workbooks
+    elif engine == "xml":
+        if reader is read_xlsx_sheets and target == DEFAULT_TARGET:
+            try:
+                return _scan_file_xml(xp, on_rows=on_rows, cancel=cancel, raw=raw)
+            except (_UnsupportedWorkbook, KeyError, ValueError, ET.ParseError):
+                pass
+    if engine not in ("openpyxl", "xml"):
+        raise ValueError(f"unknown engine: {engine}")
+
+    letters = [_column_index(column) for column in target.columns]
+    named = None in letters
+    parts = []
+    rows_read = 0
+    for sheet, rows in reader(
+        xp, read_only, target.sheets, None if named else max(letters), **options
+    ):
+        rows = iter(rows)
+        columns = letters
+        if named:
+            # the first matching header wins
+            header = {}
+            for i, name in enumerate(next(rows, ()), start=1):
+                if name is not None:
+                    header.setdefault(str(name).strip(), i)
+            columns = [
+                header.get(column) if i is None else i
+                for column, i in zip(target.columns, letters)
+            ]
+        if target.composite:
+            slots = [] if None in columns else [(sheet, tuple(columns))]
+        else:
+            slots = [(sheet, (i,)) for i in dict.fromkeys(columns) if i is not None]
+        if not slots:
+            continue
+
+        record = _append if raw else _record
+        positions = [([], array("I")) if raw else {} for _ in slots]
+        # 0-based indices of the key columns (composite) or of the column of every slot
+        if target.composite:
+            indices = [i - 1 for i in columns]
+        else:
+            indices = [slot[1][0] - 1 for slot in slots]
+        for row, values in enumerate(rows, start=2 if named else 1):
+            rows_read += 1
+            if not rows_read % PROGRESS_ROWS:
+                if cancel is not None and cancel.is_set():
+                    raise Cancelled(xp)
+                if on_rows is not None:
+                    on_rows(rows_read)
+            if target.composite:
+                key = tuple(values[i] if i < len(values) else None for i in indices)
+                if key.count(None) < len(key):
+                    record(positions[0], key, row)
+                continue
+            for slot_positions, i in zip(positions, indices):
+                if i < len(values) and values[i] is not None:
+                    record(slot_positions, values[i], row)
+
+        for slot, p in zip(slots, positions):
+            parts.append((slot, p[0], None, p[1]) if raw else (slot, *_pack(p)))
+    return xp, parts
+
+
+# ----------------- native xml engine ----------------------
+SHEET_MAIN_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+DOC_REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+PKG_REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+
+_CELL_TAG = f"{{{SHEET_MAIN_NS}}}c"
+_ROW_TAG = f"{{{SHEET_MAIN_NS}}}row"
+_SHEET_DATA_TAG = f"{{{SHEET_MAIN_NS}}}sheetData"
+_VALUE_TAG = f"{{{SHEET_MAIN_NS}}}v"
+_INLINE_TAG = f"{{{SHEET_MAIN_NS}}}is"
+_TEXT_TAG = f"{{{SHEET_MAIN_NS}}}t"
+_RUN_TAG = f"{{{SHEET_MAIN_NS}}}r"
+_STRING_ITEM_TAG = f"{{{SHEET_MAIN_NS}}}si"
+
+
+class _UnsupportedWorkbook(Exception):
+    """
+    Raised by the xml engine for the workbooks it does not handle, they are read with openpyxl
+    """
+
+
+def _xml_text(element) -> str:
+    """
+    Text of a shared or inline string: its <t> or the concatenation of its rich text runs
+    """
+    parts = []
+    text = element.find(_TEXT_TAG)
+    if text is not None and text.text:
+        parts.append(text.text)
+    for run in element.iterfind(_RUN_TAG):
+        text = run.find(_TEXT_TAG)
+        if text is not None and text.text:
+            parts.append(text.text)
+    return "".join(parts)
+
+
+def _xlsx_workbook(archive: zipfile.ZipFile) -> tuple:
+    """
+    Parse the workbook part of a package
+
+    Returns:
+       - tuple -> the workbook element, its relationships (id -> (type, part path)) and
+       the index of its active sheet
+    """
+
+    workbook = ET.fromstring(archive.read("xl/workbook.xml"))
+    if workbook.tag != f"{{{SHEET_MAIN_NS}}}workbook":
+        # strict ooxml and other dialects
+        raise _UnsupportedWorkbook("unknown workbook namespace")
+
+    rels = {}
+    for rel in ET.fromstring(archive.read("xl/_rels/workbook.xml.rels")):
+        target = rel.get("Target", "")
+        target = target[1:] if target.startswith("/") else posixpath.join("xl", target)
+        rels[rel.get("Id")] = (rel.get("Type", ""), posixpath.normpath(target))
+
+    active = 0
+    for view in workbook.iter(f"{{{SHEET_MAIN_NS}}}workbookView"):
+        if view.get("activeTab") is not None:
+            active = int(view.get("activeTab"))
+            break
+    return workbook, rels, active
+
+
+def _xlsx_sheet_parts(archive: zipfile.ZipFile) -> list[tuple[str, str | None, bool]]:
+    """
+    Return the (name, worksheet part path, is active) of every sheet of a workbook, in
+    order, the path is None for the sheets that are not worksheets (chartsheets)
+    """
+
+    workbook, rels, active = _xlsx_workbook(archive)
+    parts = []
+    for i, sheet in enumerate(workbook.iter(f"{{{SHEET_MAIN_NS}}}sheet")):
+        kind, target = rels.get(sheet.get(f"{{{DOC_REL_NS}}}id"), ("", None))
+        if not kind.endswith("/worksheet") or target not in archive.NameToInfo:
+            target = None
+        parts.append((sheet.get("name"), target, i == active))
+    return parts
+
+
+def _xlsx_workbook_parts(archive: zipfile.ZipFile) -> tuple[str, str | None, int]:
+    """
+    Resolve the parts needed to read the active sheet of a workbook
+
+    Returns:
+       - tuple -> path of the active worksheet, path of the shared strings (if any)
+       and the date epoch flag (1 for the 1904 calendar)
+    """
+
+    workbook, rels, active = _xlsx_workbook(archive)
+    shared_strings = None
+    for kind, target in rels.values():
+        if kind.endswith("/sharedStrings"):
+            shared_strings = target
+
+    sheets = list(workbook.iter(f"{{{SHEET_MAIN_NS}}}sheet"))
+    if not 0 <= active < len(sheets):
+        raise _UnsupportedWorkbook("no active sheet")
+    kind, target = rels[sheets[active].get(f"{{{DOC_REL_NS}}}id")]
+    if not kind.endswith("/worksheet") or target not in archive.NameToInfo:
+        raise _UnsupportedWorkbook("active sheet is not a worksheet")
+
+    properties = workbook.find(f"{{{SHEET_MAIN_NS}}}workbookPr")
+    date1904 = properties is not None and properties.get("date1904") in ("1", "true")
+    return target, shared_strings, int(date1904)
+
+
+def _xlsx_shared_strings(archive: zipfile.ZipFile, path: str | None) -> list[str]:
+    """
+    Parse the shared strings table once into a list indexed like the t="s" cells
+    """
+
+    strings = []
+    if path is None or path not in archive.NameToInfo:
+        return strings
+    with archive.open(path) as source:
+        for _, element in ET.iterparse(source):
+            if element.tag == _STRING_ITEM_TAG:
+                # same clean up as openpyxl's shared strings reader
+                strings.append(_xml_text(element).replace("x005F_", ""))
+                element.clear()
+    return strings
+
+
+def _xlsx_date_styles(archive: zipfile.ZipFile) -> tuple[set, set]:
+    """
+    Indices of the cell styles that format numbers as dates (and as timedeltas),
+    the numeric cells using them are converted to datetimes just like openpyxl does
+    """
+
+    from openpyxl.styles.numbers import (
+        builtin_format_code,
+        is_date_format,
+        is_timedelta_format,
+    )
+
+    dates, timedeltas = set(), set()
+    if "xl/styles.xml" not in archive.NameToInfo:
+        return dates, timedeltas
+    styles = ET.fromstring(archive.read("xl/styles.xml"))
+    custom = {
+        int(fmt.get("numFmtId")): fmt.get("formatCode")
+        for fmt in styles.iter(f"{{{SHEET_MAIN_NS}}}numFmt")
+    }
+    cell_xfs = styles.find(f"{{{SHEET_MAIN_NS}}}cellXfs")
+    for idx, xf in enumerate(cell_xfs if cell_xfs is not None else ()):
+        fmt_id = int(xf.get("numFmtId", 0))
+        fmt = custom[fmt_id] if fmt_id in custom else builtin_format_code(fmt_id)
+        if fmt is not None and is_date_format(fmt):
+            dates.add(idx)
+        if fmt is not None and is_timedelta_format(fmt):
+            timedeltas.add(idx)
+    return dates, timedeltas
+
+
+def _scan_file_xml(
+    xp: str,
+    on_rows: Callable[[int], None] | None = None,
+    cancel: threading.Event | None = None,
+    raw: bool = False,
+) -> tuple[str, list[tuple]]:
+    """
+    Same as _scan_file for the default target (column A of the active sheet), reading the
+    xlsx package directly: the active sheet is resolved from workbook.xml, sharedStrings.xml
+    is parsed once into a list and the sheet xml is stream parsed keeping only the A cells.
+    Shared strings are grouped by their index and only turned into values once per
+    distinct index (looked up for every cell with raw).
+
+    Raises _UnsupportedWorkbook (or the zip/xml errors) for the workbooks it cannot read.
+    """
+
+    from openpyxl.utils.datetime import (
+        CALENDAR_MAC_1904,
+        CALENDAR_WINDOWS_1900,
+        from_excel,
+        from_ISO8601,
+    )
+
+    with zipfile.ZipFile(xp) as archive:
+        with _step("load"):
+            sheet_path, strings_path, date1904 = _xlsx_workbook_parts(archive)
+            shared_strings = _xlsx_shared_strings(archive, strings_path)
+            dates, timedeltas = _xlsx_date_styles(archive)
+        epoch = CALENDAR_MAC_1904 if date1904 else CALENDAR_WINDOWS_1900
+
+        positions = {}
+        shared = {}
+        cell_values, cell_rows = [], array("I")
+        rows_read = 0
+        with archive.open(sheet_path) as source:
+            sheet_data = None
+            for event, element in ET.iterparse(source, events=("start", "end")):
+                if event == "start":
+                    if element.tag == _SHEET_DATA_TAG:
+                        sheet_data = element
+                    continue
+
+                if element.tag == _ROW_TAG:
+                    rows_read += 1
+                    if not rows_read % PROGRESS_ROWS:
+                        if cancel is not None and cancel.is_set():
+                            raise Cancelled(xp)
+                        if on_rows is not None:
+                            on_rows(rows_read)
+                    # only keep the row being parsed in memory
+                    if sheet_data is not None:
+                        sheet_data.clear()
+                    continue
+
+                if element.tag != _CELL_TAG:
+                    continue
+                coordinate = element.get("r")
+                if coordinate is None:
+                    raise _UnsupportedWorkbook("cell without reference")
+                if coordinate[0] != "A" or not coordinate[1].isdigit():
+                    continue
+
+                row = int(coordinate[1:])
+                data_type = element.get("t", "n")
+                target = positions
+                if data_type == "inlineStr":
+                    child = element.find(_INLINE_TAG)
+                    if child is None:
+                        continue
+                    value = _xml_text(child)
+                else:
+                    value = element.findtext(_VALUE_TAG) or None
+                    if value is None:
+                        continue
+                    if data_type == "s":
+                        if raw:
+                            value = shared_strings[int(value)]
+                        else:
+                            target, value = shared, int(value)
+                    elif data_type == "n":
+                        value = (
+                            float(value)
+                            if "." in value or "E" in value or "e" in value
+                            else int(value)
+                        )
+                        style = int(element.get("s", 0))
+                        if style in dates:
+                            try:
+                                value = from_excel(
+                                    value, epoch, timedelta=style in timedeltas
+                                )
+                            except (OverflowError, ValueError):
+                                value = "#VALUE!"
+                    elif data_type == "b":
+                        value = bool(int(value))
+                    elif data_type == "d":
+                        value = from_ISO8601(value)
+
+                if raw:
+                    cell_values.append(value)
+                    cell_rows.append(row)
+                    continue
+                rows = target.get(value)
+                if rows is None:
+                    target[value] = array("I", (row,))
+                else:
+                    rows.append(row)
+
+    if raw:
+        return xp, [(DEFAULT_SLOT, cell_values, None, cell_rows)]
+    for idx, rows in shared.items():
+        value = shared_strings[idx]
+        existing = positions.get(value)
+        # a string can be stored more than once in the table
+        positions[value] = (
+            rows if existing is None else array("I", sorted(existing + rows))
+        )
 
-from openpyxl import Workbook, load_workbook
-from openpyxl.styles import Font
-from rich import print
-from rich.progress import track
+    return xp, [(DEFAULT_SLOT, *_pack(positions))]
 
 
-def generate_random_num() -> str:
+# the scans are keyed by "content|tag" while the files only record their content part,
+# the tag has a fixed length since the content may hold a "|" (the path of the file)
+_SCAN_CONTENT = "substr(key, 1, length(key) - 17)"
+
+
+class ScanCache:
     """
-    Generate a random phone number.
+    Persistent on-disk cache (a SQLite file, usually next to the data) of the values
+    extracted from every scanned file, so unchanged files are not parsed again.
 
-    Returns:
-       - str: A string representing a random phone number with known prefixes.
+    Files are matched by path, size and mtime, then by the hash of their content (when
+    hash_contents is set) so that renamed, touched or byte-identical copies of an already
+    scanned file are parsed only once. The cached scans are evicted least recently used
+    first once their total size goes over max_bytes.
+
+    Attributes:
+        - path: str -> the SQLite database file
+        - max_bytes: int -> size budget of the stored scans
+        - hash_contents: bool
+
+    Methods:
+        - __init__(self, path: str, max_bytes: int, hash_contents: bool) -> None
+        - lookup(self, xp: str, target: ScanTarget) -> tuple[str, list | None]
+        - store(self, key: str, scan: tuple, paths: list[str]) -> None
+        - commit(self) -> None
+        - invalidate(self, paths: list[str] | None = None) -> None
+        - close(self) -> None
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int = 512 * 2**20,
+        hash_contents: bool = True,
+    ) -> None:
+        self.path = str(path)
+        self.max_bytes = max_bytes
+        self.hash_contents = hash_contents
+        self._db = sqlite3.connect(self.path)
+        self._db.executescript(
+            """
+            PRAGMA journal_mode = WAL;
+            PRAGMA synchronous = NORMAL;
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                key TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS scans (
+                key TEXT PRIMARY KEY,
+                data BLOB NOT NULL,
+                nbytes INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS scans_last_used ON scans (last_used);
+            """
+        )
+
+    def __enter__(self) -> "ScanCache":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _key(self, xp: str, stat: os.stat_result) -> str:
+        if not self.hash_contents:
+            return f"{stat.st_size}:{stat.st_mtime_ns}:{xp}"
+        with open(xp, "rb") as f:
+            return hashlib.file_digest(f, "blake2b").hexdigest()
+
+    def lookup(
+        self, xp: str, target: ScanTarget = DEFAULT_TARGET
+    ) -> tuple[str, list | None]:
+        """
+        Return the cache key of the scan of target in the file and its cached parts
+        (None when it has to be parsed)
+        """
+        stat = os.stat(xp)
+        row = self._db.execute(
+            "SELECT key FROM files WHERE path = ? AND size = ? AND mtime_ns = ?",
+            (xp, stat.st_size, stat.st_mtime_ns),
+        ).fetchone()
+        content = row[0] if row is not None else self._key(xp, stat)
+        # every target of a file has its own scan
+        tag = hashlib.blake2b(repr(tuple(target)).encode(), digest_size=8).hexdigest()
+        key = f"{content}|{tag}"
+
+        row = self._db.execute(
+            "SELECT data FROM scans WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return key, None
+        self._db.execute(
+            "UPDATE scans SET last_used = ? WHERE key = ?", (time.time(), key)
+        )
+        self._remember(xp, stat, key)
+        return key, pickle.loads(zlib.decompress(row[0]))
+
+    def _remember(self, xp: str, stat: os.stat_result, key: str) -> None:
+        self._db.execute(
+            "INSERT OR REPLACE INTO files (path, size, mtime_ns, key) VALUES (?, ?, ?, ?)",
+            (xp, stat.st_size, stat.st_mtime_ns, key.rpartition("|")[0]),
+        )
+
+    def store(self, key: str, scan: list, paths: list[str]) -> None:
+        """
+        Save the scan (the parts returned by _scan_file) shared by the files of paths
+        under key
+        """
+        data = zlib.compress(pickle.dumps(scan, protocol=pickle.HIGHEST_PROTOCOL), 1)
+        self._db.execute(
+            "INSERT OR REPLACE INTO scans (key, data, nbytes, last_used) VALUES (?, ?, ?, ?)",
+            (key, data, len(data), time.time()),
+        )
+        for xp in paths:
+            self._remember(xp, os.stat(xp), key)
+
+    def commit(self) -> None:
+        """
+        Evict the least recently used scans over the size budget and write everything to disk
+        """
+        total = self._db.execute(
+            "SELECT COALESCE(SUM(nbytes), 0) FROM scans"
+        ).fetchone()[0]
+        if total > self.max_bytes:
+            evicted = []
+            for key, nbytes in self._db.execute(
+                "SELECT key, nbytes FROM scans ORDER BY last_used"
+            ).fetchall():
+                if total <= self.max_bytes:
+                    break
+                evicted.append((key,))
+                total -= nbytes
+            self._db.executemany("DELETE FROM scans WHERE key = ?", evicted)
+            self._db.execute(
+                f"DELETE FROM files WHERE key NOT IN (SELECT {_SCAN_CONTENT} FROM scans)"
+            )
+        self._db.commit()
+
+    def invalidate(self, paths: list[str] | None = None) -> None:
+        """
+        Forget the given files (every file and scan when paths is None)
+        """
+        if paths is None:
+            self._db.execute("DELETE FROM files")
+            self._db.execute("DELETE FROM scans")
+        else:
+            self._db.executemany(
+                "DELETE FROM files WHERE path = ?", [(str(xp),) for xp in paths]
+            )
+            self._db.execute(
+                f"DELETE FROM scans WHERE {_SCAN_CONTENT} NOT IN (SELECT key FROM files)"
+            )
+        self._db.commit()
+
+    def close(self) -> None:
+        self.commit()
+        self._db.close()
+
+
+def _registry_key(value):
+    """
+    Return the SQLite value a number is stored as in a NumberRegistry: text, integers and
+    floats as they are, anything else (dates, composite keys) pickled
+    """
+    if isinstance(value, (str, float)) or (
+        isinstance(value, int) and -(2**63) <= value < 2**63
+    ):
+        return value
+    # a fixed protocol so that the same value is stored the same way by every python
+    return pickle.dumps(value, protocol=4)
+
+
+class NumberRegistry:
     """
+    Persistent registry (a SQLite file) of the numbers of every processed file and the day
+    it was ingested, to find the numbers of a run already seen in the files of earlier
+    runs without loading them again.
+
+    The numbers are stored once per file in a table keyed by (value, file), looked up in
+    bulk by joining them to a temporary table of the wanted values. Ingesting a file again
+    replaces its numbers and its day, prune forgets the files ingested before a day.
+
+    Attributes:
+        - path: str -> the SQLite database file
+
+    Methods:
+        - __init__(self, path: str) -> None
+        - ingest(self, index: DuplicateIndex, paths: list[str] | None, day: str | None) -> int
+        - seen(self, values, exclude: list[str]) -> dict[value, list[tuple[str, str]]]
+        - record(self, index: DuplicateIndex, paths: list[str], day: str | None) -> dict
+        - prune(self, before: str) -> int
+        - close(self) -> None
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = str(path)
+        self._db = sqlite3.connect(self.path)
+        self._db.executescript(
+            """
+            PRAGMA journal_mode = WAL;
+            PRAGMA synchronous = NORMAL;
+            CREATE TABLE IF NOT EXISTS files (
+                id INTEGER PRIMARY KEY,
+                path TEXT UNIQUE NOT NULL,
+                day TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS numbers (
+                value NOT NULL,
+                file_id INTEGER NOT NULL,
+                PRIMARY KEY (value, file_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS numbers_file_id ON numbers (file_id);
+            CREATE TEMP TABLE wanted (value PRIMARY KEY) WITHOUT ROWID;
+            CREATE TEMP TABLE excluded (path TEXT PRIMARY KEY) WITHOUT ROWID;
+            """
+        )
+
+    def __enter__(self) -> "NumberRegistry":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM files").fetchone()[0]
 
-    # typical Iran's cellphone number prefix
-    prefix = random.choice(["12", "35", "36", "02", "18"])
-    num = [str(i) for i in range(7)]
-    random.shuffle(num)
-    num = "".join(num)
-    num = f"09{prefix}{num}"
-    return num
+    def ingest(
+        self,
+        index: DuplicateIndex,
+        paths: list[str] | None = None,
+        day: str | None = None,
+    ) -> int:
+        """
+        Store the numbers of the files of an index, in a single transaction
 
+        Input:
+            - index: DuplicateIndex -> as returned by get_files_values, without
+            memory_budget (ValueError otherwise, the spilled index only keeps the
+            duplicates)
+            - paths: list[str] | None -> only ingest these files of the index (all of them
+            when None)
+            - day: str | None -> ISO date of the files (today when None)
 
-def generate_days(days: int, numbers: int) -> None:
+        Returns:
+            - int -> number of (value, file) pairs stored
+        """
+        if index.duplicates_only:
+            raise ValueError(
+                "the registry needs every value, not only the duplicates of a"
+                " memory_budget scan"
+            )
+        day = day or time.strftime("%Y-%m-%d")
+        wanted = None if paths is None else set(map(str, paths))
+        ids = {}
+        with self._db:
+            for file_id, xp in enumerate(index.paths):
+                if wanted is not None and xp not in wanted:
+                    continue
+                self._db.execute(
+                    "INSERT INTO files (path, day) VALUES (?, ?)"
+                    " ON CONFLICT (path) DO UPDATE SET day = excluded.day",
+                    (xp, day),
+                )
+                ids[file_id] = self._db.execute(
+                    "SELECT id FROM files WHERE path = ?", (xp,)
+                ).fetchone()[0]
+            self._db.executemany(
+                "DELETE FROM numbers WHERE file_id = ?", [(i,) for i in ids.values()]
+            )
+            sources = index.sources
+            pairs = (
+                (_registry_key(value), ids[file_id])
+                for value in index
+                for file_id in {sources[i][0] for i, _ in index.locations(value)}
+                if file_id in ids
+            )
+            before = self._db.total_changes
+            self._db.executemany(
+                "INSERT OR IGNORE INTO numbers (value, file_id) VALUES (?, ?)", pairs
+            )
+            return self._db.total_changes - before
+
+    def seen(self, values, exclude: list[str] = ()) -> dict:
+        """
+        Look up values in bulk
+
+        Input:
+            - values: iterable -> the values to look up
+            - exclude: list[str] -> ignore the numbers of these files (the files of the
+            current run, ingested by a previous run of the same files)
+
+        Returns:
+            - dict -> for each value found, its (path, day) files sorted by day then path
+        """
+        keys = {}
+        for value in values:
+            keys.setdefault(_registry_key(value), value)
+        with self._db:
+            self._db.executemany(
+                "INSERT INTO wanted (value) VALUES (?)", ((k,) for k in keys)
+            )
+            self._db.executemany(
+                "INSERT OR IGNORE INTO excluded (path) VALUES (?)",
+                ((str(xp),) for xp in exclude),
+            )
+            found = {}
+            for key, xp, day in self._db.execute(
+                """
+                SELECT w.value, f.path, f.day FROM wanted AS w
+                JOIN numbers AS n ON n.value = w.value
+                JOIN files AS f ON f.id = n.file_id
+                WHERE f.path NOT IN (SELECT path FROM excluded)
+                ORDER BY f.day, f.path
+                """
+            ):
+                found.setdefault(keys[key], []).append((xp, day))
+            self._db.execute("DELETE FROM wanted")
+            self._db.execute("DELETE FROM excluded")
+        return found
+
+    def record(
+        self, index: DuplicateIndex, paths: list[str], day: str | None = None
+    ) -> dict:
+        """
+        Return the values of the files of a run already seen in other files (see seen),
+        then ingest the run
+        """
+        history = self.seen(index, exclude=paths)
+        self.ingest(index, paths, day)
+        return history
+
+    def prune(self, before: str) -> int:
+        """
+        Forget the files ingested before the day (ISO date), returns how many were removed
+        """
+        with self._db:
+            ids = [
+                (file_id,)
+                for (file_id,) in self._db.execute(
+                    "SELECT id FROM files WHERE day < ?", (before,)
+                )
+            ]
+            self._db.executemany("DELETE FROM numbers WHERE file_id = ?", ids)
+            self._db.executemany("DELETE FROM files WHERE id = ?", ids)
+        return len(ids)
+
+    def close(self) -> None:
+        self._db.close()
+
+
+def get_files_values(
+    files: set,
+    read_only: bool = True,
+    jobs: int | None = 1,
+    cache: ScanCache | None = None,
+    on_progress: Callable[[ProgressEvent], None] | None = None,
+    cancel: threading.Event | None = None,
+    engine: str = "openpyxl",
+    backend: str = "dict",
+    memory_budget: int | None = None,
+    spill_dir: str | None = None,
+    target: ScanTarget = DEFAULT_TARGET,
+    metrics: RunMetrics | None = None,
+    workbooks: WorkbookCache | None = None,
+) -> DuplicateIndex | ColumnarIndex:
     """
-    Generate days[int] with numbers[int] amount of random numbers.
+    Collect values of row A of every files (or of the cells of target) and index them
+    based on their frequency
 
     Input:
-       - days: int
-       - numbers: int
+       - files: set -> set of .xlsx file paths
+       - read_only: bool -> scan the files in streaming (read-only) mode, see read_xlsx_sheets
+       - jobs: int | None -> number of worker processes used to parse the files
+       (None for one per cpu core, 1 to scan in the current process)
+       - cache: ScanCache | None -> take the unchanged files from this cache instead of
+       parsing them, the newly parsed ones are added to it
+       - on_progress: callable | None -> receives a ProgressEvent when a file is started and
+       finished (and every PROGRESS_ROWS rows when scanning in the current process)
+       - cancel: threading.Event | None -> stop the scan with Cancelled once it is set
+       - engine: str -> "openpyxl" or "xml" to read the xlsx packages directly (much faster,
+       the workbooks it cannot handle are still read with openpyxl)
+       - backend: str -> "dict" for a DuplicateIndex or "numpy" for a ColumnarIndex
+       (vectorized, for tens of millions of values)
+       - memory_budget: int | None -> bytes of values kept in memory, beyond that they are
+       spilled to disk and deduplicated by partitions (see SpillingIndex). the returned
+       index then only holds the duplicated values. dict backend only
+       - spill_dir: str | None -> folder of the temporary runs (default: the system one)
+       - target: ScanTarget -> sheets, columns and keys scanned in every file
+       - metrics: RunMetrics | None -> record the timings of the "scan" phase in it
+       - workbooks: WorkbookCache | None -> keep the parsed xlsx workbooks in this cache
+       for edit_files_values (scanned in this process only, with jobs=1)
 
     Returns:
-       - None -> saves the output in .xlsx files in "months" folder (create if not found) in the current directory
+       - DuplicateIndex | ColumnarIndex -> the numbers (empty cells are skipped) with their
+       frequency and the files, sheets, columns and rows that they are contained in
+    """
+
+    from rich.progress import track
+
+    if memory_budget is not None:
+        if backend != "dict":
+            raise ValueError("memory_budget is only supported by the dict backend")
+        index = SpillingIndex(memory_budget, spill_dir)
+    elif backend == "dict":
+        index = DuplicateIndex()
+    elif backend == "numpy":
+        index = ColumnarIndex()
+    else:
+        raise ValueError(f"unknown backend: {backend}")
+    # a ColumnarIndex groups the values with a sort, the scans leave them ungrouped
+    raw = isinstance(index, ColumnarIndex)
+    files = [str(xp) for xp in files]
+    # ids are given in the order of files whatever order the workers finish in
+    for xp in files:
+        index.intern(xp)
 
+    done = 0
+
+    def notify(kind: str, xp: str, rows: int = 0) -> None:
+        event = ProgressEvent(kind, "scan", xp, done, len(files), rows)
+        if metrics is not None:
+            metrics.observe(event)
+        if on_progress is not None:
+            on_progress(event)
+
+    def add(xp: str, parts: list, timings: dict | None = None) -> None:
+        nonlocal done
+        start = time.perf_counter()
+        file_id = index.intern(xp)
+        for slot, *part in parts:
+            index.add_file(index.intern_source(file_id, slot), *part)
+        if metrics is not None:
+            timings = dict(timings or {}, index=time.perf_counter() - start)
+            metrics.add_timings("scan", timings, xp)
+        done += 1
+        notify("file_finished", xp, sum(len(part[3]) for part in parts))
+
+    with metrics.phase("scan") if metrics is not None else nullcontext():
+        # files to parse grouped by cache key, identical files are parsed once for the group
+        pending: dict[str, list[str]] = {}
+        for xp in files:
+            if cache is None:
+                pending[xp] = [xp]
+                continue
+            lookup = time.perf_counter()
+            with _failing_file(xp):
+                key, parts = cache.lookup(xp, target)
+            if metrics is not None:
+                metrics.add_timings("scan", {"cache": time.perf_counter() - lookup}, xp)
+            if parts is None:
+                pending.setdefault(key, []).append(xp)
+            else:
+                add(xp, parts)
+
+        def collect(key: str, parts: list, timings: dict) -> None:
+            # the identical files of the group were parsed once, by the first one
+            for i, xp in enumerate(pending[key]):
+                add(xp, parts, None if i else timings)
+            if cache is not None:
+                cache.store(key, parts, pending[key])
+
+        try:
+            jobs = min(jobs or os.cpu_count() or 1, len(pending))
+            if jobs <= 1:
+                for key in track(pending, description="generating values dictionary  "):
+                    if cancel is not None and cancel.is_set():
+                        raise Cancelled()
+                    xp = pending[key][0]
+                    notify("file_started", xp)
+                    with _failing_file(xp):
+                        scan, timings = _measured(
+                            "read",
+                            _scan_file,
+                            xp,
+                            read_only,
+                            on_rows=lambda rows: notify("rows", xp, rows),
+                            cancel=cancel,
+                            engine=engine,
+                            target=target,
+                            workbooks=workbooks,
+                            raw=raw,
+                        )
+                    collect(key, scan[1], timings)
+            else:
+                # biggest files first so that no worker is left parsing a huge file at the end
+                keys = sorted(
+                    pending, key=lambda k: os.path.getsize(pending[k][0]), reverse=True
+                )
+                with ProcessPoolExecutor(max_workers=jobs) as executor:
+                    futures = {}
+                    for key in keys:
+                        xp = pending[key][0]
+                        future = executor.submit(
+                            _measured,
+                            "read",
+                            _scan_file,
+                            xp,
+                            read_only,
+                            engine=engine,
+                            target=target,
+                            raw=raw,
+                        )
+                        futures[future] = key
+                        notify("file_started", xp)
+                    for future in track(
+                        as_completed(futures),
+                        total=len(futures),
+                        description="generating values dictionary  ",
+                    ):
+                        if cancel is not None and cancel.is_set():
+                            executor.shutdown(wait=False, cancel_futures=True)
+                            raise Cancelled()
+                        key = futures[future]
+                        with _failing_file(pending[key][0]):
+                            scan, timings = future.result()
+                        collect(key, scan[1], timings)
+        except BaseException:
+            if memory_budget is not None:
+                index.close()
+            raise
+        finally:
+            # what was parsed before a cancellation or an error is still worth keeping
+            if cache is not None:
+                cache.commit()
+
+        start = time.perf_counter()
+        if memory_budget is not None:
+            index = index.build()
+        elif backend == "numpy":
+            index.freeze()
+        if metrics is not None:
+            metrics.add_timings("scan", {"build": time.perf_counter() - start})
+        return index
+
+
+@functools.cache
+def _duplicate_font():
     """
+    Font of the duplicated cells (xl.DUPLICATE_FONT): color = #FF0000, styles are
+    immutable so a single instance is shared by every cell
+    """
+    from openpyxl.styles import Font
 
-    (Path(".") / "months").mkdir(exist_ok=True)
-    for i in track(range(1, days + 1), description="generating test cases         "):
-        wb = Workbook()
-        ws = wb.active
-        for row in ws.iter_rows(min_row=1, max_col=1, max_row=numbers):
-            for cell in row:
-                cell.value = generate_random_num()
-        wb.save(Path(".") / "months" / f"{i}.xlsx")
+    return Font(color="FF0000")
+
+
+class Mark(NamedTuple):
+    """
+    A row to mark in a file, see build_annotation_plan
+
+    Attributes:
+        - sheet: str -> name of the sheet ("" for the active or only sheet)
+        - row: int
+        - columns: tuple[int, ...] -> the duplicated cells of the row
+        - labels_column: int -> first column of the labels, right of the scanned columns
+        - labels: tuple[str, ...] -> origins of the duplicated values
+    """
+
+    sheet: str
+    row: int
+    columns: tuple[int, ...]
+    labels_column: int
+    labels: tuple[str, ...]
 
 
-def get_files_values(files: set) -> dict[str, tuple[(str, list)]]:
+def build_annotation_plan(
+    valuesDict: DuplicateIndex,
+    show_dup_origin: bool,
+    values=None,
+    history: dict | None = None,
+) -> dict[str, list[Mark]]:
     """
-    Collect values of row A of every files and create a dictionary based on their frequency
+    Compute what has to be written in every file, without opening any of them
 
     Input:
-       - files: set -> set of .xlsx file paths
+        - valuesDict: DuplicateIndex (as returned by get_files_values)
+        show_dup_origin: bool
+        values: iterable | None -> only plan the duplicates among these values (all the
+        duplicates of the index when None)
+        history: dict | None -> values seen in earlier runs and their (path, day) files
+        (see NumberRegistry.seen), marked even when they are found once in this run
 
     Returns:
-       - dict[str: tuple] -> a dictionary of str: tuple with numbers (as string) and their
-       (frequency, a list of files that their are contained) tuple
+        - dict[str, list] -> for each file containing duplicates, its marks sorted by
+        (sheet, row), files without duplicates are not in the plan. the labels (file names
+        of the origins, with their sheet when it was selected by name) are computed once per
+        value and shared by all its rows, the duplicates of a row found in several columns
+        share a single mark
     """
 
-    # values dictionary will be populated with tuples of int, list of number and their location, i.e: {(1, [1.xlsx, 2.xlsx])}
-    values = {}
-    for xp in track(files, description="generating values dictionary  "):
-        wb = load_workbook(filename=xp, data_only=True)
-        ws = wb.active
-        col_A = ws["A"]
-        for v in col_A:
-            _v = v.value
-            # if not found return a a tuple of (0, [])
-            num = values.get(_v, (0, []))[0] + 1
-            fn = values.get(_v, (0, []))[1] + [str(xp)]
-            values[_v] = (num, fn)
+    paths = valuesDict.paths
+    sources = valuesDict.sources
+    # the labels are written right of every scanned column of the sheet
+    last_column = {}
+    for file_id, sheet, columns in sources:
+        last = last_column.get((file_id, sheet), 0)
+        last_column[file_id, sheet] = max(last, *columns)
+    names = [
+        Path(paths[file_id]).name + (f"!{sheet}" if sheet else "")
+        for file_id, sheet, _ in sources
+    ]
+
+    history = history or {}
+    if values is None:
+        duplicates = itertools.chain(
+            valuesDict.duplicates(),
+            (
+                (value, valuesDict.count(value), valuesDict.locations(value))
+                for value in history
+                if valuesDict.count(value) == 1
+            ),
+        )
+    else:
+        duplicates = (
+            (value, valuesDict.count(value), valuesDict.locations(value))
+            for value in values
+            if valuesDict.is_duplicate(value)
+            or (value in history and valuesDict.count(value))
+        )
+
+    plan = {}
+    for value, _, locations in duplicates:
+        labels = ()
+        if show_dup_origin:
+            earlier = history.get(value, ())
+            labels = tuple(
+                dict.fromkeys(
+                    [f"{Path(xp).name} ({day})" for xp, day in earlier]
+                    + [names[i] for i, _ in locations]
+                )
+            )
+        for source_id, rows in locations:
+            file_id, sheet, columns = sources[source_id]
+            labels_column = last_column[file_id, sheet] + 1
+            marks = plan.setdefault(paths[file_id], {})
+            for row in rows:
+                mark = marks.get((sheet, row))
+                if mark is None:
+                    marks[sheet, row] = Mark(sheet, row, columns, labels_column, labels)
+                else:
+                    marks[sheet, row] = mark._replace(
+                        columns=tuple(sorted({*mark.columns, *columns})),
+                        labels=tuple(dict.fromkeys(mark.labels + labels)),
+                    )
+
+    return {path: sorted(marks.values()) for path, marks in plan.items()}
+
+
+def apply_annotation_plan(
+    xp: str,
+    marks: list[Mark],
+    destination: str,
+    workbooks: WorkbookCache | None = None,
+    streaming: bool = False,
+    compresslevel: int | None = None,
+    engine: str = "openpyxl",
+) -> None:
+    """
+    Mark the planned rows of a single file and save the result, with the writer
+    registered for its type
+
+    Input:
+        - xp: str -> path of the source file
+        - marks: list -> marks of the file, see build_annotation_plan
+        - destination: str -> where to save the annotated file (xp to edit in place),
+        see output_path
+        - workbooks: WorkbookCache | None -> take the workbook loaded by the scan from
+        this cache instead of parsing the file again (xlsx files)
+        - streaming: bool -> rewrite .xlsx files with stream_xlsx_marks (in constant
+        memory, without their formatting)
+        - compresslevel: int | None -> deflate level of the saved .xlsx files (0 to 9)
+        - engine: str -> "openpyxl" or "xml" to patch the xml of the xlsx packages (see
+        patch_xlsx_marks, the workbooks it cannot handle are still written with openpyxl)
+
+    Returns:
+        - None
+    """
+
+    writer = WRITERS.get(_suffix(xp))
+    if writer is None:
+        raise ValueError(f"unsupported file type: {xp}")
+    if engine not in ("openpyxl", "xml"):
+        raise ValueError(f"unknown engine: {engine}")
+    if writer[0] is not write_xlsx_marks:
+        writer[0](xp, marks, destination)
+        return
+    # taken out of the cache in every case, the file is about to change
+    wb = workbooks.take(xp) if workbooks is not None else None
+    if streaming and _suffix(xp) == ".xlsx":
+        stream_xlsx_marks(xp, marks, destination, compresslevel)
+        return
+    if engine == "xml":
+        try:
+            patch_xlsx_marks(xp, marks, destination, compresslevel)
+            return
+        except (_UnsupportedWorkbook, KeyError, ValueError, UnicodeError):
+            pass
+    write_xlsx_marks(xp, marks, destination, wb=wb, compresslevel=compresslevel)
+
+
+def output_path(destination: str) -> str:
+    """
+    Return where the annotated version of a file meant for destination is saved
+    (a.xls is saved as a.xls.xlsx, the other types keep their name)
+    """
+    writer = WRITERS.get(_suffix(destination))
+    if writer is None or writer[1] is None:
+        return destination
+    return destination + writer[1]
+
+
+def _mark_sheets(wb: Workbook, marks: list[Mark]) -> None:
+    font = _duplicate_font()
+    ws, sheet = None, None
+    for mark in marks:
+        if ws is None or mark.sheet != sheet:
+            sheet = mark.sheet
+            ws = wb[sheet] if sheet else wb.active
+        for column in mark.columns:
+            ws.cell(row=mark.row, column=column).font = font
+        for i, label in enumerate(mark.labels, start=mark.labels_column):
+            ws.cell(row=mark.row, column=i, value=label)
+
+
+@register_writer(".xlsx", ".xlsm", ".xltx", ".xltm")
+def write_xlsx_marks(
+    xp: str,
+    marks: list[Mark],
+    destination: str,
+    wb: Workbook | None = None,
+    compresslevel: int | None = None,
+) -> None:
+    """
+    Color the duplicated cells of the workbook and write their origins to their right
+    (wb is the already loaded workbook of xp, if any, see _save_workbook for compresslevel)
+    """
+    if wb is None:
+        from openpyxl import load_workbook
+
+        with _step("load"):
+            wb = load_workbook(filename=xp, data_only=True)
+    with _step("style"):
+        _mark_sheets(wb, marks)
+    _replace_atomically(destination, lambda tmp: _save_workbook(wb, tmp, compresslevel))
+
+
+def stream_xlsx_marks(
+    xp: str, marks: list[Mark], destination: str, compresslevel: int | None = None
+) -> None:
+    """
+    Copy the values of the sheets of a workbook row by row from openpyxl's read-only
+    reader to a write-only workbook, coloring the duplicated cells and writing their
+    origins to their right on the way. The memory used does not depend on the number of
+    rows, but only the values are copied (like write_xls_marks, the formatting, merged
+    cells and macros are not kept), so it is only used for the annotated copies
+    """
+    from openpyxl import Workbook, load_workbook
+    from openpyxl.cell import WriteOnlyCell
+
+    font = _duplicate_font()
+    by_sheet: dict[str, dict[int, Mark]] = {}
+    for mark in marks:
+        by_sheet.setdefault(mark.sheet, {})[mark.row] = mark
+
+    def write(tmp: str) -> None:
+        with _step("load"):
+            src = load_workbook(filename=xp, read_only=True, data_only=True)
+        try:
+            wb = Workbook(write_only=True)
+            active = src.active
+            for i, ws in enumerate(src.worksheets):
+                out = wb.create_sheet(ws.title)
+                if ws is active:
+                    wb.active = i
+                # the marks of the active sheet are planned under an empty name
+                rows_marks = by_sheet.get(ws.title, {})
+                if ws is active:
+                    rows_marks = {**rows_marks, **by_sheet.get("", {})}
+                for row, values in enumerate(ws.iter_rows(values_only=True), 1):
+                    mark = rows_marks.get(row)
+                    if mark is None:
+                        out.append(values)
+                        continue
+                    cells = list(values)
+                    last = mark.labels_column - 1 + len(mark.labels)
+                    cells += [None] * (max(last, *mark.columns) - len(cells))
+                    for column in mark.columns:
+                        # a single font instance, its style is registered once
+                        cell = WriteOnlyCell(out, value=cells[column - 1])
+                        cell.font = font
+                        cells[column - 1] = cell
+                    # the labels replace the values of their cells, like _mark_sheets
+                    cells[mark.labels_column - 1 : last] = mark.labels
+                    out.append(cells)
+        finally:
+            src.close()
+        _save_workbook(wb, tmp, compresslevel)
+
+    _replace_atomically(destination, write)
+
+
+def _save_workbook(
+    wb: Workbook, destination: str, compresslevel: int | None = None
+) -> None:
+    """
+    Save a workbook like wb.save, with the deflate level of its zip archive (from 0,
+    fastest, to 9, smallest, zlib's default when None)
+    """
+    if compresslevel is None:
+        wb.save(destination)
+        return
+
+    from openpyxl.writer.excel import ExcelWriter
+
+    if wb.write_only and not wb.worksheets:
+        wb.create_sheet()
+    archive = zipfile.ZipFile(
+        destination,
+        "w",
+        zipfile.ZIP_DEFLATED,
+        allowZip64=True,
+        compresslevel=compresslevel,
+    )
+    ExcelWriter(wb, archive).save()
+
+
+# markup of the sheet and styles parts patched by patch_xlsx_marks (the default namespace
+# of the spreadsheetml parts, the prefixed dialects are left to openpyxl)
+_ROW_RE = re.compile(r"<row\b[^>]*?(?:/>|>.*?</row>)", re.S)
+_ROW_OPEN_RE = re.compile(r"<row\b[^>]*>")
+_CELL_RE = re.compile(r"<c\b[^>]*?(?:/>|>.*?</c>)", re.S)
+_DIMENSION_RE = re.compile(r'(<dimension\b[^>]*\bref=")([^"]*)(")')
+_ATTR_RE = r'(?<![\w:-]){}="([^"]*)"'
+_FONT_RE = re.compile(r"<font\b[^>]*?(?:/>|>.*?</font>)", re.S)
+_XF_RE = re.compile(r"<xf\b[^>]*?(?:/>|>.*?</xf>)", re.S)
+_COLOR_RE = re.compile(r"<color\b[^>]*?(?:/>|>.*?</color>)", re.S)
+# the color openpyxl writes for _duplicate_font
+_DUPLICATE_COLOR = '<color rgb="00FF0000"/>'
+# characters of the sheet parts read at once
+_PATCH_CHUNK = 2**20
+
+
+def _attribute(tag: str, name: str) -> str | None:
+    match = re.search(_ATTR_RE.format(name), tag)
+    return match.group(1) if match else None
+
+
+def _set_attribute(tag: str, name: str, value) -> str:
+    """
+    Set (or add) an attribute of the opening tag of an element
+    """
+    pattern = re.compile(_ATTR_RE.format(name))
+    if pattern.search(tag):
+        return pattern.sub(f'{name}="{value}"', tag, count=1)
+    end = len(tag) - 2 if tag.endswith("/>") else tag.index(">")
+    return f'{tag[:end].rstrip()} {name}="{value}"{tag[end:]}'
+
+
+def _patch_section(xml: str, tag: str, item: re.Pattern, extend) -> tuple[str, int]:
+    """
+    Append the items returned by extend(existing items) to the <tag> list of styles.xml
+    and update its count, returns the patched xml and the index of the first new item
+    """
+    match = re.search(rf"<{tag}\b[^>]*?(?:/>|>(.*?)</{tag}>)", xml, re.S)
+    if match is None:
+        raise _UnsupportedWorkbook(f"no {tag} in the styles")
+    existing = item.findall(match.group(1) or "")
+    added = extend(existing)
+    opening = re.match(rf"<{tag}\b[^>]*?/?>", match.group()).group()
+    opening = _set_attribute(
+        opening.replace("/>", ">"), "count", len(existing) + len(added)
+    )
+    section = f"{opening}{''.join(existing + added)}</{tag}>"
+    return xml[: match.start()] + section + xml[match.end() :], len(existing)
+
+
+def _patch_styles(xml: str, bases: list[int]) -> tuple[str, dict[int, int]]:
+    """
+    Add to styles.xml a red copy of the cell formats (cellXfs) of bases, with a red copy
+    of their font, the rest of the formatting (number format, fill, border) is kept
+
+    Returns:
+        - tuple -> patched styles.xml and the index of the red format of every base
+    """
+    xfs = _XF_RE.findall(
+        (re.search(r"<cellXfs\b[^>]*>(.*?)</cellXfs>", xml, re.S) or [None, ""])[1]
+    )
+    if any(base >= len(xfs) for base in bases if base):
+        raise _UnsupportedWorkbook("unknown cell format")
+    # a workbook without formats uses the first font for every cell
+    base_fonts = [int(_attribute(xfs[b], "fontId") or 0) if xfs else 0 for b in bases]
+
+    def red_fonts(fonts: list[str]) -> list[str]:
+        if any(font_id >= len(fonts) for font_id in base_fonts):
+            raise _UnsupportedWorkbook("unknown font")
+        red = []
+        for font_id in dict.fromkeys(base_fonts):
+            font = _COLOR_RE.sub("", fonts[font_id])
+            if font.endswith("/>"):
+                font = f"{font[:-2]}>{_DUPLICATE_COLOR}</font>"
+            else:
+                font = font.replace("</font>", f"{_DUPLICATE_COLOR}</font>")
+            red.append(font)
+        return red
+
+    xml, first_font = _patch_section(xml, "fonts", _FONT_RE, red_fonts)
+    new_font = {f: first_font + i for i, f in enumerate(dict.fromkeys(base_fonts))}
+
+    def red_formats(formats: list[str]) -> list[str]:
+        # an empty cellXfs gets the default format first
+        default = '<xf numFmtId="0" fontId="0" fillId="0" borderId="0"/>'
+        red = [] if formats else [default]
+        formats = formats or [default]
+        for base, font_id in zip(bases, base_fonts):
+            opening = re.match(r"<xf\b[^>]*?/?>", formats[base]).group()
+            xf = _set_attribute(opening, "fontId", new_font[font_id])
+            xf = _set_attribute(xf, "applyFont", 1)
+            red.append(xf + formats[base][len(opening) :])
+        return red
+
+    xml, first_format = _patch_section(xml, "cellXfs", _XF_RE, red_formats)
+    first_format += 0 if xfs else 1
+    return xml, {base: first_format + i for i, base in enumerate(bases)}
+
+
+class _RedFormats(dict):
+    """
+    Index of the red copy of every cell format (s attribute) of the duplicated cells of a
+    workbook, assigned in the order they are first met (see _patch_styles)
+    """
+
+    def __init__(self, first: int) -> None:
+        super().__init__()
+        # an empty cellXfs gets the default format first
+        self.first = first or 1
+
+    def __missing__(self, base: int) -> int:
+        index = self[base] = self.first + len(self)
+        return index
+
+
+def _inline_cell(reference: str, text: str, style: str | None) -> str:
+    space = ' xml:space="preserve"' if text != text.strip() else ""
+    s = f' s="{style}"' if style is not None else ""
+    return (
+        f'<c r="{reference}"{s} t="inlineStr"><is><t{space}>'
+        f"{xml_escape(text)}</t></is></c>"
+    )
+
+
+def _patch_row(xml: str, mark: Mark, styles: dict[int, int]) -> str:
+    """
+    Restyle the duplicated cells of a <row> and write the labels of its mark to its right
+    (inline strings, replacing the values of the cells already there)
+    """
+    from openpyxl.utils import column_index_from_string, get_column_letter
+
+    opening = _ROW_OPEN_RE.match(xml).group()
+    if opening.endswith("/>"):
+        raise _UnsupportedWorkbook("marked row without cells")
+    body = xml[len(opening) : -len("</row>")]
+    cells = {}
+    for cell in _CELL_RE.findall(body):
+        reference = _attribute(cell[: cell.index(">")], "r")
+        if reference is None:
+            raise _UnsupportedWorkbook("cell without reference")
+        cells[column_index_from_string(reference.rstrip("0123456789"))] = cell
+    if _CELL_RE.sub("", body).strip():
+        raise _UnsupportedWorkbook("unexpected row content")
+
+    for column in mark.columns:
+        cell = cells.get(column)
+        if cell is None:
+            raise _UnsupportedWorkbook("marked cell not found")
+        opening_cell = re.match(r"<c\b[^>]*?/?>", cell).group()
+        style = styles[int(_attribute(opening_cell, "s") or 0)]
+        cells[column] = cell.replace(
+            opening_cell, _set_attribute(opening_cell, "s", style), 1
+        )
+    for column, label in enumerate(mark.labels, start=mark.labels_column):
+        existing = cells.get(column)
+        style = _attribute(existing[: existing.index(">")], "s") if existing else None
+        reference = f"{get_column_letter(column)}{mark.row}"
+        cells[column] = _inline_cell(reference, label, style)
+
+    # the spans hint of the row may no longer cover its cells
+    opening = re.sub(r'\sspans="[^"]*"', "", opening)
+    return opening + "".join(cells[c] for c in sorted(cells)) + "</row>"
+
+
+def _patch_dimension(xml: str, last_column: int) -> str:
+    """
+    Widen the <dimension> of a sheet to last_column (the readers rely on it)
+    """
+    from openpyxl.utils import column_index_from_string, get_column_letter
+
+    def widen(match: re.Match) -> str:
+        start, _, end = match.group(2).partition(":")
+        end = end or start
+        letters = end.rstrip("0123456789")
+        if not letters or column_index_from_string(letters) >= last_column:
+            return match.group()
+        ref = f"{start}:{get_column_letter(last_column)}{end[len(letters):]}"
+        return f"{match.group(1)}{ref}{match.group(3)}"
+
+    return _DIMENSION_RE.sub(widen, xml, count=1)
+
+
+def _patch_sheet(
+    source, destination, marks: list[Mark], styles: dict[int, int]
+) -> None:
+    """
+    Stream a sheet part from source to destination (text files), patching the marked
+    rows. Raises _UnsupportedWorkbook if a mark was not applied
+    """
+    by_row = {mark.row: mark for mark in marks}
+    last_column = max(
+        (
+            max(mark.columns)
+            if not mark.labels
+            else mark.labels_column + len(mark.labels) - 1
+        )
+        for mark in marks
+    )
+    applied = 0
+    row_number = 0
+    head = True
+    buffer = ""
+    while True:
+        chunk = source.read(_PATCH_CHUNK)
+        buffer += chunk
+        position = 0
+        for match in _ROW_RE.finditer(buffer):
+            between = buffer[position : match.start()]
+            if head:
+                # the dimension is before the first row
+                between, head = _patch_dimension(between, last_column), False
+            destination.write(between)
+            row = match.group()
+            number = _attribute(_ROW_OPEN_RE.match(row).group(), "r")
+            row_number = int(number) if number is not None else row_number + 1
+            mark = by_row.get(row_number)
+            if mark is not None:
+                row = _patch_row(row, mark, styles)
+                applied += 1
+            destination.write(row)
+            position = match.end()
+        buffer = buffer[position:]
+        if not chunk:
+            break
+    destination.write(buffer)
+    if applied != len(by_row):
+        raise _UnsupportedWorkbook("marked rows not found")
+
+
+def patch_xlsx_marks(
+    xp: str, marks: list[Mark], destination: str, compresslevel: int | None = None
+) -> None:
+    """
+    Mark a workbook by patching its xml parts instead of loading it: the duplicated cells
+    get a red copy of their cell format (added to styles.xml) and the labels are written
+    as inline strings right of them, the marked sheets being streamed row by row. Every
+    other part of the package (the other sheets, macros, pictures and the features
+    openpyxl does not support) is copied unchanged, styles.xml is moved last.
+
+    Raises _UnsupportedWorkbook for the packages it does not handle (prefixed namespaces,
+    cells without references...), see apply_annotation_plan
+    """
+    with _step("load"), zipfile.ZipFile(xp) as src:
+        sheets = _xlsx_sheet_parts(src)
+        parts = {}
+        for mark in marks:
+            part = next(
+                (
+                    target
+                    for name, target, active in sheets
+                    if (name == mark.sheet if mark.sheet else active)
+                ),
+                None,
+            )
+            if part is None:
+                raise _UnsupportedWorkbook(f"sheet not found: {mark.sheet}")
+            parts.setdefault(part, []).append(mark)
+        if "xl/styles.xml" not in src.NameToInfo:
+            raise _UnsupportedWorkbook("no styles part")
+        styles_xml = src.read("xl/styles.xml").decode("utf-8")
+        formats = re.search(r"<cellXfs\b[^>]*>(.*?)</cellXfs>", styles_xml, re.S)
+        # the red formats are numbered after the existing ones as they are met
+        red = _RedFormats(len(_XF_RE.findall(formats.group(1))) if formats else 0)
+
+    def copy_info(info: zipfile.ZipInfo) -> zipfile.ZipInfo:
+        copy = zipfile.ZipInfo(info.filename, info.date_time)
+        copy.compress_type = info.compress_type
+        copy.external_attr = info.external_attr
+        # ZipFile.open only applies the level of the ZipInfo it is given
+        copy._compresslevel = compresslevel
+        return copy
+
+    def write(tmp: str) -> None:
+        # the source is opened here so that it is closed before it can be replaced
+        # (a file cannot be replaced while it is open on windows)
+        with zipfile.ZipFile(xp) as src, zipfile.ZipFile(
+            tmp, "w", zipfile.ZIP_DEFLATED, compresslevel=compresslevel
+        ) as dst:
+            for info in src.infolist():
+                if info.filename == "xl/styles.xml":
+                    continue
+                with src.open(info) as raw, dst.open(copy_info(info), "w") as out:
+                    if info.filename not in parts:
+                        shutil.copyfileobj(raw, out, _PATCH_CHUNK)
+                        continue
+                    # newline="" keeps the line endings of the part as they are
+                    with io.TextIOWrapper(out, encoding="utf-8", newline="") as text:
+                        _patch_sheet(
+                            io.TextIOWrapper(raw, encoding="utf-8", newline=""),
+                            text,
+                            parts[info.filename],
+                            red,
+                        )
+            with _step("style"):
+                styles, indexes = _patch_styles(styles_xml, list(red))
+            if indexes != red:
+                raise _UnsupportedWorkbook("unexpected cell formats")
+            dst.writestr(
+                copy_info(src.getinfo("xl/styles.xml")), styles.encode("utf-8")
+            )
+
+    _replace_atomically(destination, write)
+
+
+@register_writer(".xls", output_suffix=".xlsx")
+def write_xls_marks(xp: str, marks: list[Mark], destination: str) -> None:
+    """
+    Copy the values of the sheets of a .xls workbook to a new .xlsx workbook (xlrd cannot
+    write, the formatting is not kept) and mark it like write_xlsx_marks
+    """
+    from openpyxl import Workbook
+
+    with _step("load"):
+        book, active = _xls_book(xp)
+        wb = Workbook()
+        wb.remove(wb.active)
+        try:
+            for sheet in book.sheets():
+                ws = wb.create_sheet(sheet.name)
+                if sheet is active:
+                    wb.active = ws
+                for r in range(sheet.nrows):
+                    for c, cell in enumerate(sheet.row(r), start=1):
+                        value = _xls_value(book, cell)
+                        if value is not None:
+                            ws.cell(row=r + 1, column=c, value=value)
+        finally:
+            book.release_resources()
+    with _step("style"):
+        _mark_sheets(wb, marks)
+    _replace_atomically(destination, wb.save)
+
+
+@register_writer(".csv", ".tsv", ".tab")
+def write_csv_marks(xp: str, marks: list[Mark], destination: str) -> None:
+    """
+    Stream the records of a delimited text file, the duplicated ones (text has no colors)
+    get a "duplicate" field followed by their origins after their last field. The
+    "duplicate" fields of an earlier run (right of the scanned columns) are dropped first,
+    so that rewriting a file in place does not add them again
+    """
+    encoding, delimiter = _csv_format(xp)
+    labels_of = {mark.row: mark.labels for mark in marks}
+    scanned = min((mark.labels_column - 1 for mark in marks), default=1)
+
+    def unmarked(record: list[str]) -> list[str]:
+        for i in range(scanned, len(record)):
+            if record[i] == "duplicate":
+                return record[:i]
+        return record
+
+    def write(tmp: str) -> None:
+        with open(xp, newline="", encoding=encoding) as src, open(
+            tmp, "w", newline="", encoding=encoding
+        ) as dst:
+            writer = csv.writer(dst, delimiter=delimiter)
+            for row, record in enumerate(csv.reader(src, delimiter=delimiter), 1):
+                record = unmarked(record)
+                labels = labels_of.get(row)
+                if labels is not None:
+                    record.append("duplicate")
+                    record.extend(labels)
+                writer.writerow(record)
+
+    _replace_atomically(destination, write)
+
+
+# the umask can only be read by setting it, done once before any thread is started
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def _replace_atomically(destination: str, write: Callable[[str], None]) -> None:
+    """
+    Call write with a temporary path next to destination then move the result over
+    destination, so that an interrupted run never leaves a half-written file behind
+    """
 
-    return values
+    fd, tmp = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(destination)),
+        prefix=".~",
+        suffix=".tmp",
+    )
+    os.close(fd)
+    try:
+        # mkstemp creates the file readable by its owner only
+        if os.path.exists(destination):
+            shutil.copymode(destination, tmp)
+        else:
+            os.chmod(tmp, 0o666 & ~_UMASK)
+        write(tmp)
+        os.replace(tmp, destination)
+    except BaseException:
+        os.remove(tmp)
+        raise
 
 
 async def edit_files_values(
-    valuesDict: dict,
+    valuesDict: DuplicateIndex,
     files: set,
     make_copy: bool,
     show_dup_origin: bool,
-    test: bool,
+    test: bool = False,
+    jobs: int | None = 1,
+    on_progress: Callable[[ProgressEvent], None] | None = None,
+    cancel: threading.Event | None = None,
+    output_dir: str | Path = "data",
+    values=None,
+    metrics: RunMetrics | None = None,
+    workbooks: WorkbookCache | None = None,
+    registry: NumberRegistry | None = None,
+    history: dict | None = None,
+    streaming: bool = False,
+    compresslevel: int | None = None,
+    engine: str = "openpyxl",
 ) -> None:
     """
     Asynchronously generate new files or rewrite existing with the duplicated numbers marked
     with a different style and their occurrences in the cell to their right
-    (used async so that the progressbar can be update in the gui with every file write)
+    (the workbooks are written off the event loop so that the gui stays responsive)
+
+    Only the files that contain duplicates are loaded and saved, the others are
+    left untouched (or just copied when make_copy is set). With jobs > 1 the workbooks are
+    rewritten in a pool of worker processes, at most two files per worker being queued
+    at any time, and the progress is reported as each file completes. Every file is
+    rewritten by the writer registered for its type (see register_writer), .xls files are
+    saved as .xls.xlsx next to the original. A file whose output would replace another
+    file of the run (or its output) raises FileError before anything is written.
+
+    Every file is written to a temporary file then moved in place, so a cancelled run
+    leaves each output either untouched or completely written.
 
     Input:
-        - valuesDict: dictionary
+        - valuesDict: DuplicateIndex (as returned by get_files_values)
         files: set
         make_copy: bool
         show_dup_origin: bool
-        test: bool
+        test: bool -> unused, file names are taken with pathlib on every platform
+        jobs: int | None -> number of worker processes (None for one per cpu core)
+        on_progress: callable | None -> receives a ProgressEvent when a file is started and finished
+        cancel: threading.Event | None -> stop with Cancelled once it is set (the files
+        being written are finished first)
+        output_dir: str | Path -> folder of the copies when make_copy is set (created if
+        not found, relative to the current directory)
+        values: iterable | None -> only mark the duplicates among these values, they must
+        include every value of files (see FolderWatcher)
+        metrics: RunMetrics | None -> record the timings of the "write" phase in it
+        workbooks: WorkbookCache | None -> reuse the workbooks loaded by get_files_values
+        (written in this process only, with jobs=1)
+        registry: NumberRegistry | None -> also mark the numbers seen in the files of
+        earlier runs (labelled with their file and day), then ingest files in it
+        history: dict | None -> the values seen in earlier runs when they were already
+        looked up (see NumberRegistry.record), instead of registry
+        streaming: bool -> with make_copy, write the copies of the .xlsx files row by row
+        in constant memory (values only, see stream_xlsx_marks)
+        compresslevel: int | None -> deflate level of the saved .xlsx files, from 0
+        (fastest) to 9 (smallest), zlib's default when None
+        engine: str -> "openpyxl" or "xml" to patch the sheets and styles of the .xlsx
+        files in place of loading and saving them with openpyxl (see patch_xlsx_marks)
 
     Returns:
         - None -> saved new or existing files with duplicate numbers marked
     """
 
-    # TODO: use existing Path methods to handle paths
-    path_delimiter = "\\" if test else "/"
-    fp = Path(".") / "data"
-    for xp in track(files, description="writing files                 "):
-        wb = load_workbook(filename=xp, data_only=True)
-        ws = wb.active
-        col_A = ws["A"]
-        for cell in col_A:
-            if valuesDict[cell.value][0] > 1:
-                # font color = #FF0000
-                cell.font = Font(color="FF0000")
-                if show_dup_origin:
-                    for i, x in enumerate(set(valuesDict[cell.value][1])):
-                        ws.cell(
-                            row=cell.row,
-                            column=cell.column + i + 1,
-                            value=x.split(path_delimiter)[-1],
-                        )
+    from rich.progress import Progress, track
+
+    with metrics.phase("write") if metrics is not None else nullcontext():
+        if registry is not None and history is None:
+            start = time.perf_counter()
+            history = registry.record(valuesDict, [str(xp) for xp in files])
+            if metrics is not None:
+                metrics.add_timings("write", {"registry": time.perf_counter() - start})
+        start = time.perf_counter()
+        plan = build_annotation_plan(valuesDict, show_dup_origin, values, history)
+        if metrics is not None:
+            metrics.add_timings("write", {"plan": time.perf_counter() - start})
+        fp = Path(output_dir)
         if make_copy:
-            fp.mkdir(exist_ok=True)
+            fp.mkdir(parents=True, exist_ok=True)
             fp = fp.resolve()
-            xp_file_name = xp.split(path_delimiter)[-1]
-            wb.save(filename=fp / xp_file_name)
-        else:
-            wb.save(xp)
-        await asyncio.sleep(0)
+
+        write = functools.partial(
+            apply_annotation_plan,
+            streaming=streaming and make_copy,
+            compresslevel=compresslevel,
+            engine=engine,
+        )
+        rewrites = []
+        sources = {os.path.abspath(xp) for xp in files}
+        claimed = set()
+        for xp in files:
+            xp = str(xp)
+            destination = str(fp / Path(xp).name) if make_copy else xp
+            if xp in plan or make_copy:
+                written = os.path.abspath(
+                    output_path(destination) if xp in plan else destination
+                )
+                if written in claimed or (
+                    written in sources and written != os.path.abspath(xp)
+                ):
+                    raise FileError(
+                        xp,
+                        FileExistsError(
+                            f"its output {written} would overwrite another file"
+                        ),
+                    )
+                claimed.add(written)
+        for xp in files:
+            xp = str(xp)
+            destination = str(fp / Path(xp).name) if make_copy else xp
+            if xp in plan:
+                rewrites.append((xp, plan[xp], output_path(destination)))
+            elif make_copy:
+                start = time.perf_counter()
+                with _failing_file(xp):
+                    _replace_atomically(
+                        destination, lambda tmp, xp=xp: shutil.copyfile(xp, tmp)
+                    )
+                if metrics is not None:
+                    metrics.add_timings(
+                        "write", {"copy": time.perf_counter() - start}, xp
+                    )
+
+        done = 0
+
+        def notify(kind: str, xp: str) -> None:
+            event = ProgressEvent(kind, "write", xp, done, len(rewrites))
+            if metrics is not None:
+                metrics.observe(event)
+            if on_progress is not None:
+                on_progress(event)
+
+        def finished(xp: str, timings: dict) -> None:
+            nonlocal done
+            if metrics is not None:
+                metrics.add_timings("write", timings, xp)
+            done += 1
+            notify("file_finished", xp)
+
+        def check_cancel() -> None:
+            if cancel is not None and cancel.is_set():
+                raise Cancelled()
+
+        loop = asyncio.get_running_loop()
+        jobs = min(jobs or os.cpu_count() or 1, len(rewrites))
+        if jobs <= 1:
+            for rewrite in track(
+                rewrites, description="writing files                 "
+            ):
+                check_cancel()
+                notify("file_started", rewrite[0])
+                with _failing_file(rewrite[0]):
+                    if metrics is not None and metrics.profile:
+                        # the profiler only sees the thread it runs in
+                        _, timings = _measured("save", write, *rewrite, workbooks)
+                    else:
+                        _, timings = await loop.run_in_executor(
+                            None,
+                            _measured,
+                            "save",
+                            write,
+                            *rewrite,
+                            workbooks,
+                        )
+                finished(rewrite[0], timings)
+            return
+
+        with ProcessPoolExecutor(max_workers=jobs) as executor, Progress() as progress:
+            task = progress.add_task(
+                "writing files                 ", total=len(rewrites)
+            )
+            running = {}
+            try:
+                for i, rewrite in enumerate(rewrites, start=1):
+                    check_cancel()
+                    future = loop.run_in_executor(
+                        executor, _measured, "save", write, *rewrite
+                    )
+                    running[future] = rewrite[0]
+                    notify("file_started", rewrite[0])
+                    # bounded queue: the plans of the waiting files are not all pickled upfront
+                    while running and (len(running) >= 2 * jobs or i == len(rewrites)):
+                        done_futures, _ = await asyncio.wait(
+                            running, return_when=asyncio.FIRST_COMPLETED
+                        )
+                        for future in done_futures:
+                            xp = running.pop(future)
+                            with _failing_file(xp):
+                                timings = future.result()[1]
+                            finished(xp, timings)
+                            progress.advance(task)
+                        check_cancel()
+            except BaseException:
+                # drop the queued files, the ones being written are completed by the workers
+                executor.shutdown(cancel_futures=True)
+                raise
+
+
+REPORT_HEADER = ("value", "count", "file", "sheet", "rows")
+
+
+def _report_rows(valuesDict: DuplicateIndex):
+    """
+    Lazily yield the rows of write_duplicate_report, a row per (value, source) with the
+    values sorted by decreasing count. Only the counts are sorted, the locations are read
+    from the index as the rows are written
+    """
+    counts = sorted(
+        ((count, value) for value, count, _ in valuesDict.duplicates()),
+        key=lambda item: (-item[0], str(item[1])),
+    )
+    paths, sources = valuesDict.paths, valuesDict.sources
+    for count, value in counts:
+        # the columns of a composite key in a single cell
+        shown = " | ".join(map(str, value)) if isinstance(value, tuple) else value
+        for source_id, rows in valuesDict.locations(value):
+            file_id, sheet, _ = sources[source_id]
+            yield shown, count, paths[file_id], sheet, " ".join(map(str, rows))
+
+
+def write_duplicate_report(
+    valuesDict: DuplicateIndex,
+    destination: str | Path,
+    metrics: RunMetrics | None = None,
+) -> int:
+    """
+    Write every duplicate of an index to a single table instead of annotating the files,
+    which are left untouched
+
+    The table (see REPORT_HEADER) has a row for each value and source (file and sheet) it
+    was found in, with the rows of the value in the source, the most frequent values
+    first. It is streamed to a .csv (or .tsv) file or to a write-only .xlsx workbook, so
+    its memory does not depend on its size.
+
+    Input:
+        - valuesDict: DuplicateIndex (as returned by get_files_values)
+        destination: str | Path -> .xlsx, .csv or .tsv file, replaced atomically
+        metrics: RunMetrics | None -> record the timings of the "write" phase in it
+
+    Returns:
+        - int -> number of rows written (without the header)
+    """
+
+    destination = str(destination)
+    suffix = _suffix(destination)
+    if suffix not in (".xlsx", ".csv", ".tsv"):
+        raise ValueError(f"unsupported report type: {destination}")
+    written = 0
+
+    def write(tmp: str) -> None:
+        nonlocal written
+        if suffix == ".xlsx":
+            from openpyxl import Workbook
+
+            wb = Workbook(write_only=True)
+            ws = wb.create_sheet("duplicates")
+            ws.append(REPORT_HEADER)
+            for row in _report_rows(valuesDict):
+                ws.append(row)
+                written += 1
+            wb.save(tmp)
+            return
+        with open(tmp, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f, delimiter="," if suffix == ".csv" else "\t")
+            writer.writerow(REPORT_HEADER)
+            for row in _report_rows(valuesDict):
+                writer.writerow(row)
+                written += 1
+
+    with metrics.phase("write") if metrics is not None else nullcontext():
+        start = time.perf_counter()
+        _replace_atomically(destination, write)
+        if metrics is not None:
+            metrics.add_timings(
+                "write", {"report": time.perf_counter() - start}, destination
+            )
+    return written
+
+
+class WatchUpdate(NamedTuple):
+    """
+    What a FolderWatcher.poll changed
+
+    Attributes:
+        - scanned: list[str] -> new or modified files ingested
+        - removed: list[str] -> files that disappeared from the folder
+        - new_duplicates: list -> values that became duplicates
+        - written: list[str] -> files (re)annotated to the output folder
+        - errors: list[FileError] -> files that could not be read or written, retried
+        on the next poll
+    """
+
+    scanned: list[str]
+    removed: list[str]
+    new_duplicates: list
+    written: list[str]
+    errors: list[FileError]
+
+
+class FolderWatcher:
+    """
+    Keep the annotated copies of the files of a folder up to date as files are added,
+    modified or removed, without rescanning or rewriting the unchanged ones.
+
+    The duplicate index of the folder is kept in memory along with the values of every
+    file. Each poll only scans the new and modified files (through the scan cache when one
+    is given, which also makes a restarted watcher start without parsing the folder again),
+    swaps their occurrences in the index and rewrites the copies of the files holding a
+    value whose duplicate status (or origins, with show_dup_origin) changed.
+
+    The sources are never modified: the annotations go to output_dir, which must be another
+    folder (rewriting an annotated file would not clear its stale marks). Files modified in
+    the last settle seconds are left for a later poll, so that files still being copied
+    into the folder are not read half-written. The files that cannot be read or written
+    are skipped and retried on the next poll, the copies waiting to be rewritten stay
+    pending until they are written (a cancelled poll leaves them for the next one).
+
+    Attributes:
+        - folder: Path
+        - output_dir: Path
+        - index: DuplicateIndex -> the occurrences of the current files of the folder
+
+    Methods:
+        - __init__(self, folder, output_dir, show_dup_origin, ...) -> None
+        - poll(self, cancel: threading.Event | None) -> WatchUpdate (coroutine)
+        - run(self, interval: float, cancel, on_update) -> None (coroutine)
+    """
+
+    def __init__(
+        self,
+        folder: str | Path,
+        output_dir: str | Path = "data",
+        show_dup_origin: bool = False,
+        target: ScanTarget = DEFAULT_TARGET,
+        engine: str = "xml",
+        jobs: int | None = 1,
+        cache: ScanCache | None = None,
+        on_progress: Callable[[ProgressEvent], None] | None = None,
+        settle: float = 1.0,
+    ) -> None:
+        self.folder = Path(folder).resolve()
+        self.output_dir = Path(output_dir).resolve()
+        if self.output_dir == self.folder:
+            raise ValueError("the output folder must differ from the watched folder")
+        self.show_dup_origin = show_dup_origin
+        self.target = target
+        self.engine = engine
+        self.jobs = jobs
+        self.cache = cache
+        self.on_progress = on_progress
+        self.settle = settle
+        self.index = DuplicateIndex()
+        # (size, mtime) and values of the ingested files
+        self._stats: dict[str, tuple[int, int]] = {}
+        self._values: dict[str, set] = {}
+        # files whose copies are out of date
+        self._pending: set[str] = set()
+
+    def _listing(self) -> dict[str, os.stat_result]:
+        listing = {}
+        for path in sorted(self.folder.iterdir()):
+            # excel lock files and the temporary files of _replace_atomically
+            if path.name.startswith(("~$", ".~")) or _suffix(path.name) not in READERS:
+                continue
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            listing[str(path)] = stat
+        return listing
+
+    def _state(self, value) -> tuple:
+        if not self.index.is_duplicate(value):
+            return ()
+        if not self.show_dup_origin:
+            return (True,)
+        # the labels name the sheets, not only the files, holding the value
+        return tuple(
+            sorted({self.index.sources[i] for i, _ in self.index.locations(value)})
+        )
+
+    async def poll(self, cancel: threading.Event | None = None) -> WatchUpdate:
+        """
+        Ingest the changes of the folder since the last poll and rewrite the copies they
+        affect (the first poll scans and annotates the whole folder)
+        """
+        listing = self._listing()
+        now = time.time()
+        changed = [
+            xp
+            for xp, stat in listing.items()
+            if self._stats.get(xp) != (stat.st_size, stat.st_mtime_ns)
+            and now - stat.st_mtime >= self.settle
+        ]
+        removed = [xp for xp in self._stats if xp not in listing]
+        if not changed and not removed and not self._pending:
+            return WatchUpdate([], [], [], [], [])
+
+        # the unreadable files keep their previous state until they can be read
+        errors = []
+        while True:
+            try:
+                scanned = get_files_values(
+                    changed,
+                    jobs=self.jobs,
+                    cache=self.cache,
+                    on_progress=self.on_progress,
+                    cancel=cancel,
+                    engine=self.engine,
+                    target=self.target,
+                )
+                break
+            except FileError as e:
+                changed.remove(e.path)
+                errors.append(e)
+        values = {xp: set() for xp in changed}
+        for value in scanned:
+            for file_id in {scanned.sources[i][0] for i, _ in scanned.locations(value)}:
+                values[scanned.paths[file_id]].add(value)
+
+        affected = set().union(*values.values())
+        for xp in changed + removed:
+            affected |= self._values.get(xp, set())
+        before = {
+            value: (self._state(value), self.index.origins(value)) for value in affected
+        }
+
+        for xp in changed + removed:
+            if xp in self._values:
+                self.index.remove_file(self.index.intern(xp), self._values.pop(xp))
+                del self._stats[xp]
+        self.index.merge(scanned)
+        for xp in changed:
+            self._values[xp] = values[xp]
+            self._stats[xp] = (listing[xp].st_size, listing[xp].st_mtime_ns)
+
+        # the marks of a value change in the files holding it before and after the change
+        self._pending.update(changed)
+        new_duplicates = []
+        for value, (state, origins) in before.items():
+            after = self._state(value)
+            if after != state:
+                self._pending.update(origins)
+                self._pending.update(self.index.origins(value))
+                if not state:
+                    new_duplicates.append(value)
+        self._pending.intersection_update(self._values)
+
+        for xp in removed:
+            destination = self.output_dir / Path(xp).name
+            for copy in {destination, Path(output_path(str(destination)))}:
+                copy.unlink(missing_ok=True)
+
+        written = []
+
+        def on_progress(event: ProgressEvent) -> None:
+            if event.phase == "write" and event.kind == "file_finished":
+                self._pending.discard(event.path)
+                written.append(event.path)
+            if self.on_progress is not None:
+                self.on_progress(event)
+
+        rewrite = sorted(self._pending)
+        while rewrite:
+            try:
+                await edit_files_values(
+                    valuesDict=self.index,
+                    files=rewrite,
+                    make_copy=True,
+                    show_dup_origin=self.show_dup_origin,
+                    jobs=self.jobs,
+                    on_progress=on_progress,
+                    cancel=cancel,
+                    output_dir=self.output_dir,
+                    values=set().union(*(self._values[xp] for xp in rewrite)),
+                    engine=self.engine,
+                )
+            except FileError as e:
+                errors.append(e)
+                rewrite = [xp for xp in rewrite if xp in self._pending and xp != e.path]
+                continue
+            # the files without duplicates are copied without progress events
+            written.extend(xp for xp in rewrite if xp in self._pending)
+            self._pending.difference_update(rewrite)
+            break
+        return WatchUpdate(changed, removed, new_duplicates, sorted(written), errors)
+
+    async def run(
+        self,
+        interval: float = 2.0,
+        cancel: threading.Event | None = None,
+        on_update: Callable[[WatchUpdate], None] | None = None,
+    ) -> None:
+        """
+        Poll the folder every interval seconds until cancel is set, on_update receives
+        every poll that changed something
+        """
+        while cancel is None or not cancel.is_set():
+            update = await self.poll(cancel)
+            if on_update is not None and any(
+                (update.scanned, update.removed, update.written, update.errors)
+            ):
+                on_update(update)
+            if cancel is None:
+                await asyncio.sleep(interval)
+            else:
+                await asyncio.to_thread(cancel.wait, interval)
 
 
 # ----------------- test ----------------------
@@ -133,9 +3803,14 @@ async def test() -> None:
     xl_files = fp.glob("*.xlsx")
     test_files = set([x.resolve().__str__() for x in xl_files])
 
-    _v = get_files_values(test_files)
+    _v = get_files_values(test_files, jobs=None)
     await edit_files_values(
-        valuesDict=_v, files=test_files, make_copy=True, show_dup_origin=True, test=True
+        valuesDict=_v,
+        files=test_files,
+        make_copy=True,
+        show_dup_origin=True,
+        test=True,
+        jobs=None,
     )
 
 